@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+"""
+Asset build step: transcodes the videos and screen images in ASSETS_DIR to the
+display's native resolution and a decoder-safe H.264 profile.
+
+Outputs live in ASSET_CACHE_DIR and are named after the SHA-256 of the source
+content plus the build parameters, so only changed assets are transcoded again.
+MediaManager calls resolve() and transparently plays/shows the transcoded copy
+when one exists, falling back to the original file otherwise. The run scripts
+start the build in the background, so the kiosk comes up on the originals and
+picks up each copy once the build has written it to the manifest. Only one
+build runs at a time.
+
+MERGE_VIDEO_PATH is rendered once as the branded intro (720x1280, white bars,
+logo.png) with the same encoder settings as the visitor recordings, so
+merge_branded() can prepend it with a stream copy instead of a re-encode.
+
+Usage:
+    python asset_pipeline.py                         # Build for the detected display
+    python asset_pipeline.py --resolution 1280x720   # Build for a given resolution
+"""
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+import logging
+import argparse
+import threading
+import contextlib
+import subprocess
+
+from config import (ASSETS_DIR, ASSET_CACHE_DIR, MERGE_VIDEO_PATH,
+                    STANDBY_IMAGE_PATH, CHRISTMAS_BG_PATH)
+from display import detect_display_resolution
+from encoder_tuner import load_encoder_profile, encoder_args
+
+# Bump when the encoding parameters below change, so every asset is rebuilt
+PIPELINE_VERSION = 2
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi")
+# Full-screen images. Other images (logo.png) are only used as overlays.
+SCREEN_IMAGE_PATHS = [STANDBY_IMAGE_PATH, CHRISTMAS_BG_PATH]
+# Rendered as the branded intro instead of a display-sized copy
+BRANDED_SOURCE_PATHS = [MERGE_VIDEO_PATH]
+LOGO_PATH = os.path.join(ASSETS_DIR, "logo.png")
+
+# Visitor recording format (MediaManager.record_user): the branded intro must match
+# it stream for stream, or the concat demuxer cannot copy both into one file
+RECORDING_SIZE = (720, 1280)
+RECORDING_FPS = 30
+RECORDING_AUDIO = ['-c:a', 'aac', '-b:a', '128k', '-ac', '1', '-ar', '48000']
+# Branded layout: intro squared in the middle, logo centered in the bottom bar
+BRANDED_VIDEO_SIZE = 720
+BRANDED_BAR_HEIGHT = (RECORDING_SIZE[1] - BRANDED_VIDEO_SIZE) // 2
+BRANDED_LOGO_HEIGHT = 280
+
+MANIFEST_NAME = "manifest.json"
+BUILD_LOCK_NAME = ".build.lock"
+# Held while the branded intro is rendered and while the manifest is rewritten:
+# the kiosk's post-processing and the background build both do these
+BRANDED_LOCK_NAME = ".branded.lock"
+MANIFEST_LOCK_NAME = ".manifest.lock"
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class AssetPipeline:
+    def __init__(self, cache_dir=ASSET_CACHE_DIR, resolution=None):
+        self.cache_dir = cache_dir
+        self._resolution = resolution
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.manifest = None
+        self.manifest_mtime = None
+
+    @property
+    def resolution(self):
+        if self._resolution is None:
+            self._resolution = detect_display_resolution()
+        return self._resolution
+
+    def _load_manifest(self):
+        # Reloaded when another process (the background build) rewrote it
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            mtime = None
+        if self.manifest is None or mtime != self.manifest_mtime:
+            try:
+                with open(self.manifest_path) as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+            self.manifest_mtime = mtime
+        return self.manifest
+
+    @contextlib.contextmanager
+    def _file_lock(self, name):
+        """Exclusive flock on a file of the cache dir, shared by every process and thread."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, name), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_manifest(self):
+        # Read-modify-write under the lock, so entries added by the other process are kept
+        with self._file_lock(MANIFEST_LOCK_NAME):
+            try:
+                with open(self.manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+            manifest.update(self.manifest or {})
+            tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=4)
+            os.replace(tmp_path, self.manifest_path)
+            self.manifest = manifest
+            self.manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    def sources(self):
+        """Source assets handled by the pipeline."""
+        videos = sorted(
+            os.path.join(ASSETS_DIR, name) for name in os.listdir(ASSETS_DIR)
+            if name.lower().endswith(VIDEO_EXTENSIONS)
+            and os.path.join(ASSETS_DIR, name) not in BRANDED_SOURCE_PATHS)
+        images = [p for p in SCREEN_IMAGE_PATHS if os.path.exists(p)]
+        return videos + images
+
+    def _content_hash(self, path, refresh):
+        """SHA-256 of path. Re-hashed only when size/mtime changed (or if refresh)."""
+        stat = os.stat(path)
+        manifest = self._load_manifest()
+        entry = manifest.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return entry["sha256"]
+        if not refresh:
+            return None
+        sha = _sha256(path)
+        manifest[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha}
+        return sha
+
+    def _output_path(self, path, sha):
+        name, ext = os.path.splitext(os.path.basename(path))
+        is_image = path in SCREEN_IMAGE_PATHS
+        size = "{}x{}".format(*self.resolution)
+        out_ext = ".png" if is_image else ".mp4"
+        return os.path.join(self.cache_dir, f"{name}.{sha[:16]}.{size}.v{PIPELINE_VERSION}{out_ext}")
+
+    def resolve(self, path):
+        """
+        Returns the transcoded copy of 'path' for the current display, or 'path'
+        itself if it has not been built (or the source changed since).
+        Only metadata is checked here, the content is hashed by build().
+        """
+        try:
+            with self.lock:
+                sha = self._content_hash(path, refresh=False)
+        except OSError:
+            return path
+        if not sha:
+            return path
+        output = self._output_path(path, sha)
+        return output if os.path.exists(output) else path
+
+    def build(self, paths=None):
+        """Transcodes every source whose output is missing. Returns the outputs in use."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        outputs = {}
+        for path in paths or self.sources():
+            if not os.path.exists(path):
+                continue
+            with self.lock:
+                sha = self._content_hash(path, refresh=True)
+                self._save_manifest()
+            output = self._output_path(path, sha)
+            if not os.path.exists(output):
+                start = time.time()
+                ok = self._transcode_image(path, output) if path in SCREEN_IMAGE_PATHS \
+                    else self._transcode_video(path, output)
+                if not ok:
+                    continue
+                logging.info(f"Built {os.path.basename(output)} in {time.time() - start:.1f}s")
+            outputs[path] = output
+        return outputs
+
+    def prune(self, keep):
+        """
+        Deletes outputs for the current resolution that are no longer referenced
+        (older hashes or pipeline versions) and stale branded intros. Builds for
+        other resolutions are kept for when that display is detected again.
+        """
+        keep = set(keep) | {self.manifest_path}
+        size = ".{}x{}.v".format(*self.resolution)
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if path in keep or not os.path.isfile(path) or ".tmp." in name:
+                continue  # Temporary files belong to a render still in progress
+            if size in name or ".branded-" in name:
+                os.remove(path)
+                logging.info(f"Removed stale asset {name}")
+
+    def try_lock(self):
+        """Takes the build lock. Returns the open lock file, or None if another build holds it."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.cache_dir, BUILD_LOCK_NAME), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _transcode_video(self, path, output):
+        width, height = self.resolution
+        # Fit inside the display, letterboxed, so the player never has to scale
+        video_filter = (f'scale={width}:{height}:force_original_aspect_ratio=decrease,'
+                        f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1')
+        tmp_output = output + ".tmp.mp4"
+        cmd = [
+            'ffmpeg', '-y', '-i', path,
+            '-map', '0:v:0', '-map', '0:a?',
+            '-vf', video_filter,
+            '-c:v', 'libx264', '-profile:v', 'main', '-level', '4.0', '-pix_fmt', 'yuv420p',
+            '-preset', 'veryfast', '-crf', '20',
+            '-c:a', 'aac', '-b:a', '128k',
+            '-movflags', '+faststart',
+            tmp_output
+        ]
+        logging.info(f"Transcoding {os.path.basename(path)}...")
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=1200)
+        except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+            logging.error(f"Transcode failed for {path}: {e}")
+            return False
+        if result.returncode != 0:
+            logging.error(f"Transcode failed for {path}: {result.stderr.decode()[-300:]}")
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            return False
+        os.replace(tmp_output, output)
+        return True
+
+    def _transcode_image(self, path, output):
+        import cv2
+        img = cv2.imread(path)
+        if img is None:
+            logging.error(f"Could not decode image {path}")
+            return False
+        img = cv2.resize(img, self.resolution, interpolation=cv2.INTER_AREA)
+        tmp_output = output + ".tmp.png"
+        if not cv2.imwrite(tmp_output, img):
+            logging.error(f"Could not write {output}")
+            return False
+        os.replace(tmp_output, output)
+        return True
+
+    def _branded_output_path(self, profile, refresh):
+        """Branded intro path for the current merge video, logo and encoder profile."""
+        with self.lock:
+            sha = self._content_hash(MERGE_VIDEO_PATH, refresh)
+            logo_sha = self._content_hash(LOGO_PATH, refresh) if os.path.exists(LOGO_PATH) else None
+            if refresh:
+                self._save_manifest()
+        if not sha or (os.path.exists(LOGO_PATH) and not logo_sha):
+            return None
+        name, _ = os.path.splitext(os.path.basename(MERGE_VIDEO_PATH))
+        logo = logo_sha[:8] if logo_sha else "nologo"
+        encoder = f"{profile['preset']}-crf{profile['crf']}"
+        return os.path.join(self.cache_dir, f"{name}.{sha[:16]}.{logo}.branded-{encoder}.v{PIPELINE_VERSION}.mp4")
+
+    def build_branded_intro(self):
+        """
+        Renders MERGE_VIDEO_PATH in the recording format: scaled to 720x720,
+        padded to 720x1280 with white bars and logo.png centered in the bottom bar.
+        Returns the cached output path, or None if there is no merge video.
+        Renders are serialized across processes and threads by BRANDED_LOCK_NAME.
+        """
+        if not os.path.exists(MERGE_VIDEO_PATH):
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        profile = load_encoder_profile()
+        output = self._branded_output_path(profile, refresh=True)
+        if os.path.exists(output):
+            return output
+        with self._file_lock(BRANDED_LOCK_NAME):
+            # Another process or worker may have rendered it while we waited
+            if os.path.exists(output):
+                return output
+            return self._render_branded_intro(profile, output)
+
+    def _render_branded_intro(self, profile, output):
+
+        width, height = RECORDING_SIZE
+        size = BRANDED_VIDEO_SIZE
+        filter_complex = (f'[0:v]scale={size}:{size}:force_original_aspect_ratio=decrease,'
+                          f'pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:white,setsar=1,fps={RECORDING_FPS}')
+        inputs = ['-i', MERGE_VIDEO_PATH]
+        next_input = 1
+        if os.path.exists(LOGO_PATH):
+            logo_top = height - BRANDED_BAR_HEIGHT
+            filter_complex += (f'[v0];[{next_input}:v]scale={BRANDED_LOGO_HEIGHT}:-1:force_original_aspect_ratio=decrease[logo];'
+                               f'[v0][logo]overlay=(W-w)/2:{logo_top}+({BRANDED_BAR_HEIGHT}-h)/2')
+            inputs += ['-i', LOGO_PATH]
+            next_input += 1
+        filter_complex += '[outv]'
+
+        # The recordings always carry a mono track, so the intro needs one too
+        if any(s["codec_type"] == "audio" for s in probe_streams(MERGE_VIDEO_PATH) or []):
+            audio_map = ['-map', '0:a:0']
+        else:
+            inputs += ['-f', 'lavfi', '-i', 'anullsrc=channel_layout=mono:sample_rate=48000']
+            audio_map = ['-map', f'{next_input}:a', '-shortest']
+
+        tmp_output = f"{output}.{os.getpid()}-{threading.get_ident()}.tmp.mp4"
+        cmd = (['ffmpeg', '-y'] + inputs
+               + ['-filter_complex', filter_complex, '-map', '[outv]'] + audio_map
+               + encoder_args(profile) + ['-pix_fmt', 'yuv420p'] + RECORDING_AUDIO
+               + ['-movflags', '+faststart', tmp_output])
+        logging.info(f"Rendering branded intro ({profile['preset']}, crf {profile['crf']})...")
+        start = time.time()
+        try:
+            result = subprocess.run(cmd, capture_output=True, timeout=600)
+        except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+            logging.error(f"Branded intro render failed: {e}")
+            return None
+        if result.returncode != 0:
+            logging.error(f"Branded intro render failed: {result.stderr.decode()[-300:]}")
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            return None
+        os.replace(tmp_output, output)
+        logging.info(f"Built {os.path.basename(output)} in {time.time() - start:.1f}s")
+        return output
+
+    def merge_branded(self, recording_path, output_path):
+        """
+        Prepends the branded intro to a visitor recording. Uses a concat-demuxer
+        stream copy when both files have the same stream parameters, and a full
+        re-encode otherwise. Returns True on success.
+        """
+        intro = self.build_branded_intro()
+        if intro:
+            intro_streams = _stream_signature(probe_streams(intro) or [])
+            recording_streams = _stream_signature(probe_streams(recording_path) or [])
+            if intro_streams and intro_streams == recording_streams:
+                if _concat_copy([intro, recording_path], output_path):
+                    return True
+            else:
+                logging.warning(f"Recording format differs from the branded intro, re-encoding: "
+                                f"{recording_streams} vs {intro_streams}")
+        return _merge_reencode(recording_path, output_path)
+
+
+def probe_streams(path):
+    """
+    ffprobe stream parameters of 'path'. Empty list if the file cannot be
+    probed, None if ffprobe itself is not available.
+    """
+    cmd = ['ffprobe', '-v', 'error', '-of', 'json', '-show_entries',
+           'stream=codec_type,codec_name,profile,width,height,pix_fmt,sample_rate,channels', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+        return json.loads(result.stdout).get("streams", [])
+    except FileNotFoundError:
+        logging.warning("ffprobe not found, stream checks are skipped")
+        return None
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        logging.warning(f"Could not probe {path}: {e}")
+        return []
+
+
+def _stream_signature(streams):
+    """What the concat demuxer needs to match between segments, one tuple per stream."""
+    keys = ("codec_type", "codec_name", "profile", "width", "height", "pix_fmt", "sample_rate", "channels")
+    return sorted(tuple(str(s.get(k)) for k in keys) for s in streams)
+
+
+def _concat_copy(paths, output_path):
+    """Joins same-format MP4 files without re-encoding."""
+    list_path = output_path + ".concat.txt"
+    with open(list_path, 'w') as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    cmd = ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+           '-map', '0', '-c', 'copy', '-movflags', '+faststart', output_path]
+    start = time.time()
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=60)
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        logging.warning(f"Stream-copy merge failed: {e}")
+        return False
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logging.warning(f"Stream-copy merge failed: {result.stderr.decode()[-200:]}")
+        return False
+    logging.info(f"Stream-copy merge done in {(time.time() - start) * 1000:.0f} ms")
+    return True
+
+
+def _merge_reencode(recording_path, output_path):
+    """Original branding merge: renders the intro and re-encodes the recording after it."""
+    filter_complex = ('[0:v]scale=720:720:force_original_aspect_ratio=decrease,'
+                      'pad=720:1280:(ow-iw)/2:(oh-ih)/2:white,setsar=1[v0];')
+    inputs = ['-i', MERGE_VIDEO_PATH, '-i', recording_path]
+    if os.path.exists(LOGO_PATH):
+        filter_complex += ('[2:v]scale=280:-1:force_original_aspect_ratio=decrease[logo];'
+                           '[v0][logo]overlay=(W-w)/2:1000+(280-h)/2[v0_logo];'
+                           '[v0_logo][0:a][1:v][1:a]concat=n=2:v=1:a=1[outv][outa]')
+        inputs += ['-i', LOGO_PATH]
+    else:
+        filter_complex += '[v0][0:a][1:v][1:a]concat=n=2:v=1:a=1[outv][outa]'
+    cmd = (['ffmpeg', '-y'] + inputs
+           + ['-filter_complex', filter_complex,
+              '-map', '[outv]', '-map', '[outa]',
+              '-c:v', 'libx264', '-preset', 'fast', '-crf', '23',
+              '-c:a', 'aac', '-b:a', '128k',
+              '-movflags', '+faststart',
+              output_path])
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=120)
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        logging.warning(f"Video merge failed: {e}")
+        return False
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logging.warning(f"Video merge failed: {result.stderr.decode()[:200]}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode Magic Tree assets to the display's native format")
+    parser.add_argument("--resolution", help="Target WxH (default: detected display resolution)")
+    parser.add_argument("--no-prune", action="store_true", help="Keep outputs of older asset versions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    resolution = None
+    if args.resolution:
+        width, height = args.resolution.lower().split("x")
+        resolution = (int(width), int(height))
+
+    pipeline = AssetPipeline(resolution=resolution)
+    build_lock = pipeline.try_lock()
+    if build_lock is None:
+        logging.info("Another asset build is running, nothing to do.")
+        raise SystemExit(0)
+    outputs = pipeline.build()
+    branded_intro = pipeline.build_branded_intro()
+    if branded_intro:
+        outputs[MERGE_VIDEO_PATH] = branded_intro
+    if not args.no_prune:
+        pipeline.prune(outputs.values())
+    for source, output in outputs.items():
+        print(f"{os.path.basename(source):<20} -> {os.path.basename(output)}")
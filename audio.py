@@ -1,22 +1,58 @@
+import io
 import os
 import time
 import wave
 import logging
-import threading
-import json
+import subprocess
 import re
+from collections import namedtuple
 
-import pyaudio
 import pygame
 from openai import OpenAI
 
 from config import *
-try:
-    from vosk import Model, KaldiRecognizer
-    VOSK_AVAILABLE = True
-except ImportError:
+from mic_capture import mic
+from keyword_spotter import KeywordSpotter
+from vosk_models import vosk_models, VOSK_AVAILABLE
+if not VOSK_AVAILABLE:
     logging.warning("Vosk not found. Voice recognition will be disabled.")
-    VOSK_AVAILABLE = False
+
+# One recorded chunk, kept in memory. 'data' is the upload payload in 'format';
+# 'wav_bytes' is the size it would have had as WAV.
+AudioChunk = namedtuple("AudioChunk", ["data", "filename", "format", "duration", "wav_bytes", "encode_ms"])
+
+# ffmpeg output arguments and file extension per upload format (WAV needs no encoder)
+CHUNK_ENCODERS = {
+    "flac": (['-c:a', 'flac', '-f', 'flac'], "flac"),
+    "opus": (['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip', '-f', 'ogg'], "ogg"),
+}
+
+
+def encode_chunk(pcm, rate, channels, fmt):
+    """
+    Encodes raw int16 PCM in memory. Returns (payload, extension, format);
+    falls back to WAV when the format is unknown or ffmpeg fails.
+    """
+    if fmt in CHUNK_ENCODERS:
+        output_args, extension = CHUNK_ENCODERS[fmt]
+        cmd = (['ffmpeg', '-v', 'error', '-f', 's16le', '-ar', str(rate), '-ac', str(channels), '-i', 'pipe:0']
+               + output_args + ['pipe:1'])
+        try:
+            result = subprocess.run(cmd, input=pcm, capture_output=True, timeout=10)
+            if result.returncode == 0 and result.stdout:
+                return result.stdout, extension, fmt
+            logging.warning(f"{fmt} encoding failed, sending WAV: {result.stderr.decode()[-200:]}")
+        except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+            logging.warning(f"{fmt} encoding failed, sending WAV: {e}")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buffer.getvalue(), "wav", "wav"
+
 
 # Initialize Pygame Mixer for background music
 try:
@@ -29,10 +65,10 @@ except Exception as e:
 class AudioManager:
     def __init__(self):
         self.chunk = CHUNK_SIZE
-        self.format = pyaudio.paInt16
         self.channels = CHANNELS
         self.rate = SAMPLE_RATE
-        self.p = pyaudio.PyAudio()
+        # The microphone stays open for the whole session; every stage subscribes to it
+        mic.start()
         
         # Initialize OpenAI Client safely
         if not OPENAI_API_KEY or OPENAI_API_KEY == "YOUR_OPENAI_API_KEY":
@@ -49,22 +85,15 @@ class AudioManager:
                 logging.error(f"Failed to initialize OpenAI client: {e}")
                 self.client = None
 
-        # Initialize Vosk Model
-        self.vosk_model = None
-        if VOSK_AVAILABLE:
-            if os.path.exists(VOSK_MODEL_PATH):
-                try:
-                    logging.info(f"Loading Vosk model from {VOSK_MODEL_PATH}...")
-                    self.vosk_model = Model(VOSK_MODEL_PATH)
-                    logging.info("Vosk model loaded successfully.")
-                except Exception as e:
-                    logging.error(f"Failed to load Vosk model: {e}")
-            else:
-                logging.warning(f"Vosk model path valid not found: {VOSK_MODEL_PATH}")
+        # Shared Vosk model, loaded once per process (see vosk_models.py)
+        self.vosk_model = vosk_models.warm_up() if VOSK_AVAILABLE else None
+        # "feliz navidad" (standby) and "confirmar" share one recognizer and stream
+        self.keywords = KeywordSpotter(SPOTTER_KEYWORDS, self.rate)
         
-    def stream_audio_chunks(self, stop_event, chunk_duration=5):
+    def stream_audio_chunks(self, stop_event, chunk_duration=5, upload_format=WHISPER_UPLOAD_FORMAT):
         """
-        Generator that records audio in chunks and yields the file path.
+        Generator that records audio in chunks and yields them as in-memory
+        AudioChunk objects (encoded to 'upload_format': wav, flac or opus).
         Stops when stop_event is set.
         """
         # Determine strict chunk size based on rate and duration
@@ -72,52 +101,46 @@ class AudioManager:
         
         logging.info("Starting audio stream...")
         
-        stream = self.p.open(format=self.format,
-                             channels=self.channels,
-                             rate=self.rate,
-                             input=True,
-                             frames_per_buffer=self.chunk)
+        subscription = mic.subscribe("whisper-chunks")
         try:                     
             while not stop_event.is_set():
                 logging.debug("Recording chunk...")
                 frames = []
+                captured = 0
                 
-                # Record for chunk_duration
-                for _ in range(0, int(self.rate / self.chunk * chunk_duration)):
-                    if stop_event.is_set():
-                        break
-                    try:
-                        data = stream.read(self.chunk, exception_on_overflow=False)
+                # Record for chunk_duration, in short reads to stay responsive to stop_event
+                while captured < frames_per_chunk and not stop_event.is_set():
+                    data = subscription.read(min(self.chunk, frames_per_chunk - captured), timeout=0.5)
+                    if data:
                         frames.append(data)
-                    except Exception as e:
-                        logging.error(f"Error reading audio stream: {e}")
+                        captured += len(data) // mic.sample_width
                         
                 if not frames:
                     continue
                     
-                # Save to temporary file
-                timestamp = int(time.time() * 1000)
-                filename = os.path.join(RECORDINGS_DIR, f"chunk_{timestamp}.wav")
+                # Encode in memory, nothing touches the SD card
+                pcm = b''.join(frames)
+                start = time.perf_counter()
+                payload, extension, fmt = encode_chunk(pcm, self.rate, self.channels, upload_format)
+                encode_ms = (time.perf_counter() - start) * 1000
+                wav_bytes = len(pcm) + 44  # PCM plus the WAV header
+                chunk = AudioChunk(payload, f"chunk_{int(time.time() * 1000)}.{extension}", fmt,
+                                   captured / self.rate, wav_bytes, encode_ms)
+                logging.info(f"Chunk {chunk.duration:.1f}s: {fmt} {len(payload) / 1024:.0f} KB "
+                             f"({len(payload) / wav_bytes:.0%} of WAV) encoded in {encode_ms:.0f} ms")
                 
-                wf = wave.open(filename, 'wb')
-                wf.setnchannels(self.channels)
-                wf.setsampwidth(self.p.get_sample_size(self.format))
-                wf.setframerate(self.rate)
-                wf.writeframes(b''.join(frames))
-                wf.close()
-                
-                yield filename
+                yield chunk
         finally: 
             logging.info("Stopping audio stream...")
-            stream.stop_stream()
-            stream.close()
+            subscription.close()
 
-    def transcribe_with_openai(self, audio_path):
+    def transcribe_with_openai(self, audio):
         """
-        Transcribes the given audio file using OpenAI Whisper API.
+        Transcribes audio using OpenAI Whisper API. 'audio' is an AudioChunk
+        from stream_audio_chunks() or the path of an audio file.
         """
-        if not os.path.exists(audio_path):
-            logging.warning(f"Audio file not found: {audio_path}")
+        if not isinstance(audio, AudioChunk) and not os.path.exists(audio):
+            logging.warning(f"Audio file not found: {audio}")
             return None
 
         if not self.client:
@@ -125,12 +148,22 @@ class AudioManager:
             return None
             
         try:
-            with open(audio_path, "rb") as audio_file:
+            start = time.time()
+            if isinstance(audio, AudioChunk):
                 transcription = self.client.audio.transcriptions.create(
                     model="whisper-1", 
-                    file=audio_file,
+                    file=(audio.filename, audio.data),
                     language="es"
                 )
+                logging.info(f"Transcribed {audio.filename} ({len(audio.data) / 1024:.0f} KB) "
+                             f"in {(time.time() - start) * 1000:.0f} ms")
+            else:
+                with open(audio, "rb") as audio_file:
+                    transcription = self.client.audio.transcriptions.create(
+                        model="whisper-1", 
+                        file=audio_file,
+                        language="es"
+                    )
             return transcription.text
         except Exception as e:
             logging.error(f"OpenAI Transcription error: {e}")
@@ -212,48 +245,9 @@ class AudioManager:
 
         logging.info(f"Listening for keyword '{keyword}' (Local Vosk)...")
         
-        try:
-            rec = KaldiRecognizer(self.vosk_model, self.rate)
-            
-            stream = self.p.open(format=self.format,
-                                 channels=self.channels,
-                                 rate=self.rate,
-                                 input=True,
-                                 frames_per_buffer=4000) # Vosk likes larger chunks usually or small is fine
-            
-            # Use a slightly smaller chunk for reading to be responsive to stop_event
-            read_chunk = 4000
-            
-            while not stop_event.is_set():
-                try:
-                    data = stream.read(read_chunk, exception_on_overflow=False)
-                    if len(data) == 0:
-                        break
-                        
-                    if rec.AcceptWaveform(data):
-                        result = json.loads(rec.Result())
-                        text = result.get("text", "")
-                        if text:
-                            # logging.info(f"Vosk Heard: {text}")
-                            if keyword.lower() in text.lower():
-                                logging.info(f"Keyword '{keyword}' detected!")
-                                stop_event.set()
-                                break
-                    else:
-                        # Partial result (optional to check, but usually we wait for full)
-                        pass
-                        
-                except Exception as e:
-                    logging.error(f"Error in keyword listener: {e}")
-                    break
-            
-            stream.stop_stream()
-            stream.close()
-            logging.info("Keyword listener stopped.")
-            
-        except Exception as e:
-            logging.error(f"Failed to start Vosk stream: {e}")
-                
-    def __del__(self):
-        if self.p:
-            self.p.terminate()
+        # Matches on partial results, so it fires while the phrase is still being said
+        event = self.keywords.wait_for(keyword, stop_event)
+        if event:
+            logging.info(f"Keyword '{keyword}' detected! ({'partial' if event.partial else 'final'} result)")
+            stop_event.set()
+        logging.info("Keyword listener stopped.")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the phone dictation decoder: open vocabulary vs. the digit grammar.
+
+Decodes recorded phone-number dictations with both PhoneInputSystem modes and
+reports the real-time factor (decode time / audio duration), digit accuracy
+(1 - edit distance / digits expected), exact matches and the number of words
+outside the dictation vocabulary.
+
+Samples are 16 kHz mono 16-bit WAV files whose name starts with the number
+spoken, e.g. recorded with:
+    arecord -r 16000 -c 1 -f S16_LE samples/3115551234_maria.wav
+
+Usage:
+    python benchmark_dictation.py samples/ [--modes open grammar]
+"""
+import os
+import re
+import json
+import time
+import wave
+import logging
+import argparse
+
+from vosk import SetLogLevel
+
+from config import VOSK_MODEL_PATH
+from vosk_models import vosk_models
+from phone_manager import PhoneInputSystem, SAMPLE_RATE, CHUNK_SIZE, UNKNOWN_WORD
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def load_samples(directory):
+    samples = []
+    for name in sorted(os.listdir(directory)):
+        match = re.match(r"(\d+)", name)
+        if name.lower().endswith(".wav") and match:
+            samples.append((os.path.join(directory, name), match.group(1)))
+    return samples
+
+
+def decode(path, grammar):
+    """Returns (texts, audio seconds, decode seconds) for one WAV file."""
+    with wave.open(path, 'rb') as wf:
+        if wf.getframerate() != SAMPLE_RATE or wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz mono 16-bit")
+        audio = wf.readframes(wf.getnframes())
+        duration = wf.getnframes() / SAMPLE_RATE
+
+    texts = []
+    with vosk_models.recognizer(SAMPLE_RATE, grammar=grammar) as rec:
+        start = time.perf_counter()
+        step = CHUNK_SIZE * 2
+        for offset in range(0, len(audio), step):
+            if rec.AcceptWaveform(audio[offset:offset + step]):
+                texts.append(json.loads(rec.Result()).get("text", ""))
+        texts.append(json.loads(rec.FinalResult()).get("text", ""))
+        elapsed = time.perf_counter() - start
+    return [t for t in texts if t], duration, elapsed
+
+
+def run(mode, samples, system):
+    grammar = system.grammar if mode == "grammar" else None
+    vocabulary = {w for phrase in system.grammar for w in system.normalize_text(phrase).split()}
+
+    # Recognizer build (grammar compilation in grammar mode), paid once per process
+    start = time.perf_counter()
+    with vosk_models.recognizer(SAMPLE_RATE, grammar=grammar):
+        pass
+    build_ms = (time.perf_counter() - start) * 1000
+
+    audio_s = decode_s = 0.0
+    errors = expected_digits = exact = noise_words = 0
+    for path, expected in samples:
+        texts, duration, elapsed = decode(path, grammar)
+        audio_s += duration
+        decode_s += elapsed
+
+        # Same word handling as live dictation
+        system.phone_number, system.confirmed, system.verifying, system.running = [], False, False, True
+        for text in texts:
+            system.process_text(text)
+            noise_words += sum(1 for w in system.normalize_text(text).split()
+                               if w not in vocabulary and w != UNKNOWN_WORD)
+        got = "".join(system.phone_number)
+        distance = edit_distance(expected, got)
+        errors += distance
+        expected_digits += len(expected)
+        exact += distance == 0
+        logging.info(f"[{mode}] {os.path.basename(path)}: heard {texts} -> {got or '-'}")
+
+    rtf = decode_s / audio_s if audio_s else 0.0
+    accuracy = 1 - errors / expected_digits if expected_digits else 0.0
+    print(f"{mode:<8} {build_ms:9.0f} {rtf:7.3f} {accuracy * 100:8.1f}% {exact:>4}/{len(samples):<4} {noise_words:>6}")
+    return rtf, accuracy
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark open-vocabulary vs grammar phone dictation")
+    parser.add_argument("samples", help="Directory of <digits>*.wav dictations")
+    parser.add_argument("--modes", nargs="+", default=["open", "grammar"], choices=["open", "grammar"])
+    parser.add_argument("--verbose", action="store_true", help="Log what each file decoded to")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    samples = load_samples(args.samples)
+    if not samples:
+        raise SystemExit(f"No <digits>*.wav files in {args.samples}")
+    SetLogLevel(-1)
+    if vosk_models.get(VOSK_MODEL_PATH) is None:
+        raise SystemExit("Vosk model not available")
+
+    system = PhoneInputSystem(mode="open")
+    system.sounds = {}  # Silent: no feedback sounds while benchmarking
+    print(f"{len(samples)} samples, model {os.path.basename(VOSK_MODEL_PATH)}")
+    print(f"{'MODE':<8} {'BUILD ms':>9} {'RTF':>7} {'DIGITS':>9} {'EXACT':>9} {'NOISE':>6}")
+    for mode in args.modes:
+        run(mode, samples, system)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the recording HUD drawn over the live preview.
+
+Compares the per-frame cost of the previous approach (clear the whole frame,
+then cv2.circle + two cv2.putText calls) with the pre-rendered RecordingHud
+sprites blended into their regions of interest.
+
+Usage:
+    python benchmark_hud.py [--frames 600] [--resolution 1280x720]
+"""
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from display import RenderTarget
+from media import RecordingHud
+
+DURATION = 20
+
+
+def draw_legacy(frame, rt, pulse, remaining):
+    frame.fill(0)
+    cv2.circle(frame, (rt.x(100), rt.y(80)), rt.thickness(25 + pulse), (0, 0, 255), -1)
+    cv2.putText(frame, "REC", (rt.x(140), rt.y(95)),
+                cv2.FONT_HERSHEY_SIMPLEX, rt.font(1.2), (255, 255, 255), rt.thickness(3))
+    cv2.putText(frame, str(remaining), (rt.x(1750), rt.y(1030)),
+                cv2.FONT_HERSHEY_SIMPLEX, rt.font(3), (255, 255, 255), rt.thickness(6))
+
+
+def draw_sprites(frame, hud, pulse, remaining):
+    hud.clear(frame)
+    hud.draw(frame, pulse, remaining)
+
+
+def run(label, draw, frames):
+    start = time.perf_counter()
+    for i in range(frames):
+        pulse = int(15 * abs(np.sin(i / 30 * 3)))
+        remaining = DURATION - (i // 30) % (DURATION + 1)
+        draw(pulse, remaining)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / frames
+    print(f"{label:<22} {elapsed_ms:8.3f} ms/frame")
+    return elapsed_ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the recording HUD")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--resolution", default="1920x1080")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    rt = RenderTarget(width, height)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    hud = RecordingHud(rt, max_countdown=DURATION)
+    print(f"Sprite build: {(time.perf_counter() - start) * 1000:.1f} ms (once per screen size)")
+
+    before = run("before (putText)", lambda p, r: draw_legacy(frame, rt, p, r), args.frames)
+    after = run("after (sprites)", lambda p, r: draw_sprites(frame, hud, p, r), args.frames)
+    print(f"Speedup: {before / after:.1f}x at {width}x{height}")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Codec preflight for the Magic Tree videos.
+
+At startup every video in PLAYBACK_VIDEO_PATHS is test-decoded with VLC on a
+background thread and the first decoder configuration that works is cached per
+asset, including a final "skip", until the file changes. Until an asset has a
+result it plays with the first rung of the ladder. When a clip fails at
+runtime, MediaManager steps down the fallback ladder instead of rebooting:
+
+    alternate decoder options -> pre-transcoded safe copy -> skip
+
+Each test decode runs in a child process, so a crashing decoder (the
+h264_v4l2m2m segfaults seen in the stress logs) cannot take the kiosk down.
+
+Usage:
+    python codec_preflight.py            # Run the preflight and print the results
+    python codec_preflight.py --force    # Ignore cached results
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+import threading
+
+from config import PLAYBACK_VIDEO_PATHS, PREFLIGHT_CACHE_PATH, CACHE_DIR
+
+# Decoder configurations, best first. Options are applied per media item.
+# All rungs stay on software avcodec: letting VLC pick a hardware decoder is
+# what brings back the v4l2m2m crashes.
+DECODER_LADDER = [
+    ("avcodec-sw", [":codec=avcodec,all", ":avcodec-hw=none"]),
+    ("avcodec-sw-1thread", [":codec=avcodec,all", ":avcodec-hw=none", ":avcodec-threads=1"]),
+    ("avcodec-sw-fast", [":codec=avcodec,all", ":avcodec-hw=none", ":avcodec-threads=1",
+                         ":avcodec-fast", ":avcodec-skiploopfilter=4"]),
+]
+SAFE_COPY_LABEL = "safe-copy"
+SAFE_COPY_DIR = os.path.join(CACHE_DIR, "safe")
+
+PROBE_SECONDS = 1.5
+PROBE_TIMEOUT = 20
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def probe_decode(path, options, seconds=PROBE_SECONDS):
+    """
+    Test-decodes 'path' with VLC in this process (no video/audio output).
+    Returns True if playback reached 'seconds' of media time without errors.
+    """
+    import vlc
+
+    instance = vlc.Instance('--vout=dummy', '--aout=dummy', '--no-video-title-show', '--quiet')
+    player = instance.media_player_new()
+    media = instance.media_new(path)
+    for option in options:
+        media.add_option(option)
+    player.set_media(media)
+
+    failed = threading.Event()
+    player.event_manager().event_attach(vlc.EventType.MediaPlayerEncounteredError, lambda e: failed.set())
+    player.play()
+
+    ok = False
+    deadline = time.time() + seconds + 5
+    while time.time() < deadline and not failed.is_set():
+        state = player.get_state()
+        if state in (vlc.State.Error, vlc.State.Ended):
+            # A clip shorter than the probe window still counts if it decoded
+            ok = state == vlc.State.Ended and player.get_time() > 0
+            break
+        if player.get_time() >= seconds * 1000:
+            ok = True
+            break
+        time.sleep(0.1)
+
+    player.stop()
+    player.release()
+    instance.release()
+    return ok and not failed.is_set()
+
+
+def probe_in_subprocess(path, options):
+    """Runs probe_decode in a child process. A crash or hang counts as a failure."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--probe", path, "--options", json.dumps(options)]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=PROBE_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        logging.warning(f"Preflight probe timed out: {os.path.basename(path)}")
+        return False
+    if result.returncode not in (0, 1):
+        logging.warning(f"Preflight probe crashed for {os.path.basename(path)} (exit code {result.returncode})")
+    return result.returncode == 0
+
+
+def make_safe_copy(path):
+    """Transcodes 'path' to a conservative H.264 profile. Returns the copy's path or None."""
+    os.makedirs(SAFE_COPY_DIR, exist_ok=True)
+    name, _ = os.path.splitext(os.path.basename(path))
+    safe_path = os.path.join(SAFE_COPY_DIR, f"{name}.safe.mp4")
+    if os.path.exists(safe_path) and os.path.getmtime(safe_path) >= os.path.getmtime(path):
+        return safe_path
+
+    logging.info(f"Creating decoder-safe copy of {os.path.basename(path)}...")
+    cmd = [
+        'ffmpeg', '-y', '-i', path,
+        '-c:v', 'libx264', '-profile:v', 'main', '-level', '4.0', '-pix_fmt', 'yuv420p',
+        '-preset', 'veryfast', '-crf', '23',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-movflags', '+faststart',
+        safe_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=600)
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        logging.error(f"Safe copy failed for {path}: {e}")
+        return None
+    if result.returncode != 0 or not os.path.exists(safe_path):
+        logging.error(f"Safe copy failed for {path}: {result.stderr.decode()[-200:]}")
+        return None
+    return safe_path
+
+
+class CodecPreflight:
+    """
+    Known-good decoder per asset, persisted in PREFLIGHT_CACHE_PATH.
+    Results are invalidated when the asset's size or mtime changes.
+    """
+    def __init__(self, cache_path=PREFLIGHT_CACHE_PATH):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.results = {}
+        self.thread = None
+        try:
+            with open(cache_path) as f:
+                self.results = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.results, f, indent=4)
+        os.replace(tmp_path, self.cache_path)
+
+    def _entry(self, path):
+        """Cached entry for path, or None if missing or stale."""
+        entry = self.results.get(path)
+        if entry and os.path.exists(path) and entry.get("fingerprint") == _fingerprint(path):
+            return entry
+        return None
+
+    def run(self, paths=PLAYBACK_VIDEO_PATHS, force=False):
+        """Test-decodes every existing asset that has no valid cached result."""
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with self.lock:
+                entry = self._entry(path)
+            # "skip" is cached like any other result: the safe copy is only
+            # attempted again when the asset changes or with force
+            if not force and entry:
+                continue
+            start = time.time()
+            entry = self._check(path)
+            with self.lock:
+                self.results[path] = entry
+                self._save()
+            logging.info(f"Preflight {os.path.basename(path)}: {entry['decoder']} "
+                         f"({time.time() - start:.1f}s)")
+
+    def start(self, paths=PLAYBACK_VIDEO_PATHS, force=False):
+        """Runs the preflight on a daemon thread. ladder() serves the defaults until it finishes."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run_safely, args=(list(paths), force),
+                                       name="codec-preflight", daemon=True)
+        self.thread.start()
+
+    def _run_safely(self, paths, force):
+        try:
+            self.run(paths, force)
+        except Exception as e:
+            logging.error(f"Codec preflight failed: {e}")
+
+    def _check(self, path):
+        entry = {"fingerprint": _fingerprint(path), "decoder": None, "failed": [], "safe_copy": None}
+        for label, options in DECODER_LADDER:
+            if probe_in_subprocess(path, options):
+                entry["decoder"] = label
+                return entry
+            entry["failed"].append(label)
+
+        safe_path = make_safe_copy(path)
+        if safe_path and probe_in_subprocess(safe_path, DECODER_LADDER[0][1]):
+            entry["decoder"] = SAFE_COPY_LABEL
+            entry["safe_copy"] = safe_path
+        else:
+            entry["decoder"] = "skip"
+        return entry
+
+    def ladder(self, path):
+        """
+        Remaining playback attempts for 'path', best first, as (label, play_path, options).
+        An empty list means the asset should be skipped.
+        """
+        with self.lock:
+            entry = self._entry(path) or {}
+        failed = set(entry.get("failed", []))
+        attempts = [(label, path, options) for label, options in DECODER_LADDER if label not in failed]
+
+        safe_path = entry.get("safe_copy")
+        if not safe_path:
+            name, _ = os.path.splitext(os.path.basename(path))
+            candidate = os.path.join(SAFE_COPY_DIR, f"{name}.safe.mp4")
+            if os.path.exists(candidate):
+                safe_path = candidate
+        if safe_path and os.path.exists(safe_path) and SAFE_COPY_LABEL not in failed:
+            attempts.append((SAFE_COPY_LABEL, safe_path, DECODER_LADDER[0][1]))
+        return attempts
+
+    def report_failure(self, path, label):
+        """Records a runtime failure so the next playback starts one rung lower."""
+        if not os.path.exists(path):
+            return
+        with self.lock:
+            entry = self._entry(path) or {"fingerprint": _fingerprint(path), "decoder": None,
+                                          "failed": [], "safe_copy": None}
+            if label not in entry["failed"]:
+                entry["failed"].append(label)
+            remaining = [l for l, _ in DECODER_LADDER if l not in entry["failed"]]
+            entry["decoder"] = remaining[0] if remaining else (
+                SAFE_COPY_LABEL if entry.get("safe_copy") and SAFE_COPY_LABEL not in entry["failed"] else "skip")
+            self.results[path] = entry
+            try:
+                self._save()
+            except OSError as e:
+                logging.warning(f"Could not save preflight results: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test-decode the Magic Tree videos")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)
+    parser.add_argument("--options", default="[]", help=argparse.SUPPRESS)
+    parser.add_argument("--force", action="store_true", help="Ignore cached results")
+    args = parser.parse_args()
+
+    if args.probe:
+        # Child process mode used by probe_in_subprocess
+        sys.exit(0 if probe_decode(args.probe, json.loads(args.options)) else 1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    preflight = CodecPreflight()
+    preflight.run(force=args.force)
+    for path in PLAYBACK_VIDEO_PATHS:
+        entry = preflight.results.get(path)
+        status = entry["decoder"] if entry else "missing"
+        print(f"{os.path.basename(path):<20} {status}")
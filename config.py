@@ -38,17 +38,43 @@ BACKGROUND_MUSIC_PATH = os.path.join(ASSETS_DIR, "background_music.mp3")
 STANDBY_VIDEO_PATH = os.path.join(ASSETS_DIR, "standby.mp4")
 STANDBY_IMAGE_PATH = os.path.join(ASSETS_DIR, "standby.png")
 MERGE_VIDEO_PATH = os.path.join(ASSETS_DIR, "merge_video.mp4")  # Video to concatenate before sending
+CACHE_DIR = os.path.join(BASE_DIR, "cache")  # Generated files (preflight results, safe copies...)
+
+# Video Configuration
+# Every video played through VLC. They are test-decoded at startup (codec_preflight.py).
+PLAYBACK_VIDEO_PATHS = [
+    INTRO_VIDEO_PATH, INTRO_VIDEO_2_PATH, ASK_PHONE_VIDEO_PATH,
+    GOODBYE_VIDEO_PATH, STANDBY_VIDEO_PATH,
+]
+PREFLIGHT_CACHE_PATH = os.path.join(CACHE_DIR, "codec_preflight.json")
+ASSET_CACHE_DIR = os.path.join(CACHE_DIR, "assets")  # Display-native transcodes (asset_pipeline.py)
+ENCODER_PROFILE_PATH = os.path.join(CACHE_DIR, "encoder_profile.json")  # Written by encoder_tuner.py
+DISPLAY_RESOLUTION = os.getenv("DISPLAY_RESOLUTION")  # e.g. "1280x720" to skip auto-detection
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")  # Post-processing job journal (postprocess.py)
+POSTPROCESS_WORKERS = int(os.getenv("POSTPROCESS_WORKERS", "1"))
+OUTBOX_DB_PATH = os.path.join(CACHE_DIR, "outbox.db")  # Pending WhatsApp deliveries (outbox.py)
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "1"))  # Uploads in flight to the Node server
+UPLOAD_STATS_PATH = os.path.join(CACHE_DIR, "upload_throughput.json")  # Sizes delivery renditions (delivery.py)
+# Recording preview: "pipe" (FFmpeg rawvideo on stdout), "loopback" (v4l2loopback /dev/video10) or "none"
+PREVIEW_MODE = os.getenv("PREVIEW_MODE", "pipe")
 
 # Audio Configuration
 SAMPLE_RATE = 16000
 CHANNELS = 1
 CHUNK_SIZE = 8000
 VOSK_MODEL_PATH = os.path.join(MODEL_DIR, "vosk-model-small-es-0.42") # Example model name
+# Phone dictation decoding: "grammar" (digits and commands only) or "open" (full vocabulary)
+DICTATION_MODE = os.getenv("DICTATION_MODE", "grammar")
+SPOTTER_KEYWORDS = ["feliz navidad", "confirmar"]  # Watched together by one recognizer (keyword_spotter.py)
+WHISPER_UPLOAD_FORMAT = os.getenv("WHISPER_UPLOAD_FORMAT", "flac")  # Transcription chunks: "wav", "flac" or "opus"
+MIC_DEVICE_INDEX = int(os.getenv("MIC_DEVICE_INDEX")) if os.getenv("MIC_DEVICE_INDEX") else None  # None = default input (mic_capture.py)
 
 # Messaging Configuration
 PHONE_COUNTRY_CODE = "57" # Colombia
+MESSAGING_SERVER_URL = os.getenv("MESSAGING_SERVER_URL", "http://localhost:3000")  # messaging/server.js
 
 # Ensure directories exist
 os.makedirs(ASSETS_DIR, exist_ok=True)
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
 os.makedirs(MODEL_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
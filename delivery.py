@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Delivery renditions for WhatsApp uploads.
+
+The recordings are encoded for quality (CRF 20-25, 128k AAC) and are often
+larger than a phone needs, which makes the upload the slowest part of a send.
+Before sending, render() encodes a copy sized so the upload should take about
+TARGET_UPLOAD_SECONDS at the throughput measured on previous sends. The copy
+uses a single-pass capped CRF with -maxrate/-bufsize.
+
+Renditions are written next to the source as <name>.delivery.mp4 and reused by
+retries. Throughput samples come from the server's job timings (see
+MessagingService) and are persisted in UPLOAD_STATS_PATH.
+
+Usage:
+    python delivery.py                 # Show the measured throughput and current target size
+    python delivery.py <video>         # Render the delivery copy of a video
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import subprocess
+from collections import deque
+
+from config import UPLOAD_STATS_PATH
+from encoder_tuner import load_encoder_profile
+
+TARGET_UPLOAD_SECONDS = 30
+DEFAULT_TARGET_BYTES = 8 * 1024 * 1024     # Until throughput has been measured
+MIN_TARGET_BYTES = 3 * 1024 * 1024
+MAX_TARGET_BYTES = 15 * 1024 * 1024        # Stay under WhatsApp's 16 MB inline video limit
+THROUGHPUT_SAMPLES = 20
+
+AUDIO_BITRATE = 64_000
+RENDITION_CRF = 26
+SIZE_MARGIN = 0.9             # Container overhead and rate control slack
+SMALL_SIZE_BITRATE = 900_000  # Below this video bitrate, 540x960 looks better than starved 720x1280
+
+RENDITION_SUFFIX = ".delivery.mp4"
+
+
+class UploadThroughput:
+    """Recent upload throughput samples (bytes, ms), persisted across restarts."""
+    def __init__(self, path=UPLOAD_STATS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=THROUGHPUT_SAMPLES)
+        try:
+            with open(path) as f:
+                self.samples.extend(tuple(s) for s in json.load(f)["samples"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def record(self, size_bytes, upload_ms):
+        if size_bytes <= 0 or upload_ms <= 0:
+            return
+        with self.lock:
+            self.samples.append((size_bytes, upload_ms))
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump({"samples": list(self.samples)}, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Could not save upload throughput: {e}")
+        logging.info(f"Upload throughput: {size_bytes / upload_ms * 1000 / 1024:.0f} KB/s "
+                     f"(estimate {self.bytes_per_second() / 1024:.0f} KB/s)")
+
+    def bytes_per_second(self):
+        """Conservative estimate: the lower quartile of the recent samples. None without samples."""
+        with self.lock:
+            rates = sorted(size * 1000 / ms for size, ms in self.samples)
+        if not rates:
+            return None
+        return rates[len(rates) // 4]
+
+    def target_bytes(self):
+        """File size that should upload in about TARGET_UPLOAD_SECONDS."""
+        rate = self.bytes_per_second()
+        if rate is None:
+            return DEFAULT_TARGET_BYTES
+        return int(max(MIN_TARGET_BYTES, min(MAX_TARGET_BYTES, rate * TARGET_UPLOAD_SECONDS)))
+
+
+upload_throughput = UploadThroughput()
+
+
+def _duration(path):
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+        return float(json.loads(result.stdout)["format"]["duration"])
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError, KeyError) as e:
+        logging.warning(f"Could not read duration of {path}: {e}")
+        return None
+
+
+def rendition_path(path):
+    return os.path.splitext(path)[0] + RENDITION_SUFFIX
+
+
+def render(path, target_bytes=None):
+    """
+    Returns the path to upload for 'path': its cached delivery copy, a new one
+    encoded to about 'target_bytes', or 'path' itself when it is already small
+    enough or the encode fails.
+    """
+    output = rendition_path(path)
+    if os.path.exists(output) and os.path.getmtime(output) >= os.path.getmtime(path):
+        return output
+
+    target_bytes = target_bytes or upload_throughput.target_bytes()
+    size = os.path.getsize(path)
+    if size <= target_bytes:
+        logging.info(f"{os.path.basename(path)} is {size / 1e6:.1f} MB, under the "
+                     f"{target_bytes / 1e6:.1f} MB target: sending as is")
+        return path
+
+    duration = _duration(path)
+    if not duration:
+        return path
+    video_bitrate = int(target_bytes * 8 * SIZE_MARGIN / duration) - AUDIO_BITRATE
+    if video_bitrate <= 0:
+        return path
+
+    # Same preset as the recordings: calibrated to run faster than real time on this machine
+    profile = load_encoder_profile()
+    video_filter = ['-vf', 'scale=-2:960'] if video_bitrate < SMALL_SIZE_BITRATE else []
+    tmp_output = output + ".tmp.mp4"
+    cmd = (['ffmpeg', '-y', '-i', path] + video_filter +
+           ['-c:v', 'libx264', '-preset', profile["preset"], '-crf', str(RENDITION_CRF),
+            '-maxrate', str(video_bitrate), '-bufsize', str(video_bitrate * 2),
+            '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', str(AUDIO_BITRATE), '-ac', '1',
+            '-movflags', '+faststart', tmp_output])
+    start = time.time()
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=max(120, duration * 10))
+    except (subprocess.TimeoutExpired, FileNotFoundError) as e:
+        logging.warning(f"Delivery rendition failed for {path}: {e}")
+        return path
+    if result.returncode != 0 or not os.path.exists(tmp_output):
+        logging.warning(f"Delivery rendition failed for {path}: {result.stderr.decode()[-200:]}")
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        return path
+
+    rendered_size = os.path.getsize(tmp_output)
+    if rendered_size >= size:
+        os.remove(tmp_output)
+        return path
+    os.replace(tmp_output, output)
+    logging.info(f"Delivery rendition {os.path.basename(output)}: {size / 1e6:.1f} MB -> "
+                 f"{rendered_size / 1e6:.1f} MB (target {target_bytes / 1e6:.1f} MB, "
+                 f"{video_bitrate // 1000} kb/s) in {time.time() - start:.1f}s")
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Size-targeted delivery renditions")
+    parser.add_argument("video", nargs="?", help="Video to render (default: only show the target)")
+    parser.add_argument("--target-mb", type=float, help="Override the target size in MB")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rate = upload_throughput.bytes_per_second()
+    print(f"Samples: {len(upload_throughput.samples)}, "
+          f"throughput: {f'{rate / 1024:.0f} KB/s' if rate else 'not measured'}, "
+          f"target: {upload_throughput.target_bytes() / 1e6:.1f} MB")
+    if args.video:
+        target = int(args.target_mb * 1e6) if args.target_mb else None
+        print(render(args.video, target))
@@ -0,0 +1,101 @@
+import os
+import re
+import logging
+import subprocess
+
+from config import DISPLAY_RESOLUTION
+
+DEFAULT_RESOLUTION = (1920, 1080)
+
+_detected_resolution = None
+
+
+def _parse_resolution(text):
+    match = re.match(r'^\s*(\d+)\s*x\s*(\d+)\s*$', text or "")
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def _query_xrandr():
+    output = subprocess.run(['xrandr', '--current'], capture_output=True, text=True, timeout=5).stdout
+    # The active mode is marked with '*', e.g. "   1280x720     60.00*+"
+    for line in output.splitlines():
+        if '*' in line:
+            resolution = _parse_resolution(line.split()[0])
+            if resolution:
+                return resolution
+    return None
+
+
+def _query_xdpyinfo():
+    output = subprocess.run(['xdpyinfo'], capture_output=True, text=True, timeout=5).stdout
+    match = re.search(r'dimensions:\s+(\d+)x(\d+) pixels', output)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None
+
+
+def detect_display_resolution():
+    """
+    Returns the (width, height) of the output the kiosk renders to.
+    DISPLAY_RESOLUTION (e.g. "1280x720") overrides the detection. Otherwise
+    xrandr and xdpyinfo are queried once and the result is reused.
+    """
+    global _detected_resolution
+    if _detected_resolution:
+        return _detected_resolution
+
+    resolution = _parse_resolution(DISPLAY_RESOLUTION)
+    source = "DISPLAY_RESOLUTION"
+    if not resolution and os.environ.get("DISPLAY"):
+        for query in (_query_xrandr, _query_xdpyinfo):
+            try:
+                resolution = query()
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.debug(f"Display query {query.__name__} failed: {e}")
+                continue
+            if resolution:
+                source = query.__name__.replace("_query_", "")
+                break
+    if not resolution:
+        resolution = DEFAULT_RESOLUTION
+        source = "default"
+
+    logging.info(f"Display resolution: {resolution[0]}x{resolution[1]} ({source})")
+    _detected_resolution = resolution
+    return resolution
+
+
+# Screen layouts (text positions, font sizes) are authored for this resolution
+DESIGN_RESOLUTION = (1920, 1080)
+
+
+class RenderTarget:
+    """
+    Native output size shared by every renderer. Layouts authored at
+    DESIGN_RESOLUTION are mapped onto it with x()/y() for positions and
+    font()/thickness() for text, so text keeps its proportions on any screen.
+    """
+    def __init__(self, width, height):
+        self.configure(width, height)
+
+    def configure(self, width, height):
+        self.width = width
+        self.height = height
+        self.size = (width, height)
+        self.scale_x = width / DESIGN_RESOLUTION[0]
+        self.scale_y = height / DESIGN_RESOLUTION[1]
+        self.scale = min(self.scale_x, self.scale_y)
+
+    def x(self, value):
+        return int(round(value * self.scale_x))
+
+    def y(self, value):
+        return int(round(value * self.scale_y))
+
+    def font(self, font_scale):
+        return font_scale * self.scale
+
+    def thickness(self, thickness):
+        return max(1, int(round(thickness * self.scale)))
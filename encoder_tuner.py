@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Encoder auto-tuner for the visitor recordings.
+
+Encodes a short clip (test_sync_video.avi, or a synthetic test pattern) with the
+same filter graph as MediaManager.record_user (including the live preview
+branch of PREVIEW_MODE) across x264 presets, CRF values and thread counts. It
+keeps the best-quality profile that still encodes at >= 1.2x real time and
+keeps pace with an input fed at the live rate. The result is stored per
+machine in ENCODER_PROFILE_PATH, with the load average it was measured at,
+and record_user reads it through load_encoder_profile(). Nothing is saved
+when no encode succeeds (ffmpeg missing) or when the machine stays busy,
+so the next --if-needed run tries again.
+
+The kiosk does not calibrate at boot: after the first visitor it runs
+--if-needed in the background while in standby (BackgroundCalibration),
+once the post-processing queue has no ffmpeg stage left. It is stopped when
+the next visitor arrives and paused while a new job is encoded. Until then
+recordings use DEFAULT_PROFILE.
+
+Usage:
+    python encoder_tuner.py                      # Calibrate with test_sync_video.avi
+    python encoder_tuner.py --synthetic          # Calibrate with a generated test pattern
+    python encoder_tuner.py --if-needed          # Calibrate only if this machine has no profile
+    python encoder_tuner.py --show               # Print the cached profile
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+import argparse
+import platform
+import subprocess
+
+from config import BASE_DIR, ENCODER_PROFILE_PATH, PREVIEW_MODE
+
+# Used until a calibration has been run on this machine
+DEFAULT_PROFILE = {"preset": "ultrafast", "crf": 25, "threads": 0}
+
+# Best quality first
+PRESETS = ["veryfast", "superfast", "ultrafast"]
+CRF_VALUES = [20, 23, 25]
+THREAD_COUNTS = [0, 2, 4]  # 0 = let x264 decide
+
+TARGET_SPEED = 1.2
+REALTIME_MIN_SPEED = 0.98  # Encoded seconds per wall second under -re: below this it falls behind
+CALIBRATION_SOURCE = os.path.join(BASE_DIR, "test_sync_video.avi")
+CALIBRATION_SECONDS = 5
+
+# The speeds are only meaningful on an otherwise idle machine: wait for the
+# 1-minute load average to drop below this (per CPU) before measuring
+MAX_IDLE_LOAD = 0.5
+IDLE_WAIT = 300
+IDLE_POLL = 10
+
+# Same capture geometry as record_user: 1280x720@30, rotated to portrait
+CAPTURE_SIZE = "1280x720"
+CAPTURE_FPS = 30
+VIDEO_FILTER = "transpose=1"
+RECORDING_SIZE = (720, 1280)
+
+CALIBRATION_LOG_PATH = os.path.join(BASE_DIR, "logs", "encoder_tuner.log")
+
+
+def machine_id():
+    """Identifies the hardware, so a profile copied to another machine is not reused."""
+    info = {}
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    info.setdefault(key.strip().lower(), value.strip())
+    except OSError:
+        pass
+    # x86 reports "model name", the Raspberry Pi "Model" (board) or "Hardware"
+    model = info.get("model name") or info.get("model") or info.get("hardware") or platform.processor()
+    return f"{platform.machine()}|{model}|{os.cpu_count()}"
+
+
+def load_encoder_profile():
+    """Returns the profile calibrated for this machine and preview mode, or DEFAULT_PROFILE."""
+    try:
+        with open(ENCODER_PROFILE_PATH) as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return dict(DEFAULT_PROFILE)
+    if profile.get("machine") != machine_id():
+        logging.info("Encoder profile was calibrated on another machine, using defaults")
+        return dict(DEFAULT_PROFILE)
+    if profile.get("preview_mode", PREVIEW_MODE) != PREVIEW_MODE:
+        logging.info(f"Encoder profile was calibrated for PREVIEW_MODE={profile['preview_mode']}, using defaults")
+        return dict(DEFAULT_PROFILE)
+    return profile
+
+
+def encoder_args(profile=None):
+    """FFmpeg video encoder arguments for a profile (default: the cached one)."""
+    profile = profile or load_encoder_profile()
+    args = ['-c:v', 'libx264', '-preset', profile["preset"], '-crf', str(profile["crf"])]
+    if profile.get("threads"):
+        args += ['-threads', str(profile["threads"])]
+    return args
+
+
+def preview_size(screen_w, screen_h):
+    """Pipe preview size in record_user: the portrait recording letterboxed into the screen (even dimensions)."""
+    scale = min(screen_w / RECORDING_SIZE[0], screen_h / RECORDING_SIZE[1])
+    return int(RECORDING_SIZE[0] * scale) // 2 * 2, int(RECORDING_SIZE[1] * scale) // 2 * 2
+
+
+def load_average():
+    """1-minute load average, or None where the platform has none."""
+    try:
+        return round(os.getloadavg()[0], 2)
+    except (OSError, AttributeError):
+        return None
+
+
+def wait_for_idle(timeout=IDLE_WAIT):
+    """
+    Waits until the load average is below MAX_IDLE_LOAD per CPU.
+    Returns the load it settled at, or None if the machine stayed busy.
+    """
+    limit = MAX_IDLE_LOAD * (os.cpu_count() or 1)
+    deadline = time.time() + timeout
+    while True:
+        load = load_average()
+        if load is None or load <= limit:
+            return load if load is not None else 0.0
+        if time.time() >= deadline:
+            logging.warning(f"Load average still {load} after {timeout}s (limit {limit})")
+            return None
+        logging.info(f"Load average {load} above {limit}, waiting before calibrating...")
+        time.sleep(IDLE_POLL)
+
+
+def _preview_outputs(preview_mode, seconds):
+    """
+    Filter graph suffix and extra outputs for record_user's live preview branch,
+    written to the null muxer: display-sized bgr24 frames ("pipe") or yuv420p
+    frames for the virtual camera ("loopback").
+    """
+    if preview_mode == "pipe":
+        from display import detect_display_resolution
+        width, height = preview_size(*detect_display_resolution())
+        graph = f",split=2[rec][prev];[prev]scale={width}:{height}[prevs]"
+        return graph, ['-map', '[prevs]', '-t', str(seconds), '-c:v', 'rawvideo', '-pix_fmt', 'bgr24',
+                       '-f', 'null', '-']
+    if preview_mode == "loopback":
+        return ",split=2[rec][prevs]", ['-map', '[prevs]', '-t', str(seconds), '-c:v', 'rawvideo',
+                                        '-pix_fmt', 'yuv420p', '-f', 'null', '-']
+    return "[rec]", []
+
+
+def _input_args(source, seconds, realtime, preview_mode):
+    """Inputs, filter graph and stream maps of the recording output, plus the preview outputs."""
+    args = ['-re'] if realtime else []
+    if source:
+        args += ['-stream_loop', '-1', '-i', source]
+        # Match the camera geometry whatever the clip's own size is
+        graph = f"[0:v]scale={CAPTURE_SIZE.replace('x', ':')},fps={CAPTURE_FPS},{VIDEO_FILTER}"
+        audio_map = '0:a?'
+    else:
+        args += ['-f', 'lavfi', '-i', f'testsrc2=size={CAPTURE_SIZE}:rate={CAPTURE_FPS}',
+                 '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000']
+        graph = f"[0:v]{VIDEO_FILTER}"
+        audio_map = '1:a'
+    preview_graph, preview_outputs = _preview_outputs(preview_mode, seconds)
+    args += ['-t', str(seconds), '-filter_complex', graph + preview_graph,
+             '-map', '[rec]', '-map', audio_map]
+    return args, preview_outputs
+
+
+def usable_source(source):
+    """True if 'source' is a non-empty file with a video stream ffprobe can read."""
+    if not source or not os.path.isfile(source) or os.path.getsize(source) == 0:
+        return False
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'stream=codec_type',
+           '-of', 'csv=p=0', source]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=15)
+    except FileNotFoundError:
+        return True  # No ffprobe: the encodes will tell
+    except subprocess.TimeoutExpired:
+        return False
+    return result.returncode == 0 and "video" in result.stdout
+
+
+def _out_seconds(progress):
+    return int(progress.get("out_time_us", progress.get("out_time_ms", 0)) or 0) / 1_000_000
+
+
+def run_encode(profile, source, seconds, realtime=False, preview_mode=PREVIEW_MODE):
+    """
+    Encodes 'seconds' of the source with 'profile' to a null muxer, through
+    record_user's filter graph for 'preview_mode'.
+    Returns {"speed": x real time, "steady_speed": x real time between the first
+    and last progress reports, "out_seconds", "frames"} or None on failure.
+    'steady_speed' leaves out the ffmpeg startup, so under -re it reads ~1.0
+    while the encoder keeps up with the input.
+    """
+    inputs, preview_outputs = _input_args(source, seconds, realtime, preview_mode)
+    cmd = (['ffmpeg', '-y', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+           + inputs
+           + encoder_args(profile)
+           + ['-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k', '-f', 'null', '-']
+           + preview_outputs)
+    start = time.time()
+    deadline = start + seconds * 20 + 30
+    progress, reports = {}, []
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    except FileNotFoundError as e:
+        logging.warning(f"Calibration encode failed: {e}")
+        return None
+    # One block of key=value lines per report, ending with "progress=continue|end"
+    for line in proc.stdout:
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        progress[key.strip()] = value.strip()
+        if key.strip() == "progress":
+            reports.append((time.time(), _out_seconds(progress)))
+        if time.time() > deadline:
+            proc.kill()
+            break
+    stderr = proc.stderr.read()
+    returncode = proc.wait()
+    wall = time.time() - start
+    if returncode != 0:
+        logging.warning(f"Calibration encode failed: {stderr[-200:] or f'exit code {returncode}'}")
+        return None
+
+    out_seconds = _out_seconds(progress)
+    steady_speed = None
+    if len(reports) >= 2 and reports[-1][0] > reports[0][0]:
+        steady_speed = round((reports[-1][1] - reports[0][1]) / (reports[-1][0] - reports[0][0]), 3)
+    return {
+        "speed": round(out_seconds / wall, 2) if wall > 0 else 0,
+        "steady_speed": steady_speed,
+        "out_seconds": round(out_seconds, 2),
+        "frames": int(progress.get("frame", 0) or 0),
+    }
+
+
+def keeps_up(live, seconds):
+    """Real-time run check: the whole clip was encoded and output kept pace with the wall clock."""
+    if not live or live["out_seconds"] < seconds * REALTIME_MIN_SPEED:
+        return False
+    speed = live["steady_speed"] if live["steady_speed"] is not None else live["speed"]
+    return speed >= REALTIME_MIN_SPEED
+
+
+def calibrate(source=CALIBRATION_SOURCE, seconds=CALIBRATION_SECONDS, target_speed=TARGET_SPEED):
+    """
+    Benchmarks every candidate, then verifies the best ones in real-time mode.
+    Saves and returns the chosen profile. Returns DEFAULT_PROFILE without
+    saving it if no encode succeeded at all or the machine never got idle.
+    """
+    load = wait_for_idle()
+    if load is None:
+        logging.error("Machine too busy to calibrate, profile not saved")
+        return dict(DEFAULT_PROFILE)
+
+    if source and not usable_source(source):
+        logging.warning(f"Calibration source {source} is missing, empty or has no video, "
+                        f"using a synthetic test pattern")
+        source = None
+
+    # 1. Throughput of every preset/CRF, keeping the fastest thread count for each
+    candidates = []
+    encoded = 0
+    for preset in PRESETS:
+        for crf in CRF_VALUES:
+            best = None
+            for threads in THREAD_COUNTS:
+                profile = {"preset": preset, "crf": crf, "threads": threads}
+                result = run_encode(profile, source, seconds)
+                if not result:
+                    continue
+                encoded += 1
+                logging.info(f"{preset:<10} crf={crf} threads={threads or 'auto'}: {result['speed']}x")
+                if best is None or result["speed"] > best[1]["speed"]:
+                    best = (profile, result)
+            if best and best[1]["speed"] >= target_speed:
+                candidates.append(best)
+
+    if not encoded:
+        logging.error("No calibration encode succeeded (is ffmpeg installed?), profile not saved")
+        return dict(DEFAULT_PROFILE)
+
+    # 2. Best quality first: confirm it keeps up with a live-rate input
+    chosen = None
+    for profile, result in candidates:
+        live = run_encode(profile, source, seconds, realtime=True)
+        if keeps_up(live, seconds):
+            chosen = dict(profile, speed=result["speed"], realtime_speed=live["steady_speed"])
+            break
+        logging.info(f"{profile['preset']} crf={profile['crf']} fell behind in real-time mode: {live}")
+
+    if not chosen:
+        logging.warning(f"No profile sustains {target_speed}x real time, keeping the fastest default")
+        chosen = dict(DEFAULT_PROFILE, speed=None, realtime_speed=None)
+
+    chosen.update({
+        "machine": machine_id(),
+        "target_speed": target_speed,
+        "source": os.path.basename(source) if source else "synthetic",
+        "preview_mode": PREVIEW_MODE,
+        "load_average": load,
+        "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    os.makedirs(os.path.dirname(ENCODER_PROFILE_PATH), exist_ok=True)
+    with open(ENCODER_PROFILE_PATH, 'w') as f:
+        json.dump(chosen, f, indent=4)
+    logging.info(f"Encoder profile saved to {ENCODER_PROFILE_PATH}: {chosen}")
+    return chosen
+
+
+class BackgroundCalibration:
+    """
+    Runs 'encoder_tuner.py --if-needed' as a low-priority child process while
+    the kiosk is idle. With a PostProcessQueue ('jobs'), it only runs while
+    no job has an ffmpeg stage left: it is paused when a job is queued and
+    started again when the encodes are done. stop() kills the whole process
+    group, ffmpeg included; an interrupted calibration saves nothing and runs
+    again on the next start().
+    """
+    def __init__(self, jobs=None):
+        self.proc = None
+        self.jobs = jobs
+        self.wanted = False
+        self.lock = threading.Lock()
+        if jobs is not None:
+            jobs.on_encoding(self._on_encoding)
+
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        with self.lock:
+            self.wanted = True
+            if self.jobs is not None and self.jobs.encoding():
+                logging.info("Encoder calibration waiting for post-processing to finish")
+                return
+            self._launch()
+
+    def stop(self):
+        with self.lock:
+            self.wanted = False
+            if self._kill():
+                logging.info("Encoder calibration interrupted, it will resume in the next standby")
+
+    def _on_encoding(self, busy):
+        """PostProcessQueue callback: pause while jobs encode, resume when they are done."""
+        with self.lock:
+            if busy:
+                if self._kill():
+                    logging.info("Encoder calibration paused while post-processing encodes")
+            elif self.wanted:
+                self._launch()
+
+    def _launch(self):
+        if self.running() or "machine" in load_encoder_profile():
+            return
+        cmd = ['nice', '-n', '10', sys.executable, os.path.abspath(__file__), '--if-needed']
+        try:
+            os.makedirs(os.path.dirname(CALIBRATION_LOG_PATH), exist_ok=True)
+            with open(CALIBRATION_LOG_PATH, 'a') as log:
+                self.proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT,
+                                             cwd=BASE_DIR, start_new_session=True)
+        except OSError as e:
+            logging.warning(f"Could not start encoder calibration: {e}")
+            return
+        logging.info(f"Encoder calibration running in the background (log: {CALIBRATION_LOG_PATH})")
+
+    def _kill(self):
+        """Kills a running calibration. Returns True if one was running."""
+        if not self.running():
+            return False
+        try:
+            os.killpg(self.proc.pid, signal.SIGTERM)
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.warning(f"Could not stop encoder calibration: {e}")
+        return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the best real-time x264 settings for this machine")
+    parser.add_argument("--source", default=CALIBRATION_SOURCE, help="Clip to encode (default: test_sync_video.avi)")
+    parser.add_argument("--synthetic", action="store_true", help="Use a generated test pattern instead of a clip")
+    parser.add_argument("--seconds", type=int, default=CALIBRATION_SECONDS, help="Seconds encoded per candidate")
+    parser.add_argument("--target-speed", type=float, default=TARGET_SPEED, help="Minimum x real time")
+    parser.add_argument("--if-needed", action="store_true", help="Only calibrate if this machine has no profile")
+    parser.add_argument("--show", action="store_true", help="Print the cached profile and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.show:
+        print(json.dumps(load_encoder_profile(), indent=4))
+    elif args.if_needed and "machine" in load_encoder_profile():
+        logging.info("Encoder profile already calibrated for this machine")
+    else:
+        profile = calibrate(None if args.synthetic else args.source, args.seconds, args.target_speed)
+        if "machine" not in profile:
+            raise SystemExit(1)
@@ -42,6 +42,14 @@ class HardwareManager:
             # Mock behavior: Always return False (closed) unless manually triggered in test
             return False
 
+    def on_door_open(self, callback):
+        """
+        Registers 'callback' to be called from the GPIO thread as soon as the door opens.
+        Replaces any previously registered callback. No-op in mock mode.
+        """
+        if self.door_sensor and not self.mock_mode:
+            self.door_sensor.when_released = callback
+
     def wait_for_door_open(self):
         if self.door_sensor and not self.mock_mode:
             logging.info("Waiting for door to open...")
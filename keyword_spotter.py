@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Multi-keyword spotter on Vosk partial results.
+
+A single recognizer on the shared microphone watches every configured phrase
+at once. A phrase fires as soon as it has appeared in STABLE_PARTIALS
+consecutive partial results (about 100 ms of audio apart), or in a final
+result, instead of waiting for the end-of-speech silence that finalizes an
+utterance. A phrase fires at most once per utterance and not again within
+COOLDOWN_SECONDS.
+
+The spotter only decodes while someone is waiting: the first wait_for() starts
+the decoding thread, which gives the microphone subscription and the pooled
+recognizer back once the last waiter leaves.
+
+Usage:
+    python keyword_spotter.py                          # Print events for SPOTTER_KEYWORDS
+    python keyword_spotter.py "feliz navidad" confirmar
+"""
+
+import json
+import time
+import logging
+import argparse
+import threading
+import unicodedata
+from collections import deque, namedtuple
+
+from config import SAMPLE_RATE, SPOTTER_KEYWORDS
+from mic_capture import mic
+from vosk_models import vosk_models
+
+READ_FRAMES = 1600          # 100 ms between partial results
+STABLE_PARTIALS = 2         # Consecutive partials containing the phrase before it fires
+COOLDOWN_SECONDS = 1.5      # Minimum gap between two events of the same phrase
+EVENT_HISTORY = 50
+
+# 'stream_time' is the position in the spotter's audio stream (seconds) when the phrase fired
+KeywordEvent = namedtuple("KeywordEvent", ["keyword", "timestamp", "stream_time", "text", "partial"])
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFD", text.lower())
+    return " ".join("".join(c for c in text if not unicodedata.combining(c)).split())
+
+
+class KeywordSpotter:
+    def __init__(self, phrases=SPOTTER_KEYWORDS, rate=SAMPLE_RATE,
+                 stability=STABLE_PARTIALS, cooldown=COOLDOWN_SECONDS):
+        self.rate = rate
+        self.stability = stability
+        self.cooldown = cooldown
+        self.phrases = {normalize(p): p for p in phrases}
+        self.cond = threading.Condition()
+        self.events = deque(maxlen=EVENT_HISTORY)
+        self.waiters = 0
+        self.thread = None
+        # Per-utterance matching state (decoder thread only)
+        self.streak = {}
+        self.fired = set()
+        self.last_fired = {}
+        self.frames = 0
+
+    def add(self, phrase):
+        with self.cond:
+            self.phrases.setdefault(normalize(phrase), phrase)
+
+    def wait_for(self, keyword, stop_event, timeout=None):
+        """
+        Blocks until 'keyword' is heard (returns its KeywordEvent), 'stop_event'
+        is set or the timeout expires (returns None). Only phrases spoken after
+        the call count.
+        """
+        keyword = normalize(keyword)
+        self.add(keyword)
+        since = time.time()
+        deadline = None if timeout is None else since + timeout
+        with self.cond:
+            self.waiters += 1
+            self._ensure_running()
+            try:
+                while not stop_event.is_set():
+                    for event in reversed(self.events):
+                        if event.timestamp < since:
+                            break
+                        if event.keyword == keyword:
+                            return event
+                    if deadline is not None and time.time() >= deadline:
+                        return None
+                    self.cond.wait(0.2)
+                return None
+            finally:
+                self.waiters -= 1
+
+    def _ensure_running(self):
+        # Called with self.cond held
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="keyword-spotter", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        idle = False
+        try:
+            with vosk_models.recognizer(self.rate) as rec:
+                if rec is None:
+                    logging.warning("Vosk model not loaded, cannot spot keywords.")
+                    return
+                with mic.subscribe("keyword-spotter") as subscription:
+                    logging.info(f"Keyword spotter listening for {sorted(self.phrases)}")
+                    idle = self._decode(rec, subscription)
+        except Exception as e:
+            logging.error(f"Keyword spotter failed: {e}")
+        finally:
+            with self.cond:
+                self.thread = None
+                # A waiter that arrived while we were shutting down needs a new thread
+                if idle and self.waiters > 0:
+                    self._ensure_running()
+            logging.info("Keyword spotter stopped.")
+
+    def _decode(self, rec, subscription):
+        """Decodes until nobody is waiting (returns True) or the microphone closes (False)."""
+        self.streak, self.fired, self.frames = {}, set(), 0
+        while True:
+            with self.cond:
+                if self.waiters == 0:
+                    return True
+            data = subscription.read(READ_FRAMES, timeout=0.5)
+            if not data:
+                if subscription.closed:
+                    return False
+                continue
+            self.frames += len(data) // mic.sample_width
+            if rec.AcceptWaveform(data):
+                self._match(json.loads(rec.Result()).get("text", ""), partial=False)
+                # New utterance: every phrase may fire again
+                self.streak, self.fired = {}, set()
+            else:
+                self._match(json.loads(rec.PartialResult()).get("partial", ""), partial=True)
+
+    def _match(self, text, partial):
+        if not text:
+            return
+        text = normalize(text)
+        # Whole words only: "si" must not fire inside "asi"
+        padded = f" {text} "
+        now = time.time()
+        with self.cond:
+            phrases = list(self.phrases)
+        for phrase in phrases:
+            if f" {phrase} " not in padded:
+                self.streak[phrase] = 0
+                continue
+            self.streak[phrase] = self.streak.get(phrase, 0) + 1
+            if partial and self.streak[phrase] < self.stability:
+                continue
+            if phrase in self.fired or now - self.last_fired.get(phrase, 0) < self.cooldown:
+                continue
+            self.fired.add(phrase)
+            self.last_fired[phrase] = now
+            event = KeywordEvent(phrase, now, round(self.frames / self.rate, 2), text, partial)
+            logging.info(f"Keyword '{phrase}' at {event.stream_time:.2f}s "
+                         f"({'partial' if partial else 'final'} result: '{text}')")
+            with self.cond:
+                self.events.append(event)
+                self.cond.notify_all()
+
+
+def _print_events(spotter, phrase, stop_event):
+    while not stop_event.is_set():
+        event = spotter.wait_for(phrase, stop_event)
+        if event:
+            print(event)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print keyword events from the microphone")
+    parser.add_argument("phrases", nargs="*", default=SPOTTER_KEYWORDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    spotter = KeywordSpotter(args.phrases)
+    stop_event = threading.Event()
+    # One waiter per phrase, all served by the same decoder
+    for phrase in args.phrases:
+        threading.Thread(target=_print_events, args=(spotter, phrase, stop_event), daemon=True).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+    mic.stop()
@@ -4,9 +4,13 @@ import time
 import os
 from config import *
 from hardware import HardwareManager
-from media import MediaManager
+from media import MediaManager, InterruptEvent
 from audio import AudioManager
+from mic_capture import mic
 from messaging import MessagingService
+from outbox import Outbox
+from postprocess import PostProcessQueue
+from encoder_tuner import BackgroundCalibration
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -19,6 +23,15 @@ def main():
     media = MediaManager()
     audio = AudioManager()
     messaging = MessagingService()
+    outbox = Outbox(messaging)
+    outbox.start()
+    postprocess = PostProcessQueue(outbox=outbox, assets=media.assets)
+    postprocess.start()
+    # The x264 profile is calibrated in standby once a visitor has been recorded
+    # and their post-processing encodes are done, never at boot: the first
+    # recordings use the default profile
+    calibration = BackgroundCalibration(postprocess)
+    recorded = 0
 
     logging.info("System Ready. Waiting for door...")
 
@@ -26,7 +39,9 @@ def main():
         try:
             # 1. Wait for Start (Door, Enter, or Voice Trigger)
             logging.info("Waiting for activation (Door, Enter, or 'Feliz Navidad')...")
-            activation_event = threading.Event()
+            activation_event = InterruptEvent()
+            # Door sensor pushes the trigger directly so playback wakes up immediately
+            hardware.on_door_open(lambda: activation_event.set("door"))
             
             # Start Voice Listener
             def voice_listener():
@@ -40,22 +55,24 @@ def main():
                 if activation_event.is_set(): return True
                 if hardware.is_door_open():
                     logging.info("Door opened! Starting experience.")
-                    activation_event.set()
+                    activation_event.set("door")
                     return True
                 if media.check_for_enter():
                     logging.info("Enter key detected!")
-                    activation_event.set()
+                    activation_event.set("enter")
                     return True
                 return False
 
             # Standby Loop
             logging.info("Entering Standby Mode (Video/Image Loop)...")
             audio.stop_background_music() # Ensure no music during standby
+            if recorded:
+                calibration.start()
 
             while not activation_event.is_set():
                 # 1. Play Standby Video
                 if os.path.exists(STANDBY_VIDEO_PATH):
-                     media.play_video(STANDBY_VIDEO_PATH, check_interrupt=check_active)
+                     media.play_video(STANDBY_VIDEO_PATH, check_interrupt=check_active, interrupt_event=activation_event)
                 
                 if check_active(): break
 
@@ -83,17 +100,14 @@ def main():
                 # If result == 'TIMEOUT', loop restarts -> Plays Video
             
             activation_event.set() # Signal audio thread to stop if it hasn't yet
+            calibration.stop()  # Give the CPU back to the recording
 
             # 2. Play Intro Video (Santa)
             logging.info("=" * 50)
             logging.info("STEP 2: Playing intro video...")
             logging.info("=" * 50)
-            media.play_video(INTRO_VIDEO_PATH)
-            
-            # 2.1 Play Second Intro Video
-            logging.info("Playing second intro video...")
-            # play_video now silently skips if not found, fulfilling the request to optimize/omit
-            media.play_video(INTRO_VIDEO_2_PATH)
+            # 2.1 The second intro is chained gaplessly; missing clips are skipped
+            media.play_sequence([INTRO_VIDEO_PATH, INTRO_VIDEO_2_PATH])
 
             # 3. Record User (30 seconds fixed)
             logging.info("=" * 50)
@@ -106,6 +120,7 @@ def main():
             
             # Start recording (blocks for 30 seconds)
             media.record_user(user_video_path)
+            recorded += 1
 
             # 4. Ask for Phone Number
             media.play_video(ASK_PHONE_VIDEO_PATH)
@@ -135,12 +150,12 @@ def main():
                 logging.info("Audio worker started")
                 
                 # Process audio chunks
-                for chunk_path in audio.stream_audio_chunks(audio_stop_event, chunk_duration=5):
+                for chunk in audio.stream_audio_chunks(audio_stop_event, chunk_duration=5):
                     if not phone_display.running: # Stop if UI closed
                         break
                         
-                    logging.info(f"Processing chunk: {chunk_path}")
-                    chunk_text = audio.transcribe_with_openai(chunk_path)
+                    logging.info(f"Processing chunk: {chunk.filename}")
+                    chunk_text = audio.transcribe_with_openai(chunk)
                     
                     if chunk_text:
                         full_transcript += " " + chunk_text
@@ -159,12 +174,6 @@ def main():
                                 audio_stop_event.set() # Stop recording loop
                                 phone_display.stop() # Stop UI loop
                                 break
-                    
-                    # Cleanup chunk file
-                    try:
-                        os.remove(chunk_path)
-                    except:
-                        pass
                 logging.info("Audio worker finished")
 
             # Start Audio Worker in Background Thread
@@ -204,31 +213,11 @@ def main():
                 
                 audio.stop_background_music()
                 
-                # 7. Send Message & Save Metadata (in background to not block)
-                # Send message in background thread to avoid blocking
-                def send_in_background():
-                    try:
-                        messaging.send_welcome_message(final_phone_number)
-                    except Exception as e:
-                        logging.error(f"Background send failed: {e}")
-                
-                send_thread = threading.Thread(target=send_in_background, daemon=True)
-                send_thread.start()
-                logging.info("Message sending started in background...")
-                
-                # Save Metadata JSON (fast, won't block)
-                metadata = {
-                    "video_path": user_video_path,
-                    "phone_number": final_phone_number,
-                    "timestamp": timestamp,
-                    "full_transcript": full_transcript
-                }
-                json_path = os.path.join(RECORDINGS_DIR, f"user_video_{timestamp}.json")
-                import json
-                with open(json_path, 'w') as f:
-                    json.dump(metadata, f, indent=4)
-                logging.info(f"Metadata saved to {json_path}")
-                
+                # 7. Send and archive run on the post-processing workers (text message only, as before)
+                postprocess.enqueue(final_phone_number, user_video_path.replace(".avi", ".mp4"),
+                                    metadata={"timestamp": timestamp, "full_transcript": full_transcript},
+                                    merge=False, send_video=False)
+
                 # 8. Goodbye Video - IMMEDIATE, don't wait for message
                 logging.info("STEP 8: Playing goodbye video...")
                 if os.path.exists(GOODBYE_VIDEO_PATH):
@@ -264,8 +253,16 @@ def main():
             logging.error(f"Unexpected error: {e}")
             time.sleep(5) # Wait before retrying
 
+    if 'calibration' in locals():
+        calibration.stop()
+    if 'postprocess' in locals():
+        # Unfinished jobs stay in the journal and resume on the next start
+        postprocess.stop(timeout=2)
+    if 'outbox' in locals():
+        outbox.stop(timeout=2)
     if 'media' in locals():
         media.cleanup()
+    mic.stop()
 
 if __name__ == "__main__":
     main()
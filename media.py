@@ -5,6 +5,12 @@ import os
 import threading
 import numpy as np
 import subprocess
+from collections import OrderedDict
+from codec_preflight import CodecPreflight
+from asset_pipeline import AssetPipeline
+from display import detect_display_resolution, RenderTarget, DEFAULT_RESOLUTION
+from encoder_tuner import load_encoder_profile, encoder_args, preview_size
+from config import PLAYBACK_VIDEO_PATHS, PREVIEW_MODE
 try:
     import vlc
     VLC_AVAILABLE = True
@@ -14,6 +20,433 @@ except ImportError:
 
 WINDOW_NAME = "EnchantedTree"
 
+class FrameBufferPool:
+    """
+    Reusable full-screen BGR frames for the persistent window.
+    Buffers are handed out with acquire() and given back with release(), so
+    steady-state rendering does not allocate. A single black frame is cached
+    for the black screen.
+    """
+    def __init__(self, width=1920, height=1080, max_buffers=4):
+        self.max_buffers = max_buffers
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        """Switches the pool to a new frame size, dropping buffers of the old size."""
+        with self.lock:
+            self.width = width
+            self.height = height
+            self.shape = (height, width, 3)
+            self.free = []
+            self.black = np.zeros(self.shape, dtype=np.uint8)
+            self.black.flags.writeable = False
+
+    def acquire(self, clear=False):
+        """Returns a frame buffer. Allocates only when the pool is empty (a miss)."""
+        with self.lock:
+            if self.free:
+                buf = self.free.pop()
+                self.hits += 1
+            else:
+                buf = None
+                self.misses += 1
+        if buf is None:
+            return np.zeros(self.shape, dtype=np.uint8)
+        if clear:
+            buf.fill(0)
+        return buf
+
+    def release(self, buf):
+        if buf is None or buf.shape != self.shape:
+            return
+        with self.lock:
+            if len(self.free) < self.max_buffers and not any(b is buf for b in self.free):
+                self.free.append(buf)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "free": len(self.free)}
+
+class ImageCache:
+    """
+    In-memory cache of decoded images already resized to display resolution.
+    Entries are keyed by (path, mtime, size) so an edited asset is decoded again,
+    and the least recently used ones are evicted once max_bytes is exceeded.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, size):
+        """Returns the image at 'path' resized to size=(width, height), or None."""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        key = (path, mtime, tuple(size))
+        with self.lock:
+            img = self.entries.get(key)
+            if img is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return img
+            self.misses += 1
+
+        img = cv2.imread(path)
+        if img is None:
+            logging.warning(f"Failed to decode image: {path}")
+            return None
+        if (img.shape[1], img.shape[0]) != tuple(size):
+            img = cv2.resize(img, tuple(size))
+        img.flags.writeable = False
+        self._put(key, img)
+        return img
+
+    def _put(self, key, img):
+        with self.lock:
+            # Drop stale versions of the same path/size (file was modified)
+            for old_key in [k for k in self.entries if k[0] == key[0] and k[2] == key[2]]:
+                self.total_bytes -= self.entries.pop(old_key).nbytes
+            self.entries[key] = img
+            self.total_bytes += img.nbytes
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+
+    def preload(self, paths, size):
+        for path in paths:
+            if os.path.exists(path):
+                start = time.time()
+                if self.get(path, size) is not None:
+                    logging.info(f"Preloaded image {os.path.basename(path)} in {(time.time() - start) * 1000:.0f} ms")
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self.entries), "bytes": self.total_bytes}
+
+class InterruptEvent(threading.Event):
+    """
+    threading.Event that remembers when (and by which source) it was set and
+    notifies subscribers, so a blocked playback can wake up immediately.
+    """
+    def __init__(self):
+        super().__init__()
+        self.set_time = None
+        self.source = None
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+
+    def set(self, source=None):
+        if not self.is_set():
+            self.set_time = time.time()
+            self.source = source
+        super().set()
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback()
+            except Exception as e:
+                logging.debug(f"Interrupt subscriber failed: {e}")
+
+    def subscribe(self, callback):
+        with self._subscribers_lock:
+            self._subscribers.append(callback)
+        if self.is_set():
+            callback()
+
+    def unsubscribe(self, callback):
+        with self._subscribers_lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (milliseconds)."""
+    BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        ms = max(0.0, ms)
+        index = len(self.BUCKETS_MS)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms < bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def summary(self):
+        labels = [f"<{b}" for b in self.BUCKETS_MS] + [f">={self.BUCKETS_MS[-1]}"]
+        buckets = " ".join(f"{label}:{n}" for label, n in zip(labels, self.counts) if n)
+        return f"n={self.count} avg={self.total_ms / self.count:.1f}ms max={self.max_ms:.1f}ms [{buckets}]"
+
+
+class PlaybackMonitor:
+    """
+    Tracks VLC player events for one playback and wakes the waiting thread on
+    EndReached, EncounteredError or an interrupt. With a list player, the
+    playback only ends once the whole list has been played, and the gap between
+    one clip ending and the next one playing is measured.
+    """
+    # Polling interval for check_interrupt sources that cannot push events
+    POLL_INTERVAL = 0.2
+    # Safety net in case VLC never delivers a terminal event
+    STATE_CHECK_INTERVAL = 1.0
+
+    def __init__(self, player, list_player=None, interrupt_event=None):
+        self.player = player
+        self.list_player = list_player
+        self.interrupt_event = interrupt_event
+        self.wake = threading.Event()
+        self.started_at = time.time()
+        self.playing_at = None
+        self.ended_at = None
+        self.error_at = None
+        self.interrupted_at = None
+        self.finished_at = None
+        self.outcome = None
+        self.gaps_ms = []
+        self.clips_ended = 0
+        self._last_clip_end = None
+
+        self.player_events = player.event_manager()
+        self.player_events.event_attach(vlc.EventType.MediaPlayerPlaying, self._on_playing)
+        self.player_events.event_attach(vlc.EventType.MediaPlayerEndReached, self._on_end_reached)
+        self.player_events.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._on_error)
+        if list_player:
+            self.list_events = list_player.event_manager()
+            self.list_events.event_attach(vlc.EventType.MediaListPlayerPlayed, self._on_list_played)
+        if interrupt_event:
+            interrupt_event.subscribe(self.wake.set)
+
+    # VLC callbacks run on VLC's own thread: only record timestamps here
+    def _on_playing(self, event):
+        now = time.time()
+        if self.playing_at is None:
+            self.playing_at = now
+        if self._last_clip_end is not None:
+            self.gaps_ms.append((now - self._last_clip_end) * 1000)
+            self._last_clip_end = None
+
+    def _on_end_reached(self, event):
+        self._last_clip_end = time.time()
+        self.clips_ended += 1
+        if not self.list_player:
+            self.ended_at = self._last_clip_end
+            self.wake.set()
+
+    def _on_list_played(self, event):
+        self.ended_at = time.time()
+        self.wake.set()
+
+    def _on_error(self, event):
+        self.error_at = time.time()
+        self.wake.set()
+
+    def wait(self, check_interrupt=None):
+        """Blocks until the playback ends, fails or is interrupted. Returns the outcome."""
+        timeout = self.POLL_INTERVAL if check_interrupt else self.STATE_CHECK_INTERVAL
+        while True:
+            if self.wake.wait(timeout):
+                if self.error_at:
+                    self.outcome = "error"
+                elif self.interrupt_event and self.interrupt_event.is_set():
+                    self.outcome = "interrupted"
+                    self.interrupted_at = self.interrupt_event.set_time
+                else:
+                    self.outcome = "ended"
+                break
+            if check_interrupt and check_interrupt():
+                self.outcome = "interrupted"
+                self.interrupted_at = getattr(self.interrupt_event, "set_time", None)
+                break
+            if self.player.get_state() == vlc.State.Error:
+                self.error_at = time.time()
+                self.outcome = "error"
+                break
+        self.finished_at = time.time()
+        return self.outcome
+
+    def detach(self):
+        self.player_events.event_detach(vlc.EventType.MediaPlayerPlaying)
+        self.player_events.event_detach(vlc.EventType.MediaPlayerEndReached)
+        self.player_events.event_detach(vlc.EventType.MediaPlayerEncounteredError)
+        if self.list_player:
+            self.list_events.event_detach(vlc.EventType.MediaListPlayerPlayed)
+        if self.interrupt_event:
+            self.interrupt_event.unsubscribe(self.wake.set)
+
+
+class RawVideoPipeReader:
+    """
+    Reads fixed-size BGR frames from an FFmpeg rawvideo pipe on a background
+    thread. Frames are read straight into two preallocated buffers (no per-frame
+    allocation): one being filled, the other holding the latest complete frame.
+    """
+    def __init__(self, stream, width, height):
+        self.stream = stream
+        self.shape = (height, width, 3)
+        self.frame_bytes = width * height * 3
+        self.buffers = [np.empty(self.shape, dtype=np.uint8) for _ in range(2)]
+        self.back = 0
+        self.latest = None
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.started_at = time.time()
+        self.first_frame_at = None
+        self.last_frame_at = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _read_frame(self, buf):
+        view = memoryview(buf).cast('B')
+        got = 0
+        while got < self.frame_bytes:
+            n = self.stream.readinto(view[got:])
+            if not n:
+                return False
+            got += n
+        return True
+
+    def _run(self):
+        try:
+            # Keep draining until EOF, otherwise FFmpeg would block on the full pipe
+            while self._read_frame(self.buffers[self.back]):
+                now = time.time()
+                with self.lock:
+                    self.latest = self.back
+                    self.back ^= 1
+                    self.frames += 1
+                    if self.first_frame_at is None:
+                        self.first_frame_at = now
+                        logging.info(f"First preview frame after {(now - self.started_at) * 1000:.0f} ms")
+                    self.last_frame_at = now
+        except Exception as e:
+            logging.warning(f"Preview pipe reader stopped: {e}")
+
+    def copy_latest(self, dst):
+        """Copies the latest complete frame into dst. Returns False if none arrived yet."""
+        with self.lock:
+            if self.latest is None:
+                return False
+            np.copyto(dst, self.buffers[self.latest])
+            return True
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            stats = {"frames": self.frames}
+            if self.first_frame_at:
+                stats["first_frame_ms"] = round((self.first_frame_at - self.started_at) * 1000)
+                span = self.last_frame_at - self.first_frame_at
+                if span > 0:
+                    stats["fps"] = round((self.frames - 1) / span, 1)
+            return stats
+
+
+class RecordingHud:
+    """
+    Pre-rendered overlay for the recording preview: pulse frames of the REC dot,
+    the "REC" label and every countdown value. Each sprite is blended into its
+    own small region of interest, so the per-frame HUD cost is a few small
+    array copies instead of full-frame clears and putText calls.
+    Layout is authored at 1920x1080 and scaled through the RenderTarget.
+    """
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    MAX_PULSE = 15
+
+    def __init__(self, rt, max_countdown=20):
+        self.size = rt.size
+        self.max_countdown = max_countdown
+
+        # REC dot: one sprite per pulse radius, all sharing the same region
+        center = (rt.x(100), rt.y(80))
+        max_radius = rt.thickness(25 + self.MAX_PULSE)
+        dot_rect = (center[0] - max_radius, center[1] - max_radius, 2 * max_radius + 1, 2 * max_radius + 1)
+        self.dot_sprites = [
+            self._render(dot_rect, lambda img, o, p=pulse: cv2.circle(
+                img, (center[0] - o[0], center[1] - o[1]), rt.thickness(25 + p), (0, 0, 255), -1))
+            for pulse in range(self.MAX_PULSE + 1)
+        ]
+
+        # "REC" label
+        label_org = (rt.x(140), rt.y(95))
+        label_style = (rt.font(1.2), rt.thickness(3))
+        self.label_sprite = self._render(
+            self._text_rect("REC", label_org, *label_style),
+            lambda img, o: cv2.putText(img, "REC", (label_org[0] - o[0], label_org[1] - o[1]),
+                                       self.FONT, label_style[0], (255, 255, 255), label_style[1]))
+
+        # Countdown digits, all in one region sized for the widest value
+        count_org = (rt.x(1750), rt.y(1030))
+        count_style = (rt.font(3), rt.thickness(6))
+        rects = [self._text_rect(str(n), count_org, *count_style) for n in range(max_countdown + 1)]
+        left = min(r[0] for r in rects)
+        top = min(r[1] for r in rects)
+        count_rect = (left, top, max(r[0] + r[2] for r in rects) - left, max(r[1] + r[3] for r in rects) - top)
+        self.countdown_sprites = [
+            self._render(count_rect, lambda img, o, text=str(n): cv2.putText(
+                img, text, (count_org[0] - o[0], count_org[1] - o[1]),
+                self.FONT, count_style[0], (255, 255, 255), count_style[1]))
+            for n in range(max_countdown + 1)
+        ]
+
+    def _text_rect(self, text, org, scale, thickness):
+        (text_w, text_h), baseline = cv2.getTextSize(text, self.FONT, scale, thickness)
+        return (org[0] - thickness, org[1] - text_h - thickness,
+                text_w + 2 * thickness, text_h + baseline + 2 * thickness)
+
+    def _render(self, rect, draw):
+        """Rasterizes draw() into a sprite for rect (x, y, w, h), clipped to the screen."""
+        x, y, w, h = rect
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.size[0], x + w), min(self.size[1], y + h)
+        img = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        draw(img, (x0, y0))
+        # Full 3-channel mask: np.copyto with a broadcast mask is several times slower
+        mask = np.repeat(img.any(axis=2, keepdims=True), 3, axis=2)
+        return (y0, y1, x0, x1, img, mask)
+
+    def clear(self, frame):
+        """Blacks out the regions whose content changes between frames."""
+        for y0, y1, x0, x1, _, _ in (self.dot_sprites[0], self.countdown_sprites[0]):
+            frame[y0:y1, x0:x1] = 0
+
+    def draw(self, frame, pulse, remaining):
+        for y0, y1, x0, x1, img, mask in (self.dot_sprites[min(pulse, self.MAX_PULSE)],
+                                          self.label_sprite,
+                                          self.countdown_sprites[min(remaining, self.max_countdown)]):
+            np.copyto(frame[y0:y1, x0:x1], img, where=mask)
+
+
+# Shared by MediaManager and PhoneDisplay, they all draw into the same window.
+# MediaManager sizes both to the detected display resolution at startup.
+render_target = RenderTarget(*DEFAULT_RESOLUTION)
+frame_pool = FrameBufferPool(*DEFAULT_RESOLUTION)
+image_cache = ImageCache()
+# Display-native transcodes of the assets (built by asset_pipeline.py)
+asset_store = AssetPipeline()
+
 class MediaManager:
     def __init__(self):
         # Add '--avcodec-hw=none' to disable hardware acceleration which causes segfaults if v4l2m2m state is bad
@@ -32,7 +465,39 @@ class MediaManager:
             '--avcodec-hw=none'
         ) if VLC_AVAILABLE else None
         self.player = self.vlc_instance.media_player_new() if self.vlc_instance else None
+        # Plays chained clips back-to-back on the same player (see play_sequence)
+        self.list_player = self.vlc_instance.media_list_player_new() if self.vlc_instance else None
+        if self.list_player:
+            self.list_player.set_media_player(self.player)
+        self.media_cache = {}
+        self.latency = {"start": LatencyHistogram(), "end": LatencyHistogram(), "interrupt": LatencyHistogram()}
+        self.recording_hud = None
         self.camera = None
+
+        # Render everything at the real output resolution instead of letting
+        # the window system downscale 1920x1080 frames
+        self.render_target = render_target
+        self.render_target.configure(*detect_display_resolution())
+        self.frame_pool = frame_pool
+        self.frame_pool.resize(self.render_target.width, self.render_target.height)
+        self.image_cache = image_cache
+        self.assets = asset_store
+
+        # Test-decode every playback video once (results are cached on disk) so a
+        # failing clip steps down a decoder fallback ladder instead of rebooting.
+        # Runs in the background: clips play with the default decoder meanwhile.
+        self.preflight = CodecPreflight()
+        if self.vlc_instance:
+            self.preflight.start([self.assets.resolve(p) for p in PLAYBACK_VIDEO_PATHS])
+
+        # Decode the standby and phone screen images up front so screen
+        # transitions never touch the SD card
+        from config import (STANDBY_IMAGE_PATH, CHRISTMAS_BG_PATH, INTRO_VIDEO_PATH,
+                            INTRO_VIDEO_2_PATH, ASK_PHONE_VIDEO_PATH, GOODBYE_VIDEO_PATH)
+        self.image_cache.preload([self.assets.resolve(STANDBY_IMAGE_PATH), self.assets.resolve(CHRISTMAS_BG_PATH)],
+                                 (self.frame_pool.width, self.frame_pool.height))
+        # Parse the experience videos ahead of time so chained clips start immediately
+        self.preload_media([INTRO_VIDEO_PATH, INTRO_VIDEO_2_PATH, ASK_PHONE_VIDEO_PATH, GOODBYE_VIDEO_PATH])
         
         # Initialize Persistent Window
         try:
@@ -47,8 +512,7 @@ class MediaManager:
     def show_black_screen(self):
         """Helper to show a black screen on the persistent window."""
         try:
-            black_img = np.zeros((1080, 1920, 3), dtype=np.uint8)
-            cv2.imshow(WINDOW_NAME, black_img)
+            cv2.imshow(WINDOW_NAME, self.frame_pool.black)
             cv2.waitKey(1)
         except Exception as e:
             logging.warning(f"Failed to show black screen: {e}")
@@ -73,7 +537,134 @@ class MediaManager:
             pass
         return False
 
-    def play_video(self, video_path, check_interrupt=None):
+    def get_media(self, video_path, options=()):
+        """Returns a (cached) VLC media object for video_path, parsing it in the background."""
+        key = (video_path, tuple(options))
+        media = self.media_cache.get(key)
+        if media is None:
+            media = self.vlc_instance.media_new(video_path)
+            for option in options:
+                media.add_option(option)
+            try:
+                media.parse_with_options(vlc.MediaParseFlag.local, 2000)
+            except Exception as e:
+                logging.debug(f"Could not pre-parse {video_path}: {e}")
+            self.media_cache[key] = media
+        return media
+
+    def preload_media(self, video_paths):
+        """Creates and pre-parses the media objects of the given videos."""
+        if not self.vlc_instance:
+            return
+        for path in video_paths:
+            path = self.assets.resolve(path)
+            ladder = self.preflight.ladder(path) if os.path.exists(path) else []
+            if ladder:
+                _, play_path, options = ladder[0]
+                self.get_media(play_path, options)
+
+    def _record_latency(self, monitor, label):
+        """Feeds one playback into the latency histograms and logs them."""
+        if monitor.playing_at:
+            self.latency["start"].record((monitor.playing_at - monitor.started_at) * 1000)
+        if monitor.outcome == "ended" and monitor.ended_at:
+            self.latency["end"].record((monitor.finished_at - monitor.ended_at) * 1000)
+        if monitor.outcome == "interrupted" and monitor.interrupted_at:
+            self.latency["interrupt"].record((monitor.finished_at - monitor.interrupted_at) * 1000)
+        for name, histogram in self.latency.items():
+            if histogram.count:
+                logging.info(f"[{label}] {name} latency: {histogram.summary()}")
+
+    def play_sequence(self, video_paths, check_interrupt=None, interrupt_event=None):
+        """
+        Plays several clips back-to-back on one player without returning to the
+        OpenCV window in between. Missing clips are skipped.
+        Returns the measured inter-clip gaps in ms.
+        """
+        clips = []
+        for path in video_paths:
+            if not os.path.exists(path):
+                logging.info(f"Video not found (skipping): {path}")
+                continue
+            path = self.assets.resolve(path)
+            ladder = self.preflight.ladder(path)
+            if not ladder:
+                logging.warning(f"No working decoder for {path} (skipping)")
+                continue
+            clips.append((path, ladder[0]))
+
+        if not clips:
+            return []
+        if len(clips) == 1 or not self.list_player:
+            for path, _ in clips:
+                self.play_video(path, check_interrupt=check_interrupt, interrupt_event=interrupt_event)
+            return []
+
+        logging.info(f"Playing sequence: {[os.path.basename(path) for path, _ in clips]}")
+        self.show_black_screen()
+
+        media_list = self.vlc_instance.media_list_new()
+        for _, (_, play_path, options) in clips:
+            media_list.add_media(self.get_media(play_path, options))
+        self.list_player.set_media_list(media_list)
+
+        monitor = PlaybackMonitor(self.player, self.list_player, interrupt_event)
+        try:
+            self.player.set_fullscreen(True)
+            self.list_player.play()
+            outcome = monitor.wait(check_interrupt)
+        finally:
+            monitor.detach()
+
+        if outcome == "interrupted":
+            logging.info("Video sequence interrupted.")
+
+        self.list_player.stop()
+        if outcome == "error":
+            # Replay the failing clip and the rest one by one, down the fallback ladder
+            failed_index = min(monitor.clips_ended, len(clips) - 1)
+            failed_path, (label, _, _) = clips[failed_index]
+            logging.error(f"VLC error in sequence at {os.path.basename(failed_path)} (decoder '{label}')")
+            self.preflight.report_failure(failed_path, label)
+            for path, _ in clips[failed_index:]:
+                self.play_video(path, check_interrupt=check_interrupt, interrupt_event=interrupt_event)
+            return monitor.gaps_ms
+
+        self.player.set_fullscreen(False)
+        self.show_black_screen()
+        time.sleep(0.1)
+
+        self._record_latency(monitor, "sequence")
+        if monitor.gaps_ms:
+            logging.info(f"Sequence finished. Inter-clip gaps: {', '.join(f'{g:.0f} ms' for g in monitor.gaps_ms)}")
+        else:
+            logging.info("Sequence finished")
+        return monitor.gaps_ms
+
+    def _play_media(self, media, check_interrupt=None, interrupt_event=None):
+        """Plays one media object fullscreen. Returns the finished PlaybackMonitor."""
+        self.player.set_media(media)
+        self.player.set_fullscreen(True)
+
+        monitor = PlaybackMonitor(self.player, interrupt_event=interrupt_event)
+        try:
+            self.player.play()
+            monitor.wait(check_interrupt)
+        finally:
+            monitor.detach()
+        self.player.stop()
+        return monitor
+
+    def play_video(self, video_path, check_interrupt=None, interrupt_event=None):
+        """
+        Plays a video fullscreen and blocks until it ends, fails or is interrupted.
+        Completion comes from VLC events. Triggers that set 'interrupt_event'
+        (an InterruptEvent) wake the wait immediately, while 'check_interrupt'
+        is only polled for sources that cannot push events (keyboard).
+        If the clip fails to decode, the next rung of the codec preflight
+        fallback ladder is tried (other decoder options, then a safe copy);
+        when none is left the clip is skipped.
+        """
         if not os.path.exists(video_path):
             # logging.error(f"Video file not found: {video_path}") 
             # Silent fail or just log warning? User said "omit it" for intro 2. 
@@ -81,53 +672,35 @@ class MediaManager:
             logging.info(f"Video not found (skipping): {video_path}")
             return
 
+        video_path = self.assets.resolve(video_path)
         logging.info(f"Playing video: {video_path}")
         if self.player:
             # Ensure background is valid before launching VLC on top
             self.show_black_screen()
             
-            media = self.vlc_instance.media_new(video_path)
-            self.player.set_media(media)
-            self.player.set_fullscreen(True)
-            self.player.play()
-            
-            # Wait for video to slightly start to avoid immediate "Ended" state
-            time.sleep(0.5) 
-            
-            while True:
-                state = self.player.get_state()
-                if state == vlc.State.Ended:
-                    break
-                if state == vlc.State.Error:
-                    logging.error("VLC Error detected!")
-                    try:
-                        # Attempt to stop player first
-                        self.player.stop()
-                    except:
-                        pass
-                    
-                    logging.critical("CRITICAL: Video playback failed due to hardware/codec state.")
-                    logging.critical("Initiating SYSTEM REBOOT in 5 seconds to recover...")
-                    time.sleep(5)
-                    os.system("sudo reboot")
+            monitor = None
+            for label, play_path, options in self.preflight.ladder(video_path):
+                monitor = self._play_media(self.get_media(play_path, options), check_interrupt, interrupt_event)
+                if monitor.outcome != "error":
                     break
-                
-                # Check interruption
-                if check_interrupt and check_interrupt():
-                    logging.info("Video playback interrupted.")
-                    self.player.stop()
-                    break
-                
-                time.sleep(0.1)
+                logging.error(f"VLC error playing {os.path.basename(video_path)} with decoder '{label}', "
+                              f"stepping down the fallback ladder")
+                self.preflight.report_failure(video_path, label)
+            else:
+                logging.error(f"No working decoder left for {video_path}, skipping it")
+
+            if monitor and monitor.outcome == "interrupted":
+                logging.info("Video playback interrupted.")
             
-            # Properly release fullscreen and stop
+            # Properly release fullscreen
             self.player.set_fullscreen(False)
-            self.player.stop()
             
             # Immediately show black screen again to prevent desktop flash
             self.show_black_screen()
              # Give window system time to clean up
             time.sleep(0.1) 
+            if monitor:
+                self._record_latency(monitor, os.path.basename(video_path))
             logging.info("Video playback finished")
         else:
             logging.info("Mock playing video (3 seconds)...")
@@ -136,7 +709,19 @@ class MediaManager:
                 if check_interrupt and check_interrupt():
                      logging.info("Mock video interrupted")
                      return
-                time.sleep(0.1)
+                if interrupt_event and interrupt_event.wait(0.1):
+                     logging.info("Mock video interrupted")
+                     return
+                elif not interrupt_event:
+                    time.sleep(0.1)
+
+    def get_recording_hud(self, duration):
+        """Returns the pre-rendered recording HUD, built once per screen size and duration."""
+        hud = self.recording_hud
+        if hud is None or hud.size != self.render_target.size or hud.max_countdown != duration:
+            hud = RecordingHud(self.render_target, max_countdown=duration)
+            self.recording_hud = hud
+        return hud
 
     def show_image(self, image_path):
         """Displays a static image on the persistent window."""
@@ -145,10 +730,8 @@ class MediaManager:
             return
             
         try:
-            img = cv2.imread(image_path)
+            img = self.image_cache.get(self.assets.resolve(image_path), (self.frame_pool.width, self.frame_pool.height))
             if img is not None:
-                # Resize to fullscreen if needed (assuming 1920x1080)
-                img = cv2.resize(img, (1920, 1080))
                 cv2.imshow(WINDOW_NAME, img)
                 cv2.waitKey(1)
             else:
@@ -158,9 +741,11 @@ class MediaManager:
 
     def record_user(self, output_path, stop_event=None):
         """
-        Records video using FFmpeg with LIVE PREVIEW via v4l2loopback.
-        FFmpeg sends video to both file and virtual camera /dev/video10.
-        OpenCV reads from virtual camera to show real-time preview.
+        Records video using FFmpeg with a LIVE PREVIEW.
+        With PREVIEW_MODE "pipe" the same FFmpeg process also writes display-sized
+        BGR frames to stdout, read without any kernel module or color conversion.
+        With "loopback" FFmpeg sends the preview to the virtual camera
+        /dev/video10 (v4l2loopback) and OpenCV reads it from there.
         """
         logging.info(f"Starting FFMPEG recording with LIVE PREVIEW to {output_path}")
         
@@ -178,17 +763,60 @@ class MediaManager:
             
         logging.info(f"Using video device: {video_device}")
         
-        # Virtual camera for preview
+        # Virtual camera for preview (loopback mode only)
+        preview_mode = PREVIEW_MODE
         preview_device = "/dev/video10"
-        preview_available = os.path.exists(preview_device)
+        preview_available = preview_mode == "loopback" and os.path.exists(preview_device)
         
-        if not preview_available:
+        if preview_mode == "loopback" and not preview_available:
             logging.warning(f"Preview device {preview_device} not found. Recording without preview.")
         
         duration = 20
         final_output = output_path.replace(".avi", ".mp4")
+
+        # x264 settings calibrated for this machine (encoder_tuner.py), ultrafast/crf 25 otherwise
+        encoder_profile = load_encoder_profile()
+        video_encoder = encoder_args(encoder_profile)
+        logging.info(f"Encoder profile: preset={encoder_profile['preset']} crf={encoder_profile['crf']} "
+                     f"threads={encoder_profile.get('threads') or 'auto'}")
+
+        # Pipe preview size: the rotated 720x1280 image letterboxed into the screen
+        # (shared with encoder_tuner, which calibrates with the same filter graph)
+        screen_w, screen_h = self.render_target.size
+        pipe_w, pipe_h = preview_size(screen_w, screen_h)
         
-        if preview_available:
+        if preview_mode == "pipe":
+            # FFmpeg with split: one to file, one downscaled to raw BGR frames on stdout
+            cmd = [
+                'ffmpeg',
+                '-y',
+                '-f', 'v4l2',
+                '-video_size', '1280x720',
+                '-framerate', '30',
+                '-input_format', 'mjpeg',
+                '-i', video_device,
+                '-f', 'pulse',
+                '-ac', '1',
+                '-i', 'default',
+                '-t', str(duration),
+                '-filter_complex', f'[0:v]transpose=1,split=2[rec][prev];[prev]scale={pipe_w}:{pipe_h}[prevs]',
+                # Output 1: Recording to file
+                '-map', '[rec]',
+                '-map', '1:a',
+                *video_encoder,
+                '-c:a', 'aac',
+                '-b:a', '128k',
+                '-pix_fmt', 'yuv420p',
+                '-movflags', '+faststart',
+                final_output,
+                # Output 2: Display-sized preview frames on the pipe
+                '-map', '[prevs]',
+                '-t', str(duration),
+                '-f', 'rawvideo',
+                '-pix_fmt', 'bgr24',
+                'pipe:1'
+            ]
+        elif preview_available:
             # FFmpeg with split: one to file, one to virtual camera for preview
             # Using filter_complex to split video after transpose
             cmd = [
@@ -207,9 +835,7 @@ class MediaManager:
                 # Output 1: Recording to file
                 '-map', '[rec]',
                 '-map', '1:a',
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',
-                '-crf', '25',
+                *video_encoder,
                 '-c:a', 'aac',
                 '-b:a', '128k',
                 '-pix_fmt', 'yuv420p',
@@ -235,9 +861,7 @@ class MediaManager:
                 '-ac', '1',
                 '-i', 'default',
                 '-t', str(duration),
-                '-c:v', 'libx264',
-                '-preset', 'ultrafast',
-                '-crf', '25',
+                *video_encoder,
                 '-vf', 'transpose=1',
                 '-c:a', 'aac',
                 '-b:a', '128k',
@@ -252,6 +876,11 @@ class MediaManager:
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
         start_time = time.time()
+
+        pipe_reader = None
+        if preview_mode == "pipe":
+            pipe_reader = RawVideoPipeReader(proc.stdout, pipe_w, pipe_h)
+            pipe_reader.start()
         
         # Open virtual camera for preview if available (with retries)
         preview_cap = None
@@ -282,6 +911,12 @@ class MediaManager:
                 logging.warning("Could not open preview device after 5 attempts, falling back to countdown only")
         
         # Show preview with overlay while recording
+        # All per-frame buffers are reused: the screen frame comes from the pool and
+        # the capture/resize targets are allocated once, on the first frame.
+        frame = self.frame_pool.acquire(clear=True)
+        hud = self.get_recording_hud(duration)
+        capture_buf = None
+        resize_buf = None
         try:
             while proc.poll() is None:
                 elapsed = time.time() - start_time
@@ -290,47 +925,47 @@ class MediaManager:
                 # Try to get preview frame
                 preview_frame = None
                 if preview_cap:
-                    ret, preview_frame = preview_cap.read()
+                    ret, preview_frame = preview_cap.read(capture_buf)
                     if not ret or preview_frame is None:
                         preview_frame = None
+                    else:
+                        capture_buf = preview_frame
                 
-                # Create base frame (black background at screen resolution)
-                frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+                # Reset the changing HUD regions (the letterbox is overwritten below)
+                hud.clear(frame)
                 
-                if preview_frame is not None:
-                    # Maintain aspect ratio: fit vertical video (720x1280) into 1920x1080 screen
+                if pipe_reader:
+                    # Already display-sized by FFmpeg: a single copy into the letterbox
+                    x_offset = (screen_w - pipe_w) // 2
+                    y_offset = (screen_h - pipe_h) // 2
+                    pipe_reader.copy_latest(frame[y_offset:y_offset+pipe_h, x_offset:x_offset+pipe_w])
+                elif preview_frame is not None:
+                    # Maintain aspect ratio: fit vertical video (720x1280) into the horizontal screen
                     # Video is 720w x 1280h (9:16 vertical)
-                    # Screen is 1920w x 1080h (16:9 horizontal)
-                    # Scale video to fit height (1080), width will be 720 * (1080/1280) = 607.5
+                    # Screen is e.g. 1280w x 720h (16:9 horizontal)
+                    # Scale video to fit the screen height, e.g. width 720 * (720/1280) = 405
                     src_h, src_w = preview_frame.shape[:2]
                     
                     # Calculate scaling to fit within screen while maintaining aspect ratio
-                    scale = min(1920 / src_w, 1080 / src_h)
+                    scale = min(screen_w / src_w, screen_h / src_h)
                     new_w = int(src_w * scale)
                     new_h = int(src_h * scale)
                     
                     # Resize video maintaining aspect ratio
-                    resized = cv2.resize(preview_frame, (new_w, new_h))
+                    if resize_buf is None or resize_buf.shape[:2] != (new_h, new_w):
+                        resize_buf = np.empty((new_h, new_w, 3), dtype=np.uint8)
+                    resized = cv2.resize(preview_frame, (new_w, new_h), dst=resize_buf)
                     
                     # Center the video on the black background
-                    x_offset = (1920 - new_w) // 2
-                    y_offset = (1080 - new_h) // 2
+                    x_offset = (screen_w - new_w) // 2
+                    y_offset = (screen_h - new_h) // 2
                     
                     # Place the resized video on the black frame
                     frame[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = resized
                 
-                # Add overlay: Recording indicator (red circle with pulse effect)
+                # Add overlay: Recording indicator (red dot with pulse effect), "REC" and countdown
                 pulse = int(15 * abs(np.sin(time.time() * 3)))  # Pulsing effect
-                cv2.circle(frame, (100, 80), 25 + pulse, (0, 0, 255), -1)
-                
-                # "REC" text
-                cv2.putText(frame, "REC", (140, 95), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
-                
-                # Countdown in bottom right
-                countdown_text = str(remaining)
-                cv2.putText(frame, countdown_text, (1750, 1030), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 3, (255, 255, 255), 6)
+                hud.draw(frame, pulse, remaining)
                 
                 cv2.imshow(WINDOW_NAME, frame)
                 cv2.waitKey(33)  # ~30fps preview
@@ -343,6 +978,8 @@ class MediaManager:
         
         # Immediately show black screen to avoid frozen frame
         self.show_black_screen()
+        self.frame_pool.release(frame)
+        logging.info(f"Frame pool stats: {self.frame_pool.stats()}")
         
         # Cleanup preview
         if preview_cap:
@@ -351,7 +988,12 @@ class MediaManager:
         # Wait for FFmpeg to finish (reduced timeout, non-blocking feel)
         try:
             # Give FFmpeg just 2 seconds to finish gracefully
-            stdout, stderr = proc.communicate(timeout=2)
+            if pipe_reader:
+                # stdout is being drained by the pipe reader thread
+                proc.wait(timeout=2)
+                stderr = proc.stderr.read()
+            else:
+                stdout, stderr = proc.communicate(timeout=2)
             if proc.returncode != 0:
                 logging.warning(f"FFmpeg exit code: {proc.returncode}")
                 logging.debug(f"FFmpeg stderr: {stderr.decode() if stderr else 'none'}")
@@ -363,6 +1005,10 @@ class MediaManager:
             except:
                 proc.kill()
             logging.info("FFmpeg terminated")
+
+        if pipe_reader:
+            pipe_reader.join(timeout=1)
+            logging.info(f"Pipe preview stats: {pipe_reader.stats()}")
             
         logging.info("Recording finished.")
 
@@ -472,6 +1118,97 @@ class MediaManager:
         # Deprecated: Use PhoneDisplay class instead
         pass
 
+class PhoneScreenCompositor:
+    """
+    Layered renderer for the phone dictation screen.
+    The background and the fixed instructions are rasterized once into a static
+    layer. Only the number and status bands are restored from that layer and
+    redrawn when their text actually changes.
+    """
+    FONT = cv2.FONT_HERSHEY_SIMPLEX
+    ALL_GLYPHS = "".join(chr(c) for c in range(32, 127))
+
+    # (text, font_scale, thickness, color, y) - y < 0 means offset from the bottom
+    STATIC_TEXTS = [
+        ("Dicta 1 numero a la vez", 2.0, 4, (255, 255, 255), 120),
+        ("(para facilitar el dictado)", 1.2, 2, (200, 200, 200), 170),
+        ("Di 'Borrar' para corregir  |  Di 'Confirmar' para finalizar  |  Di 'Borrar Todo' para reiniciar",
+         1.0, 2, (200, 200, 200), -120),
+    ]
+    NUMBER_STYLE = (5, 10, (255, 255, 255))
+    STATUS_STYLE = (2, 4, (220, 220, 220))
+    STATUS_OFFSET = 150
+
+    def __init__(self, background, pool=None):
+        self.pool = pool or frame_pool
+        self.width = self.pool.width
+        self.height = self.pool.height
+        # Layout constants are authored at 1920x1080 and scaled to the frame size
+        self.layout = RenderTarget(self.width, self.height)
+        self.static_layer = self._build_static_layer(background)
+        self.frame = self.pool.acquire()
+        np.copyto(self.frame, self.static_layer)
+        self.number = None
+        self.status = None
+        self.number_y = self.height // 2
+        self.status_y = self.height // 2 + self.layout.y(self.STATUS_OFFSET)
+        self.number_band = self._text_band(self.number_y, *self.NUMBER_STYLE[:2])
+        self.status_band = self._text_band(self.status_y, *self.STATUS_STYLE[:2])
+
+    def _build_static_layer(self, background):
+        layer = self.pool.acquire()
+        np.copyto(layer, background)
+        for text, scale, thickness, color, y in self.STATIC_TEXTS:
+            y = self.layout.y(y)
+            if y < 0:
+                y = self.height + y
+            self._put_centered(layer, text, y, scale, thickness, color)
+        return layer
+
+    def _text_band(self, baseline_y, scale, thickness):
+        """Rows [top, bottom) covered by any text drawn on baseline_y with this style."""
+        scale, thickness = self.layout.font(scale), self.layout.thickness(thickness)
+        # Every printable ASCII glyph (putText draws anything else as '?'), so the
+        # tallest ascender and the deepest descender are both counted
+        (_, text_h), baseline = cv2.getTextSize(self.ALL_GLYPHS, self.FONT, scale, thickness)
+        top = max(0, baseline_y - text_h - thickness)
+        bottom = min(self.height, baseline_y + baseline + thickness)
+        return top, bottom
+
+    def _put_centered(self, img, text, y, scale, thickness, color):
+        """Draws text centered horizontally. scale/thickness are in 1920x1080 units."""
+        scale, thickness = self.layout.font(scale), self.layout.thickness(thickness)
+        text_w = cv2.getTextSize(text, self.FONT, scale, thickness)[0][0]
+        x = (self.width - text_w) // 2
+        cv2.putText(img, text, (x, y), self.FONT, scale, color, thickness)
+
+    def _redraw_band(self, band, text, y, style):
+        top, bottom = band
+        self.frame[top:bottom] = self.static_layer[top:bottom]
+        if text:
+            scale, thickness, color = style
+            self._put_centered(self.frame, text, y, scale, thickness, color)
+
+    def render(self, number, status):
+        """Updates the dirty regions. Returns True if the frame changed."""
+        dirty = False
+        if number != self.number:
+            self.number = number
+            self._redraw_band(self.number_band, number, self.number_y, self.NUMBER_STYLE)
+            dirty = True
+        if status != self.status:
+            self.status = status
+            self._redraw_band(self.status_band, status, self.status_y, self.STATUS_STYLE)
+            dirty = True
+        return dirty
+
+    def release(self):
+        """Returns the layer buffers to the pool."""
+        self.pool.release(self.frame)
+        self.pool.release(self.static_layer)
+        self.frame = self.static_layer = None
+
+
 class PhoneDisplay:
     def __init__(self):
         self.number = ""
@@ -479,6 +1216,7 @@ class PhoneDisplay:
         self.running = True
         self.confirmed = False
         self.lock = threading.Lock()
+        self.dirty = True
         self.window_name = WINDOW_NAME # Use the shared window
         
     def run(self):
@@ -486,19 +1224,17 @@ class PhoneDisplay:
             logging.info("PhoneDisplay started on main thread")
             from config import CHRISTMAS_BG_PATH
             
-            # Load Background
+            # Load Background (normally already preloaded by MediaManager)
             bg_img = None
             if os.path.exists(CHRISTMAS_BG_PATH):
-                logging.info(f"Loading Christmas background from {CHRISTMAS_BG_PATH}")
-                bg_img_raw = cv2.imread(CHRISTMAS_BG_PATH)
-                if bg_img_raw is not None:
-                     bg_img = cv2.resize(bg_img_raw, (1920, 1080))
+                bg_img = image_cache.get(asset_store.resolve(CHRISTMAS_BG_PATH), (frame_pool.width, frame_pool.height))
             
             if bg_img is None:        
                 logging.warning("Background not found or failed to load, using black")
-                bg_img = np.zeros((1080, 1920, 3), dtype=np.uint8)
+                bg_img = frame_pool.black
 
-            font = cv2.FONT_HERSHEY_SIMPLEX
+            # Static layers (background + fixed instructions) are rasterized once here
+            compositor = PhoneScreenCompositor(bg_img)
             
             # Ensure window properties (just in case)
             cv2.setWindowProperty(self.window_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
@@ -506,62 +1242,15 @@ class PhoneDisplay:
             logging.info("Starting PhoneDisplay render loop")
             
             while self.running:
-                img = bg_img.copy()
-                
                 with self.lock:
                     current_number = self.number
                     current_status = self.status
+                    dirty = self.dirty
+                    self.dirty = False
                 
-                # 1. Draw Phone Number
-                if current_number:
-                    font_scale_num = 5
-                    thickness_num = 10
-                    text_size_num = cv2.getTextSize(current_number, font, font_scale_num, thickness_num)[0]
-                    text_x_num = (img.shape[1] - text_size_num[0]) // 2
-                    text_y_num = (img.shape[0] // 2)
-                    cv2.putText(img, current_number, (text_x_num, text_y_num), font, font_scale_num, (255, 255, 255), thickness_num)
-                
-                # 2. Draw Status/Instruction
-                font_scale_inst = 2
-                thickness_inst = 4
-                text_size_inst = cv2.getTextSize(current_status, font, font_scale_inst, thickness_inst)[0]
-                text_x_inst = (img.shape[1] - text_size_inst[0]) // 2
-                text_y_inst = (img.shape[0] // 2) + 150
-                cv2.putText(img, current_status, (text_x_inst, text_y_inst), font, font_scale_inst, (220, 220, 220), thickness_inst)
-
-                # 3. Focus Instruction (Blinking) - REMOVED AS REQUESTED
-                # if int(time.time() * 2) % 2 == 0:
-                #    pass
-
-                # 4. Instructions (Bottom Fixed)
-                # "Di 'Borrar' para corregir | Di 'Confirmar' para terminar | Di 'Borrar Todo' para reiniciar"
-                instr_text = "Di 'Borrar' para corregir  |  Di 'Confirmar' para finalizar  |  Di 'Borrar Todo' para reiniciar"
-                font_scale_i = 1.0
-                thickness_i = 2
-                text_size_i = cv2.getTextSize(instr_text, font, font_scale_i, thickness_i)[0]
-                text_x_i = (img.shape[1] - text_size_i[0]) // 2
-                text_y_i = (img.shape[0]) - 120
-                cv2.putText(img, instr_text, (text_x_i, text_y_i), font, font_scale_i, (200, 200, 200), thickness_i)
-
-                # 5. Top Instruction (Centered)
-                top_text = "Dicta 1 numero a la vez"
-                font_scale_top = 2.0
-                thickness_top = 4
-                text_size_top = cv2.getTextSize(top_text, font, font_scale_top, thickness_top)[0]
-                text_x_top = (img.shape[1] - text_size_top[0]) // 2
-                text_y_top = 120
-                cv2.putText(img, top_text, (text_x_top, text_y_top), font, font_scale_top, (255, 255, 255), thickness_top)
-                
-                # Subtext
-                sub_text = "(para facilitar el dictado)"
-                font_scale_sub = 1.2
-                thickness_sub = 2
-                text_size_sub = cv2.getTextSize(sub_text, font, font_scale_sub, thickness_sub)[0]
-                text_x_sub = (img.shape[1] - text_size_sub[0]) // 2
-                text_y_sub = 170
-                cv2.putText(img, sub_text, (text_x_sub, text_y_sub), font, font_scale_sub, (200, 200, 200), thickness_sub)
-
-                cv2.imshow(self.window_name, img)
+                # Only push a new frame when the number or status actually changed
+                if dirty and compositor.render(current_number, current_status):
+                    cv2.imshow(self.window_name, compositor.frame)
                 
                 # Make sure it stays fullscreen (sometimes OS tries to shrink it)
                 if int(time.time()) % 5 == 0:
@@ -580,27 +1269,34 @@ class PhoneDisplay:
                 elif key == 8: # Backspace
                     with self.lock:
                         self.number = self.number[:-1]
+                        self.dirty = True
                 elif 48 <= key <= 57: # 0-9
                     with self.lock:
                         self.number += chr(key)
+                        self.dirty = True
             
             logging.info("PhoneDisplay loop ended")
             # Do NOT destroy window.
             # Just clear it to black
-            black_img = np.zeros((1080, 1920, 3), dtype=np.uint8)
-            cv2.imshow(self.window_name, black_img)
+            cv2.imshow(self.window_name, frame_pool.black)
             cv2.waitKey(1)
+            compositor.release()
+            logging.info(f"Frame pool stats: {frame_pool.stats()}")
             
         except Exception as e:
             logging.error(f"Error in PhoneDisplay: {e}", exc_info=True)
 
     def update_number(self, number):
         with self.lock:
-            self.number = number
+            if number != self.number:
+                self.number = number
+                self.dirty = True
 
     def set_status(self, status):
         with self.lock:
-            self.status = status
+            if status != self.status:
+                self.status = status
+                self.dirty = True
 
     def stop(self):
         self.running = False
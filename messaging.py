@@ -1,54 +1,208 @@
+import os
 import logging
 import requests
 import json
+import time
+import threading
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+
+from config import MESSAGING_SERVER_URL
+from delivery import upload_throughput
+
+# Outcome of one request to the messaging server. 'retryable' is False for
+# errors that another attempt cannot fix (bad request). 'attempted' is False
+# when the WhatsApp client was not ready and no upload was started.
+SendResult = namedtuple("SendResult", ["ok", "status_code", "error", "retryable", "latency_ms", "attempted"],
+                        defaults=(None, True))
+
+# How long a /health answer is trusted
+READY_TTL = 30.0
+NOT_READY_TTL = 5.0
+HEALTH_TIMEOUT = 2.0
+SUBMIT_TIMEOUT = 10      # /send-welcome only queues the job and answers 202
+SEND_TIMEOUT = 180       # Upper bound for a queued job to finish (large video uploads)
+JOB_POLL_INTERVAL = 1.0
+
+def normalize_phone_number(phone_number):
+    # Clean number
+    phone_number = ''.join(filter(str.isdigit, phone_number))
+
+    # Handle Mexico '01' prefix
+    if phone_number.startswith("01") and len(phone_number) > 10:
+        phone_number = phone_number[2:]
+
+    # Ensure phone number has country code (Default Colombia 57 if length is 10)
+    # Assuming usually 10 digits for local (3xx xxx xxxx)
+    if len(phone_number) == 10:
+        from config import PHONE_COUNTRY_CODE
+        phone_number = PHONE_COUNTRY_CODE + phone_number
+    return phone_number
 
 class MessagingService:
+    """
+    Client of messaging/server.js. One keep-alive session is shared by every
+    request, the server's readiness is cached from its /health probe, and
+    submit() sends on a small thread pool so callers never block.
+    """
+    def __init__(self, base_url=MESSAGING_SERVER_URL, max_workers=2):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers + 1)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'Content-type': 'application/json'})
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="messaging")
+
+        self.lock = threading.Lock()
+        self.ready = None
+        self.ready_checked_at = 0.0
+        self.latencies_ms = deque(maxlen=200)
+        self.outcomes = {}
+
+    # ---- Readiness ----
+
+    def _set_ready(self, ready):
+        with self.lock:
+            self.ready = ready
+            self.ready_checked_at = time.time()
+
+    def is_ready(self, refresh=False):
+        """Cached readiness of the WhatsApp client, refreshed through GET /health."""
+        with self.lock:
+            ttl = READY_TTL if self.ready else NOT_READY_TTL
+            if not refresh and self.ready is not None and time.time() - self.ready_checked_at < ttl:
+                return self.ready
+        try:
+            response = self.session.get(f"{self.base_url}/health", timeout=HEALTH_TIMEOUT)
+            ready = response.status_code == 200 and bool(response.json().get("ready"))
+        except (requests.exceptions.RequestException, ValueError):
+            ready = False
+        if ready != self.ready:
+            logging.info(f"Messaging server {'ready' if ready else 'not ready'}")
+        self._set_ready(ready)
+        return ready
+
+    # ---- Sending ----
+
     def send_welcome_message(self, phone_number, video_path=None):
+        return self.deliver(phone_number, video_path).ok
+
+    def submit(self, phone_number, video_path=None, key=None):
+        """Sends in the background. Returns a Future resolving to a SendResult (with latency_ms)."""
+        return self.executor.submit(self.deliver, phone_number, video_path, key)
+
+    def deliver(self, phone_number, video_path=None, key=None):
+        """
+        Sends the welcome message through the local server and waits for the
+        server-side job to finish. Returns a SendResult. Retries that pass the
+        same 'key' reuse the server's job instead of sending twice.
+        """
+        start = time.time()
+        result = self._deliver(phone_number, video_path, key)
+        result = result._replace(latency_ms=int((time.time() - start) * 1000))
+        self._record(result)
+        return result
+
+    def _deliver(self, phone_number, video_path, key):
         logging.info(f"Preparing to send welcome message to {phone_number} via Local Server...")
-        
-        # Clean number
-        phone_number = ''.join(filter(str.isdigit, phone_number))
-        
-        # Handle Mexico '01' prefix
-        if phone_number.startswith("01") and len(phone_number) > 10:
-            phone_number = phone_number[2:]
-            
-        # Ensure phone number has country code (Default Colombia 57 if length is 10)
-        # Assuming usually 10 digits for local (3xx xxx xxxx)
-        if len(phone_number) == 10:
-            from config import PHONE_COUNTRY_CODE
-            phone_number = PHONE_COUNTRY_CODE + phone_number
-            
+
+        phone_number = normalize_phone_number(phone_number)
         logging.info(f"Target Phone Number: {phone_number}")
-            
+
+        if not self.is_ready():
+            # Don't start an upload the server would reject with a 503
+            return SendResult(False, 503, "WhatsApp client not ready", True, attempted=False)
+
         try:
-            # Send request to local Node.js server
-            payload = {"phoneNumber": phone_number, "videoPath": video_path}
-            headers = {'Content-type': 'application/json'}
-            
-            response = requests.post(
-                "http://localhost:3000/send-welcome", 
-                data=json.dumps(payload), 
-                headers=headers,
-                timeout=120  # Increased to 120s for large video uploads
+            # Queue the send on the local Node.js server
+            payload = {"phoneNumber": phone_number, "videoPath": video_path, "idempotencyKey": key}
+
+            response = self.session.post(
+                f"{self.base_url}/send-welcome",
+                data=json.dumps(payload),
+                timeout=SUBMIT_TIMEOUT
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                video_sent = result.get('videoSent', 'unknown')
-                logging.info(f"Success! Server responded: {result}")
-                logging.info(f"Video attached: {video_sent}")
-                return True
+
+            if response.status_code == 202:
+                self._set_ready(True)
+                return self._wait_for_job(response.json()["jobId"], video_path)
             else:
                 logging.error(f"Server Error {response.status_code}: {response.text}")
-                return False
-                
+                if response.status_code == 503:
+                    self._set_ready(False)
+                # 503 = WhatsApp client not ready yet, 5xx = send failed: both worth retrying
+                return SendResult(False, response.status_code, response.text[:200],
+                                  response.status_code >= 500, attempted=response.status_code != 503)
+
         except requests.exceptions.ConnectionError:
-            logging.error("Could not connect to Messaging Server at http://localhost:3000. Is 'node messaging/server.js' running?")
-            return False
+            logging.error(f"Could not connect to Messaging Server at {self.base_url}. Is 'node messaging/server.js' running?")
+            self._set_ready(False)
+            return SendResult(False, None, "connection refused", True)
         except requests.exceptions.Timeout:
+            # A retry with the same key picks up the job if the server did queue it
             logging.warning("Request timed out, but message may still be sending in background")
-            return False
+            return SendResult(False, None, "timeout", True)
         except Exception as e:
             logging.error(f"Error sending message request: {e}")
-            return False
+            return SendResult(False, None, str(e), True)
+
+    def _wait_for_job(self, job_id, video_path=None):
+        """Polls GET /jobs/<id> until the server finishes the send."""
+        deadline = time.time() + SEND_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(JOB_POLL_INTERVAL)
+            response = self.session.get(f"{self.base_url}/jobs/{job_id}", timeout=SUBMIT_TIMEOUT)
+            if response.status_code == 404:
+                # Server restarted and lost the job: send again
+                return SendResult(False, 404, f"job {job_id} lost", True)
+            job = response.json()
+            if job["status"] == "sent":
+                logging.info(f"Success! Job {job_id} sent, video attached: {job.get('videoSent')} "
+                             f"(server timings: {job.get('timings')})")
+                upload_ms = (job.get("timings") or {}).get("uploadMs")
+                if job.get("videoSent") and upload_ms and video_path and os.path.exists(video_path):
+                    # Feeds the size target of the next delivery renditions
+                    upload_throughput.record(os.path.getsize(video_path), upload_ms)
+                return SendResult(True, 200, None, False)
+            if job["status"] == "failed" and job.get("notReady"):
+                # The client dropped before the job started: same as the 503 refusal
+                logging.warning(f"Server job {job_id} not started: {job.get('error')}")
+                self._set_ready(False)
+                return SendResult(False, 503, job.get("error"), True, attempted=False)
+            if job["status"] == "failed":
+                logging.error(f"Server job {job_id} failed: {job.get('error')}")
+                return SendResult(False, 500, job.get("error"), job.get("retryable", True))
+        logging.warning(f"Job {job_id} still running after {SEND_TIMEOUT}s, will check again on retry")
+        return SendResult(False, None, "timeout", True)
+
+    # ---- Metrics ----
+
+    def _record(self, result):
+        outcome = "sent" if result.ok else (str(result.status_code) if result.status_code else result.error)
+        with self.lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if result.ok:
+                self.latencies_ms.append(result.latency_ms)
+        if result.ok:
+            stats = self.stats()
+            logging.info(f"Send latency {result.latency_ms} ms "
+                         f"(p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms over {stats['samples']} sends)")
+
+    def stats(self):
+        """p50/p95 latency of the recent successful sends, and the count of each outcome."""
+        with self.lock:
+            samples = sorted(self.latencies_ms)
+            outcomes = dict(self.outcomes)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+        return {"samples": len(samples), "p50_ms": percentile(50), "p95_ms": percentile(95),
+                "outcomes": outcomes}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -80,6 +80,11 @@ client.on('ready', () => {
     isClientReady = true;
 });
 
+client.on('disconnected', (reason) => {
+    console.warn('WhatsApp Client disconnected:', reason);
+    isClientReady = false;
+});
+
 client.on('authenticated', () => {
     console.log('WhatsApp Authenticated successfully.');
 });
@@ -89,41 +94,171 @@ client.on('auth_failure', payload => {
 });
 
 // --- Chatbot Logic ---
+// Most visitors send near-identical thank-you messages. Replies are cached by normalized
+// text, each chat is rate limited, and model calls go through a small bounded queue.
+// Replies wait while welcome sends are queued or running so they never delay a video.
+const REPLY_CACHE_TTL_MS = 6 * 60 * 60 * 1000;
+const REPLY_CACHE_MAX = 200;
+const REPLY_CACHE_MAX_CHARS = 80;            // Longer messages are personal, not worth caching
+const REPLY_RATE_LIMIT = 4;                  // Replies per chat...
+const REPLY_RATE_WINDOW_MS = 60 * 1000;      // ...per window
+const MODEL_CONCURRENCY = Math.max(1, parseInt(process.env.MODEL_CONCURRENCY || '1', 10));
+const MODEL_QUEUE_MAX = 10;                  // Waiting model calls beyond this are dropped
+const REPLY_MAX_DEFER_MS = 30 * 1000;
+
+const replyCache = new Map();                // normalized text -> { text, at }, oldest first
+const pendingReplies = new Map();            // normalized text -> Promise of the model reply
+const chatReplyTimes = new Map();            // chatId -> timestamps of recent replies
+const modelQueue = [];
+let activeModelCalls = 0;
+const replyStats = { received: 0, cacheHits: 0, coalesced: 0, modelCalls: 0, rateLimited: 0, dropped: 0, deferredMs: 0 };
+
+function normalizeMessage(text) {
+    return (text || '')
+        .normalize('NFD').replace(/[\u0300-\u036f]/g, '')   // Accents
+        .toLowerCase()
+        .replace(/[^a-z0-9 ]+/g, ' ')                // Punctuation, emoji
+        .replace(/\s+/g, ' ')
+        .trim();
+}
+
+function getCachedReply(key) {
+    const entry = replyCache.get(key);
+    if (!entry) return null;
+    if (Date.now() - entry.at > REPLY_CACHE_TTL_MS) {
+        replyCache.delete(key);
+        return null;
+    }
+    return entry.text;
+}
+
+function cacheReply(key, text) {
+    replyCache.delete(key);
+    replyCache.set(key, { text, at: Date.now() });
+    while (replyCache.size > REPLY_CACHE_MAX) replyCache.delete(replyCache.keys().next().value);
+}
+
+function allowReply(chatId) {
+    const now = Date.now();
+    const recent = (chatReplyTimes.get(chatId) || []).filter(t => now - t < REPLY_RATE_WINDOW_MS);
+    if (recent.length >= REPLY_RATE_LIMIT) {
+        chatReplyTimes.set(chatId, recent);
+        return false;
+    }
+    recent.push(now);
+    chatReplyTimes.set(chatId, recent);
+    // Forget idle chats
+    if (chatReplyTimes.size > 1000) {
+        for (const [id, times] of chatReplyTimes) {
+            if (times.every(t => now - t >= REPLY_RATE_WINDOW_MS)) chatReplyTimes.delete(id);
+        }
+    }
+    return true;
+}
+
+// Runs fn when a model slot is free. Rejects at once if too many calls are waiting.
+function queueModelCall(fn) {
+    if (modelQueue.length >= MODEL_QUEUE_MAX) {
+        return Promise.reject(new Error('model queue full'));
+    }
+    return new Promise((resolve, reject) => {
+        modelQueue.push({ fn, resolve, reject });
+        pumpModelQueue();
+    });
+}
+
+function pumpModelQueue() {
+    while (activeModelCalls < MODEL_CONCURRENCY && modelQueue.length > 0) {
+        const { fn, resolve, reject } = modelQueue.shift();
+        activeModelCalls++;
+        fn().then(resolve, reject).finally(() => {
+            activeModelCalls--;
+            pumpModelQueue();
+        });
+    }
+}
+
+async function generateReply(text) {
+    replyStats.modelCalls++;
+    const response = await openai.chat.completions.create({
+        model: "gpt-4o-mini", // Cost efficient and fast
+        messages: [
+            { role: "system", content: SYSTEM_PROMPT },
+            { role: "user", content: text }
+        ],
+        max_tokens: 150,
+        temperature: 0.7
+    });
+    return response.choices[0].message.content;
+}
+
+// Cached reply, the in-flight model call for the same text, or a new queued call
+function getReply(text) {
+    const key = normalizeMessage(text);
+    const cacheable = key.length > 0 && key.length <= REPLY_CACHE_MAX_CHARS;
+    if (cacheable) {
+        const cached = getCachedReply(key);
+        if (cached) {
+            replyStats.cacheHits++;
+            return Promise.resolve(cached);
+        }
+        if (pendingReplies.has(key)) {
+            replyStats.coalesced++;
+            return pendingReplies.get(key);
+        }
+    }
+
+    const promise = queueModelCall(() => generateReply(text));
+    if (cacheable) {
+        pendingReplies.set(key, promise);
+        promise
+            .then(reply => cacheReply(key, reply), () => {})
+            .finally(() => pendingReplies.delete(key));
+    }
+    return promise;
+}
+
+// Lets queued welcome sends use the client first (bounded wait)
+async function yieldToSends() {
+    const start = Date.now();
+    while (sendsPending() && Date.now() - start < REPLY_MAX_DEFER_MS) {
+        await new Promise(r => setTimeout(r, 500));
+    }
+    replyStats.deferredMs += Date.now() - start;
+}
+
 client.on('message', async msg => {
     // Ignore status updates, self messages, or group messages (optional)
     if (msg.from.includes('status') || msg.fromMe) return;
 
     console.log(`Message received from ${msg.from}: ${msg.body}`);
+    replyStats.received++;
 
     if (!openai) return;
 
-    try {
-        // Simple delay to make it feel natural
-        await new Promise(r => setTimeout(r, 1000));
+    if (!allowReply(msg.from)) {
+        replyStats.rateLimited++;
+        console.log(`Rate limit: not replying to ${msg.from}`);
+        return;
+    }
 
+    try {
         // Show "typing..." state
         const chat = await msg.getChat();
         await chat.sendStateTyping();
 
-        const response = await openai.chat.completions.create({
-            model: "gpt-4o-mini", // Cost efficient and fast
-            messages: [
-                { role: "system", content: SYSTEM_PROMPT },
-                { role: "user", content: msg.body }
-            ],
-            max_tokens: 150,
-            temperature: 0.7
-        });
-
-        const replyText = response.choices[0].message.content;
-
-        // Clear typing state not strictly necessary as sending message clears it, but good practice
-        // await chat.clearStateTyping(); 
+        const replyText = await getReply(msg.body);
+        await yieldToSends();
 
         console.log(`Replying: ${replyText}`);
         await msg.reply(replyText);
 
     } catch (error) {
+        if (error.message === 'model queue full') {
+            replyStats.dropped++;
+            console.warn(`Model queue full, not replying to ${msg.from}`);
+            return;
+        }
         console.error("Error calling OpenAI or sending reply:", error);
     }
 });
@@ -131,115 +266,394 @@ client.on('message', async msg => {
 
 // --- Python API Endpoints ---
 
-// Endpoint to send the welcome message
-app.post('/send-welcome', async (req, res) => {
-    const { phoneNumber, videoPath } = req.body;
+// Readiness probe: answers immediately, without touching the WhatsApp client
+app.get('/health', (req, res) => {
+    res.json({ ready: isClientReady, uptime: Math.round(process.uptime()) });
+});
 
-    if (!isClientReady) {
-        console.warn("API Request blocked: Client not ready yet.");
-        return res.status(503).json({ success: false, error: "WhatsApp Client is not ready yet. Please wait a moment." });
+// --- ACK Tracking ---
+// One global message_ack listener dispatches to the messages we sent, by id, instead of
+// one closure per send. Tracked messages also feed server/delivered/read latency stats.
+const ACK_SERVER = 1, ACK_DELIVERED = 2, ACK_READ = 3;
+const ACK_NAMES = { [ACK_SERVER]: 'server', [ACK_DELIVERED]: 'delivered', [ACK_READ]: 'read' };
+const ACK_TRACK_MAX = 500;                  // Messages followed at once (oldest dropped first)
+const ACK_TRACK_TTL_MS = 24 * 60 * 60 * 1000;
+const ACK_SAMPLES = 100;
+
+const trackedMessages = new Map();          // msgId -> { sentAt, ack, waiters: Set }
+const ackLatencies = { server: [], delivered: [], read: [] };
+const ackStats = { tracked: 0, timeouts: 0 };
+
+function trackMessage(msg) {
+    const msgId = msg.id._serialized;
+    if (trackedMessages.has(msgId)) return trackedMessages.get(msgId);
+
+    const now = Date.now();
+    for (const [id, entry] of trackedMessages) {
+        // Map keeps insertion order: stop at the first entry still worth keeping
+        if (trackedMessages.size < ACK_TRACK_MAX && now - entry.sentAt < ACK_TRACK_TTL_MS) break;
+        for (const waiter of entry.waiters) waiter.finish(null);
+        trackedMessages.delete(id);
     }
 
-    if (!phoneNumber) {
-        return res.status(400).json({ success: false, error: "phoneNumber is required" });
+    // An ACK that arrived before sendMessage resolved is already on the message
+    const entry = { sentAt: now, ack: msg.ack || 0, waiters: new Set() };
+    trackedMessages.set(msgId, entry);
+    ackStats.tracked++;
+    return entry;
+}
+
+// Resolves with the ACK level once it reaches minAck, or null after timeoutMs
+function waitForAck(msgId, minAck, timeoutMs) {
+    const entry = trackedMessages.get(msgId);
+    if (!entry) return Promise.resolve(null);
+    if (entry.ack >= minAck) return Promise.resolve(entry.ack);
+
+    return new Promise(resolve => {
+        const waiter = {
+            minAck,
+            finish(ack) {
+                clearTimeout(waiter.timer);
+                entry.waiters.delete(waiter);
+                resolve(ack);
+            }
+        };
+        waiter.timer = setTimeout(() => {
+            ackStats.timeouts++;
+            waiter.finish(null);
+        }, timeoutMs);
+        entry.waiters.add(waiter);
+    });
+}
+
+client.on('message_ack', (msg, ack) => {
+    const msgId = msg.id._serialized;
+    const entry = trackedMessages.get(msgId);
+    if (!entry || ack <= entry.ack) return;
+
+    // Record the latency of every level reached (an ACK can skip levels)
+    const elapsed = Date.now() - entry.sentAt;
+    for (let level = entry.ack + 1; level <= ack; level++) {
+        const samples = ackLatencies[ACK_NAMES[level]];
+        if (!samples) continue;
+        samples.push(elapsed);
+        if (samples.length > ACK_SAMPLES) samples.shift();
     }
+    entry.ack = ack;
 
-    console.log(`API Request: Send welcome to ${phoneNumber} with video: ${videoPath}`);
+    for (const waiter of [...entry.waiters]) {
+        if (ack >= waiter.minAck) waiter.finish(ack);
+    }
+    // Nothing left to learn once read
+    if (ack >= ACK_READ && entry.waiters.size === 0) trackedMessages.delete(msgId);
+});
 
-    try {
-        // Standardize format to ID
-        // Assuming input is like "573001234567"
-        let chatId = phoneNumber.replace(/\D/g, "") + "@c.us";
-
-        // Check if number is registered (optional validation)
-        let finalId = chatId;
-        try {
-            // Attempt to verify registration to avoid invalid ID errors
-            const isRegistered = await client.isRegisteredUser(chatId);
-            if (!isRegistered) {
-                console.warn(`Number ${chatId} not registered on WhatsApp.`);
-                // Still try to send, sometimes verification fails but sending works
-            }
-        } catch (verErr) {
-            console.warn("Could not verify user registration, trying sending anyway...", verErr);
+function ackSummary() {
+    const summary = { ...ackStats, following: trackedMessages.size };
+    for (const [name, samples] of Object.entries(ackLatencies)) {
+        summary[name] = { p50: percentile(samples, 50), p95: percentile(samples, 95), samples: samples.length };
+    }
+    return summary;
+}
+
+// --- Encoded Media Cache ---
+// MessageMedia.fromFilePath reads and base64-encodes the whole video. Encoded media is
+// kept (LRU, capped at MEDIA_CACHE_MAX_MB) so upload retries and resends of the same
+// file skip that work. Keyed by path + mtime + size, so a rewritten file is re-read.
+const MEDIA_CACHE_MAX_BYTES = parseInt(process.env.MEDIA_CACHE_MAX_MB || '64', 10) * 1024 * 1024;
+const mediaCache = new Map();    // key -> { path, media, bytes }, in LRU order (oldest first)
+let mediaCacheBytes = 0;
+const mediaCacheStats = { hits: 0, misses: 0, evictions: 0 };
+
+function evictMedia(key) {
+    const entry = mediaCache.get(key);
+    if (!entry) return;
+    mediaCache.delete(key);
+    mediaCacheBytes -= entry.bytes;
+    mediaCacheStats.evictions++;
+}
+
+function getMessageMedia(filePath) {
+    const stats = fs.statSync(filePath);
+    const key = `${filePath}:${stats.mtimeMs}:${stats.size}`;
+
+    const cached = mediaCache.get(key);
+    if (cached) {
+        // Move to the most recently used end
+        mediaCache.delete(key);
+        mediaCache.set(key, cached);
+        mediaCacheStats.hits++;
+        return cached.media;
+    }
+
+    mediaCacheStats.misses++;
+    const encodeStart = Date.now();
+    const media = MessageMedia.fromFilePath(filePath);
+    const bytes = media.data.length;
+    console.log(`Encoded ${path.basename(filePath)} (${(bytes / 1048576).toFixed(1)} MB base64) in ${Date.now() - encodeStart} ms`);
+
+    if (bytes <= MEDIA_CACHE_MAX_BYTES) {
+        // Older versions of the same file can never be hit again
+        for (const [oldKey, entry] of mediaCache) {
+            if (entry.path === filePath) evictMedia(oldKey);
+        }
+        while (mediaCacheBytes + bytes > MEDIA_CACHE_MAX_BYTES && mediaCache.size > 0) {
+            evictMedia(mediaCache.keys().next().value);
         }
+        mediaCache.set(key, { path: filePath, media, bytes });
+        mediaCacheBytes += bytes;
+    }
+    return media;
+}
 
-        const messageText = "¡Hola! Aquí tienes tu video del Árbol Encantado. ¡Feliz Navidad!";
+// --- Send Queue ---
+// /send-welcome only registers a job and answers 202. Jobs run through an
+// in-process queue so at most SEND_CONCURRENCY sends use the WhatsApp client at once.
+const SEND_CONCURRENCY = Math.max(1, parseInt(process.env.SEND_CONCURRENCY || '1', 10));
+const JOB_RETENTION_MS = 60 * 60 * 1000; // Finished jobs stay queryable for an hour
+const TIMING_SAMPLES = 100;
+
+const jobs = new Map();          // jobId -> job
+const jobsByKey = new Map();     // idempotencyKey -> jobId
+const sendQueue = [];
+let activeSends = 0;
+let jobCounter = 0;
+const recentTotals = [];         // totalMs of the last finished jobs
+
+function percentile(values, p) {
+    if (values.length === 0) return null;
+    const sorted = [...values].sort((a, b) => a - b);
+    return sorted[Math.min(sorted.length - 1, Math.round(p / 100 * (sorted.length - 1)))];
+}
 
-        let sentMsg;
-        let videoSent = false;
+function jobView(job) {
+    return {
+        jobId: job.id,
+        status: job.status,
+        videoSent: job.videoSent,
+        error: job.error,
+        retryable: job.retryable,
+        notReady: job.notReady,
+        createdAt: job.createdAt,
+        timings: job.timings
+    };
+}
 
-        if (videoPath && require('fs').existsSync(videoPath)) {
-            const fileStats = require('fs').statSync(videoPath);
-            const fileSizeMB = fileStats.size / (1024 * 1024);
-            console.log(`Video file size: ${fileSizeMB.toFixed(2)} MB`);
+function pruneJobs() {
+    const cutoff = Date.now() - JOB_RETENTION_MS;
+    for (const [id, job] of jobs) {
+        if (job.finishedAt && job.finishedAt < cutoff) {
+            jobs.delete(id);
+            if (job.key) jobsByKey.delete(job.key);
+        }
+    }
+}
+
+// True while welcome sends are waiting or running (replies yield to them)
+function sendsPending() {
+    return activeSends > 0 || sendQueue.length > 0;
+}
+
+function pumpQueue() {
+    while (activeSends < SEND_CONCURRENCY && sendQueue.length > 0) {
+        const job = sendQueue.shift();
+        activeSends++;
+        runSendJob(job)
+            .catch(error => {
+                console.error(`Job ${job.id} failed:`, error);
+                job.status = 'failed';
+                job.error = error.message;
+            })
+            .finally(() => {
+                activeSends--;
+                job.finishedAt = Date.now();
+                job.timings.totalMs = job.finishedAt - job.createdAt;
+                recentTotals.push(job.timings.totalMs);
+                if (recentTotals.length > TIMING_SAMPLES) recentTotals.shift();
+                console.log(`Job ${job.id} ${job.status} in ${job.timings.totalMs} ms`, job.timings);
+                pumpQueue();
+            });
+    }
+}
 
-            // Retry logic for videos
-            const maxRetries = 2;
-            for (let attempt = 1; attempt <= maxRetries; attempt++) {
-                try {
-                    console.log(`Sending video attempt ${attempt}/${maxRetries}...`);
-                    const media = MessageMedia.fromFilePath(videoPath);
+async function runSendJob(job) {
+    const { phoneNumber, videoPath } = job;
+    job.status = 'running';
+    job.startedAt = Date.now();
+    job.timings.queuedMs = job.startedAt - job.createdAt;
 
-                    // Always send as video (not document)
-                    sentMsg = await client.sendMessage(finalId, media, { caption: messageText });
+    if (!isClientReady) {
+        // Client dropped after the 202: nothing was sent, so callers must not count it as an attempt
+        job.status = 'failed';
+        job.error = "WhatsApp Client is not ready";
+        job.retryable = true;
+        job.notReady = true;
+        return;
+    }
 
-                    console.log(`Video message sent to ${finalId} on attempt ${attempt}`);
-                    videoSent = true;
-                    break; // Success, exit retry loop
+    console.log(`Job ${job.id}: Send welcome to ${phoneNumber} with video: ${videoPath}`);
 
-                } catch (mediaErr) {
-                    console.error(`Attempt ${attempt} failed:`, mediaErr.message);
-                    if (attempt < maxRetries) {
-                        console.log("Waiting 3 seconds before retry...");
-                        await new Promise(r => setTimeout(r, 3000));
-                    }
+    // Standardize format to ID
+    // Assuming input is like "573001234567"
+    let chatId = phoneNumber.replace(/\D/g, "") + "@c.us";
+
+    // Check if number is registered (optional validation)
+    let finalId = chatId;
+    let stepStart = Date.now();
+    try {
+        // Attempt to verify registration to avoid invalid ID errors
+        const isRegistered = await client.isRegisteredUser(chatId);
+        if (!isRegistered) {
+            console.warn(`Number ${chatId} not registered on WhatsApp.`);
+            // Still try to send, sometimes verification fails but sending works
+        }
+    } catch (verErr) {
+        console.warn("Could not verify user registration, trying sending anyway...", verErr);
+    }
+    job.timings.verifyMs = Date.now() - stepStart;
+
+    const messageText = "¡Hola! Aquí tienes tu video del Árbol Encantado. ¡Feliz Navidad!";
+
+    let sentMsg;
+    let videoSent = false;
+
+    if (videoPath && fs.existsSync(videoPath)) {
+        const fileStats = fs.statSync(videoPath);
+        const fileSizeMB = fileStats.size / (1024 * 1024);
+        console.log(`Video file size: ${fileSizeMB.toFixed(2)} MB`);
+
+        // Retry logic for videos
+        const maxRetries = 2;
+        for (let attempt = 1; attempt <= maxRetries; attempt++) {
+            try {
+                console.log(`Sending video attempt ${attempt}/${maxRetries}...`);
+                const media = getMessageMedia(videoPath);
+
+                // Always send as video (not document). Only the successful upload is
+                // timed, so retry waits and the text fallback never skew the sample.
+                const uploadStart = Date.now();
+                sentMsg = await client.sendMessage(finalId, media, { caption: messageText });
+                job.timings.uploadMs = Date.now() - uploadStart;
+
+                console.log(`Video message sent to ${finalId} on attempt ${attempt}`);
+                videoSent = true;
+                break; // Success, exit retry loop
+
+            } catch (mediaErr) {
+                console.error(`Attempt ${attempt} failed:`, mediaErr.message);
+                if (attempt < maxRetries) {
+                    console.log("Waiting 3 seconds before retry...");
+                    await new Promise(r => setTimeout(r, 3000));
                 }
             }
+        }
 
-            // Only send fallback text if ALL retries failed
-            if (!videoSent) {
-                console.error("All video send attempts failed, sending text only");
-                sentMsg = await client.sendMessage(finalId, messageText + "\n(No pudimos adjuntar el video, lo sentimos)");
-            }
-        } else {
-            if (videoPath) console.warn(`Video path not found: ${videoPath}`);
-            sentMsg = await client.sendMessage(finalId, messageText);
+        // Only send fallback text if ALL retries failed
+        if (!videoSent) {
+            console.error("All video send attempts failed, sending text only");
+            sentMsg = await client.sendMessage(finalId, messageText + "\n(No pudimos adjuntar el video, lo sentimos)");
         }
+    } else {
+        if (videoPath) console.warn(`Video path not found: ${videoPath}`);
+        sentMsg = await client.sendMessage(finalId, messageText);
+    }
 
-        console.log(`Welcome message processing for ${finalId}. Waiting for server acknowledgement...`);
-
-        // Wait for ACK to ensure delivery to server (shorter timeout since video already sent)
-        await new Promise((resolve) => {
-            const timeout = setTimeout(() => {
-                console.warn('Timeout waiting for ACK, but message was sent to browser.');
-                resolve();
-            }, 5000); // Reduced to 5 seconds since message is already sent
-
-            const ackListener = (msg, ack) => {
-                if (msg.id._serialized === sentMsg.id._serialized) {
-                    console.log(`ACK received: ${ack}`);
-                    // ack 1 = sent to server, 2 = delivered, 3 = read
-                    if (ack >= 1) {
-                        clearTimeout(timeout);
-                        client.removeListener('message_ack', ackListener); // Cleanup
-                        console.log('Message successfully reached WhatsApp server.');
-                        resolve();
-                    }
-                }
-            };
+    console.log(`Welcome message processing for ${finalId}. Waiting for server acknowledgement...`);
 
-            client.on('message_ack', ackListener);
-        });
+    // Wait for ACK to ensure delivery to server (shorter timeout since video already sent)
+    stepStart = Date.now();
+    trackMessage(sentMsg);
+    const ack = await waitForAck(sentMsg.id._serialized, ACK_SERVER, 5000); // 5 seconds since message is already sent
+    if (ack === null) {
+        console.warn('Timeout waiting for ACK, but message was sent to browser.');
+    } else {
+        console.log(`ACK received: ${ack}. Message successfully reached WhatsApp server.`);
+    }
+    job.timings.ackMs = Date.now() - stepStart;
 
-        console.log(`Verified processing for ${finalId} completed.`);
+    console.log(`Verified processing for ${finalId} completed.`);
+    job.status = 'sent';
+    job.videoSent = videoSent;
+}
 
-        res.json({ success: true, message: "Message sent successfully", videoSent: videoSent });
+// Endpoint to send the welcome message: queues a job and answers 202 with its id
+app.post('/send-welcome', (req, res) => {
+    const { phoneNumber, videoPath, idempotencyKey } = req.body;
 
-    } catch (error) {
-        console.error("Failed to send welcome message via API:", error);
-        res.status(500).json({ success: false, error: error.message });
+    if (!isClientReady) {
+        console.warn("API Request blocked: Client not ready yet.");
+        return res.status(503).json({ success: false, error: "WhatsApp Client is not ready yet. Please wait a moment." });
+    }
+
+    if (!phoneNumber) {
+        return res.status(400).json({ success: false, error: "phoneNumber is required" });
     }
+
+    pruneJobs();
+
+    // A retry of a request we already accepted gets the same job, unless that job failed
+    if (idempotencyKey && jobsByKey.has(idempotencyKey)) {
+        const existing = jobs.get(jobsByKey.get(idempotencyKey));
+        if (existing && existing.status !== 'failed') {
+            return res.status(202).json({ success: true, ...jobView(existing) });
+        }
+    }
+
+    const job = {
+        id: `${Date.now().toString(36)}-${(++jobCounter).toString(36)}`,
+        key: idempotencyKey || null,
+        phoneNumber,
+        videoPath,
+        status: 'queued',
+        videoSent: false,
+        error: null,
+        retryable: true,
+        notReady: false,
+        createdAt: Date.now(),
+        finishedAt: null,
+        timings: {}
+    };
+    jobs.set(job.id, job);
+    if (job.key) jobsByKey.set(job.key, job.id);
+    sendQueue.push(job);
+    console.log(`API Request: job ${job.id} queued for ${phoneNumber} (${sendQueue.length} waiting, ${activeSends} running)`);
+    pumpQueue();
+
+    res.status(202).json({ success: true, ...jobView(job) });
+});
+
+// Status of one send job
+app.get('/jobs/:id', (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) {
+        return res.status(404).json({ success: false, error: "Unknown job" });
+    }
+    res.json({ success: true, ...jobView(job) });
+});
+
+// Chatbot reply engine counters
+app.get('/replies', (req, res) => {
+    res.json({
+        ...replyStats,
+        cacheEntries: replyCache.size,
+        modelWaiting: modelQueue.length,
+        modelRunning: activeModelCalls
+    });
+});
+
+// Queue depth and timing summary
+app.get('/jobs', (req, res) => {
+    const counts = {};
+    for (const job of jobs.values()) counts[job.status] = (counts[job.status] || 0) + 1;
+    res.json({
+        concurrency: SEND_CONCURRENCY,
+        waiting: sendQueue.length,
+        running: activeSends,
+        counts,
+        totalMs: { p50: percentile(recentTotals, 50), p95: percentile(recentTotals, 95), samples: recentTotals.length },
+        mediaCache: { entries: mediaCache.size, mb: +(mediaCacheBytes / 1048576).toFixed(1), ...mediaCacheStats },
+        ackMs: ackSummary()
+    });
 });
 
 
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Shared microphone capture.
+
+One long-lived PyAudio input stream (callback mode) writes int16 frames into a
+ring buffer holding the last RING_SECONDS of audio. Every consumer (keyword
+spotter, Vosk dictation, Whisper chunker) reads through its own Subscription
+cursor, so stages hand the microphone over without closing and reopening the
+device, and an old listener that has not exited yet does not block the next
+one.
+
+The audio callback is the only writer and never takes a lock: it copies the
+frames into the ring and then advances the write counter. Readers poll that
+counter every READ_POLL seconds instead of being notified, so a reader can
+never stall the PortAudio callback. A reader that falls more than
+RING_SECONDS behind skips to the oldest frames still in the ring and counts
+the skipped frames as dropped.
+
+Usage:
+    python mic_capture.py              # Capture for 10 s and print levels and stats
+    python mic_capture.py --seconds 30
+"""
+
+import time
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+from config import SAMPLE_RATE, CHANNELS, MIC_DEVICE_INDEX
+
+RING_SECONDS = 30
+BUFFER_FRAMES = 1600          # 100 ms per callback at 16 kHz
+SAMPLE_WIDTH = 2              # int16
+READ_POLL = 0.01              # Reader wake-up while waiting for frames
+
+
+class Subscription:
+    """Read cursor on the capture ring. Starts at the live position (minus 'preroll' frames)."""
+    def __init__(self, hub, name, preroll=0):
+        self.hub = hub
+        self.name = name
+        self.cursor = max(0, hub.written - min(preroll, hub.capacity))
+        self.dropped = 0
+        self.closed = False
+
+    def available(self):
+        return self.hub.written - self.cursor
+
+    def read(self, frames, timeout=None):
+        """
+        Returns up to 'frames' frames as int16 bytes. Blocks until that many are
+        captured, the timeout expires or the subscription is closed, and then
+        returns what is available (b'' if nothing).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.available() < frames and not self.closed:
+            remaining = READ_POLL if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(READ_POLL, remaining))
+        return self._take(frames)
+
+    def _take(self, frames):
+        hub = self.hub
+        written = hub.written
+        behind = written - self.cursor
+        if behind > hub.capacity:
+            # Overwritten before we got to it
+            lost = behind - hub.capacity
+            if not self.dropped:
+                logging.warning(f"Mic subscriber '{self.name}' fell behind, skipping {lost} frames")
+            self.dropped += lost
+            self.cursor = written - hub.capacity
+            behind = hub.capacity
+        count = min(frames, behind)
+        if count <= 0:
+            return b''
+        start = self.cursor % hub.capacity
+        end = start + count
+        if end <= hub.capacity:
+            data = hub.ring[start:end].tobytes()
+        else:
+            data = hub.ring[start:].tobytes() + hub.ring[:end - hub.capacity].tobytes()
+        self.cursor += count
+        return data
+
+    def close(self):
+        self.closed = True
+        self.hub._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MicCapture:
+    def __init__(self, rate=SAMPLE_RATE, channels=CHANNELS, device_index=MIC_DEVICE_INDEX,
+                 ring_seconds=RING_SECONDS):
+        self.rate = rate
+        self.channels = channels
+        self.device_index = device_index
+        self.sample_width = SAMPLE_WIDTH
+        # Mono ring: one int16 sample per frame
+        self.capacity = int(rate * ring_seconds)
+        self.ring = np.zeros(self.capacity, dtype=np.int16)
+        self.written = 0             # Total frames captured (monotonic)
+        self.overflows = 0
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.pa = None
+        self.stream = None
+        self.started_at = None
+
+    @property
+    def running(self):
+        return self.stream is not None
+
+    def start(self):
+        """Opens the input stream if it is not open yet. Returns True when capturing."""
+        with self.lock:
+            if self.stream is not None:
+                return True
+            try:
+                import pyaudio
+                start = time.time()
+                if self.pa is None:
+                    self.pa = pyaudio.PyAudio()
+                self.stream = self.pa.open(format=pyaudio.paInt16,
+                                           channels=self.channels,
+                                           rate=self.rate,
+                                           input=True,
+                                           input_device_index=self.device_index,
+                                           frames_per_buffer=BUFFER_FRAMES,
+                                           stream_callback=self._on_audio)
+                self.stream.start_stream()
+                self.started_at = time.time()
+                logging.info(f"Microphone capture started in {(time.time() - start) * 1000:.0f} ms "
+                             f"({self.rate} Hz, ring {self.capacity / self.rate:.0f}s)")
+                return True
+            except Exception as e:
+                logging.error(f"Could not open microphone: {e}")
+                self.stream = None
+                return False
+
+    def _on_audio(self, in_data, frame_count, time_info, status):
+        import pyaudio
+        if status & pyaudio.paInputOverflow:
+            self.overflows += 1
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        if self.channels > 1:
+            samples = samples[::self.channels]
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            count = self.capacity
+        start = self.written % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            self.ring[start:end] = samples
+        else:
+            split = self.capacity - start
+            self.ring[start:] = samples[:split]
+            self.ring[:end - self.capacity] = samples[split:]
+        # Publish only after the copy, so readers never see frames that are not there yet
+        self.written += count
+        return (None, pyaudio.paContinue)
+
+    def subscribe(self, name, preroll_seconds=0.0):
+        """New read cursor. Starts the capture if needed."""
+        self.start()
+        subscription = Subscription(self, name, int(preroll_seconds * self.rate))
+        with self.lock:
+            self.subscribers.append(subscription)
+        logging.debug(f"Mic subscriber '{name}' attached ({len(self.subscribers)} active)")
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscribers:
+                self.subscribers.remove(subscription)
+
+    def stats(self):
+        with self.lock:
+            subscribers = {s.name: {"lag_frames": s.available(), "dropped": s.dropped}
+                           for s in self.subscribers}
+        return {"running": self.running, "captured_seconds": round(self.written / self.rate, 1),
+                "overflows": self.overflows, "subscribers": subscribers}
+
+    def stop(self):
+        """Closes the stream and every subscription (readers return within READ_POLL). The next subscribe() reopens it."""
+        with self.lock:
+            subscribers = list(self.subscribers)
+            stream, self.stream = self.stream, None
+        for subscription in subscribers:
+            subscription.close()
+        if stream is not None:
+            try:
+                stream.stop_stream()
+                stream.close()
+            except Exception as e:
+                logging.warning(f"Error closing microphone stream: {e}")
+            logging.info("Microphone capture stopped")
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
+
+
+mic = MicCapture()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared microphone capture check")
+    parser.add_argument("--seconds", type=float, default=10, help="Capture duration")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with mic.subscribe("level-meter") as sub:
+        end = time.time() + args.seconds
+        while time.time() < end:
+            data = sub.read(mic.rate // 2, timeout=1.0)
+            if data:
+                samples = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+                rms = float(np.sqrt(np.mean(samples ** 2)))
+                print(f"RMS {rms:7.0f} {'#' * int(min(50, rms / 200))}")
+    print(mic.stats())
+    mic.stop()
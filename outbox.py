@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Durable outbox for the WhatsApp welcome messages.
+
+Every send request is stored in a SQLite database (WAL mode) before anything
+goes over the network. A dispatcher thread hands due rows to
+MessagingService.submit() with at most OUTBOX_CONCURRENCY uploads in flight. Failed
+attempts are rescheduled with exponential backoff and jitter, so a timeout or
+a restart delays the message instead of losing it. A send refused because the
+WhatsApp client is not ready (503) is rescheduled the same way but does not
+count as an attempt: only real send failures can make a delivery dead.
+
+Usage:
+    python outbox.py                 # List pending and dead deliveries
+    python outbox.py --all           # Include delivered ones
+    python outbox.py --flush         # Deliver everything pending now, ignoring backoff
+    python outbox.py --revive        # Move dead deliveries back to pending
+"""
+
+import os
+import time
+import random
+import sqlite3
+import logging
+import argparse
+import threading
+
+from config import OUTBOX_DB_PATH, OUTBOX_CONCURRENCY
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5      # Seconds before the second attempt
+BACKOFF_MAX = 600     # Upper bound of a single delay
+JITTER = 0.5          # Delay is multiplied by a random factor in [1 - JITTER, 1 + JITTER]
+IDLE_POLL = 5.0       # Dispatcher wake-up when nothing is due
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT UNIQUE,
+    phone_number TEXT NOT NULL,
+    video_path TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at);
+"""
+
+# pending -> sending -> delivered
+#                    -> pending (retry) -> ... -> dead
+FINAL_STATES = ("delivered", "dead")
+
+
+def backoff_delay(attempts):
+    """Delay before the next attempt after 'attempts' failures."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class Outbox:
+    def __init__(self, messaging=None, db_path=OUTBOX_DB_PATH, concurrency=OUTBOX_CONCURRENCY):
+        self.messaging = messaging
+        self.db_path = db_path
+        self.concurrency = max(1, concurrency)
+        self.local = threading.local()
+        self.wakeup = threading.Event()
+        self.finished = threading.Condition()
+        self.in_flight = 0
+        self.running = False
+        self.thread = None
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    def _db(self):
+        """Per-thread connection. Used as a context manager, it commits or rolls back."""
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    # ---- Producer side ----
+
+    def add(self, phone_number, video_path=None, key=None):
+        """
+        Records a delivery and returns its id. With a 'key', adding the same
+        delivery twice returns the existing row instead of sending twice.
+        """
+        now = time.time()
+        with self._db() as db:
+            if key:
+                row = db.execute("SELECT id FROM deliveries WHERE key = ?", (key,)).fetchone()
+                if row:
+                    return row["id"]
+            cursor = db.execute(
+                "INSERT INTO deliveries (key, phone_number, video_path, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (key, phone_number, video_path, now, now, now))
+        self.wakeup.set()
+        logging.info(f"Outbox: delivery {cursor.lastrowid} queued")
+        return cursor.lastrowid
+
+    def get(self, delivery_id):
+        return self._db().execute("SELECT * FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+
+    def wait(self, delivery_id, timeout):
+        """Waits until the delivery is delivered or dead. Returns its status."""
+        deadline = time.time() + timeout
+        with self.finished:
+            while True:
+                status = self.get(delivery_id)["status"]
+                remaining = deadline - time.time()
+                if status in FINAL_STATES or remaining <= 0:
+                    return status
+                self.finished.wait(min(remaining, 1.0))
+
+    def rows(self, include_delivered=False):
+        query = "SELECT * FROM deliveries"
+        if not include_delivered:
+            query += " WHERE status != 'delivered'"
+        return self._db().execute(query + " ORDER BY id").fetchall()
+
+    def counts(self):
+        return dict(self._db().execute("SELECT status, COUNT(*) FROM deliveries GROUP BY status").fetchall())
+
+    def revive(self, delivery_id=None):
+        """Gives dead deliveries (all, or just 'delivery_id') a fresh set of attempts."""
+        query = ("UPDATE deliveries SET status = 'pending', attempts = 0, next_attempt_at = ?, "
+                 "updated_at = ? WHERE status = 'dead'")
+        params = (time.time(), time.time())
+        if delivery_id is not None:
+            query += " AND id = ?"
+            params += (delivery_id,)
+        with self._db() as db:
+            count = db.execute(query, params).rowcount
+        self.wakeup.set()
+        return count
+
+    # ---- Dispatcher ----
+
+    def start(self):
+        """Recovers interrupted sends and starts delivering in the background."""
+        with self._db() as db:
+            # A 'sending' row at startup was interrupted by a crash or restart
+            recovered = db.execute("UPDATE deliveries SET status = 'pending', updated_at = ? "
+                                   "WHERE status = 'sending'", (time.time(),)).rowcount
+        if recovered:
+            logging.info(f"Outbox: {recovered} interrupted delivery(ies) back to pending")
+        logging.info(f"Outbox: {self.counts()}")
+        self.running = True
+        self.thread = threading.Thread(target=self._dispatch_loop, name="outbox", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        self.wakeup.set()
+        # Rows still sending are recovered on the next start
+        if self.thread:
+            self.thread.join(timeout)
+
+    def _claim_due(self, limit, ignore_backoff=False):
+        """Atomically moves up to 'limit' due rows to 'sending' (safe across processes)."""
+        now = time.time()
+        due_before = float("inf") if ignore_backoff else now
+        claimed = []
+        with self._db() as db:
+            candidates = db.execute(
+                "SELECT id FROM deliveries WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?", (due_before, limit)).fetchall()
+            for row in candidates:
+                if db.execute("UPDATE deliveries SET status = 'sending', updated_at = ? "
+                              "WHERE id = ? AND status = 'pending'", (now, row["id"])).rowcount:
+                    claimed.append(row["id"])
+        return claimed
+
+    def _next_due_in(self):
+        row = self._db().execute("SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'pending'").fetchone()
+        if row[0] is None:
+            return IDLE_POLL
+        return max(0.0, min(IDLE_POLL, row[0] - time.time()))
+
+    def _dispatch_loop(self):
+        while self.running:
+            try:
+                free = self.concurrency - self.in_flight
+                if free > 0:
+                    for delivery_id in self._claim_due(free):
+                        self._send(delivery_id)
+                self.wakeup.wait(self._next_due_in())
+                self.wakeup.clear()
+            except Exception as e:
+                logging.error(f"Outbox dispatcher error: {e}")
+                time.sleep(IDLE_POLL)
+
+    def flush(self):
+        """Delivers every pending row now on the calling thread, ignoring backoff (CLI)."""
+        sent = 0
+        if self.messaging is None:
+            from messaging import MessagingService
+            self.messaging = MessagingService(max_workers=self.concurrency)
+        while True:
+            # Not-ready refusals don't use up attempts, so they would be retried forever here
+            if not self.messaging.is_ready(refresh=True):
+                logging.warning("Outbox: WhatsApp client not ready, stopping the flush")
+                return sent
+            claimed = self._claim_due(self.concurrency, ignore_backoff=True)
+            if not claimed:
+                return sent
+            for delivery_id in claimed:
+                self._send(delivery_id)
+            # Wait for the outcomes to be recorded, not just for the uploads
+            with self.finished:
+                self.finished.wait_for(lambda: self.in_flight == 0)
+            sent += len(claimed)
+
+    def _send(self, delivery_id):
+        """Starts the upload on the messaging pool. The outcome is recorded when the future completes."""
+        row = self.get(delivery_id)
+        if self.messaging is None:
+            from messaging import MessagingService
+            self.messaging = MessagingService(max_workers=self.concurrency)
+        with self.finished:
+            self.in_flight += 1
+        start = time.time()
+        try:
+            # The key lets server.js attach a retry to the job it already has for this delivery
+            future = self.messaging.submit(row["phone_number"], row["video_path"], key=f"outbox-{row['id']}")
+        except Exception as e:
+            # Never started (e.g. pool shut down): free the slot and reschedule the row
+            logging.error(f"Outbox: could not start delivery {row['id']}: {e}")
+            try:
+                self._record(row, False, str(e), True, time.time() - start)
+            finally:
+                with self.finished:
+                    self.in_flight = max(0, self.in_flight - 1)
+                    self.finished.notify_all()
+            return None
+        future.add_done_callback(lambda f: self._on_done(row, f, start))
+        return future
+
+    def _on_done(self, row, future, start):
+        try:
+            try:
+                result = future.result()
+                ok, error, retryable, attempted = result.ok, result.error, result.retryable, result.attempted
+            except Exception as e:
+                ok, error, retryable, attempted = False, str(e), True, True
+            self._record(row, ok, error, retryable, time.time() - start, attempted)
+        except Exception as e:
+            logging.error(f"Outbox: could not record delivery {row['id']}: {e}")
+        finally:
+            with self.finished:
+                self.in_flight = max(0, self.in_flight - 1)
+                self.finished.notify_all()
+            self.wakeup.set()
+
+    def _record(self, row, ok, error, retryable, elapsed, attempted=True):
+        now = time.time()
+        attempts = row["attempts"] + 1
+        with self._db() as db:
+            if not ok and not attempted:
+                # Client not ready: back off, but keep the attempt for a real send
+                delay = backoff_delay(attempts)
+                db.execute("UPDATE deliveries SET status = 'pending', last_error = ?, "
+                           "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                           (error, now + delay, now, row["id"]))
+                logging.info(f"Outbox: delivery {row['id']} waiting ({error}), checking again in {delay:.0f}s")
+            elif ok:
+                db.execute("UPDATE deliveries SET status = 'delivered', attempts = ?, last_error = NULL, "
+                           "delivered_at = ?, updated_at = ? WHERE id = ?", (attempts, now, now, row["id"]))
+                logging.info(f"Outbox: delivery {row['id']} sent in {elapsed:.1f}s (attempt {attempts})")
+            elif not retryable or attempts >= MAX_ATTEMPTS:
+                db.execute("UPDATE deliveries SET status = 'dead', attempts = ?, last_error = ?, "
+                           "updated_at = ? WHERE id = ?", (attempts, error, now, row["id"]))
+                logging.error(f"Outbox: delivery {row['id']} gave up after {attempts} attempt(s): {error}")
+            else:
+                delay = backoff_delay(attempts)
+                db.execute("UPDATE deliveries SET status = 'pending', attempts = ?, last_error = ?, "
+                           "next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                           (attempts, error, now + delay, now, row["id"]))
+                logging.warning(f"Outbox: delivery {row['id']} failed ({error}), retry {attempts + 1} in {delay:.0f}s")
+
+
+def _format_row(row):
+    phone = row["phone_number"] or ""
+    masked = "*" * max(0, len(phone) - 4) + phone[-4:]
+    if row["status"] == "pending":
+        due = f"in {max(0, row['next_attempt_at'] - time.time()):.0f}s"
+    else:
+        due = ""
+    video = os.path.basename(row["video_path"]) if row["video_path"] else "-"
+    error = f"  {row['last_error'][:60]}" if row["last_error"] else ""
+    return f"{row['id']:<6} {row['status']:<10} {row['attempts']:<8} {due:<9} {masked:<14} {video}{error}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Magic Tree messaging outbox")
+    parser.add_argument("--all", action="store_true", help="Also list delivered messages")
+    parser.add_argument("--flush", action="store_true", help="Deliver all pending messages now")
+    parser.add_argument("--revive", action="store_true", help="Move dead deliveries back to pending")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    outbox = Outbox()
+    if args.revive:
+        print(f"Revived {outbox.revive()} delivery(ies)")
+    if args.flush:
+        print(f"Flushed {outbox.flush()} delivery(ies)")
+
+    print(f"{'ID':<6} {'STATUS':<10} {'ATTEMPTS':<8} {'DUE':<9} {'PHONE':<14} VIDEO")
+    for row in outbox.rows(include_delivered=args.all):
+        print(_format_row(row))
+    print(f"Summary: {outbox.counts()}")
@@ -1,27 +1,35 @@
 import os
 import sys
 import json
-import queue
 import threading
 import time
 import logging
-import pyaudio
 import pygame
-from vosk import Model, KaldiRecognizer
 from config import *
+from mic_capture import mic
+from vosk_models import vosk_models
 
 # Audio Config
 SAMPLE_RATE = 16000
 CHUNK_SIZE = 4000
-DEVICE_INDEX = None  # Auto-detect default
+
+# Spellings used by the Spanish model's lexicon for words that process_text() matches
+# without accents. Both forms go into the grammar; Vosk ignores the ones it does not know.
+ACCENTED_FORMS = {
+    "dieciseis": "dieciséis", "veintidos": "veintidós", "veintitres": "veintitrés",
+    "veintiseis": "veintiséis", "atras": "atrás", "si": "sí",
+}
+UNKNOWN_WORD = "[unk]"  # Absorbs speech outside the grammar instead of forcing a digit
 
 class PhoneInputSystem:
-    def __init__(self, callback_fn=None):
+    def __init__(self, callback_fn=None, mode=DICTATION_MODE):
         """
         Initialize the PhoneInputSystem.
         :param callback_fn: A function that takes (number_string, status_string) to update external UI.
+        :param mode: "grammar" to decode only the known digit/command words, "open" for the full vocabulary.
         """
         self.callback_fn = callback_fn
+        self.mode = mode
         self.running = True
         self.phone_number = []
         self.confirmed = False
@@ -36,17 +44,10 @@ class PhoneInputSystem:
         self.sounds = {} 
         self._load_basic_sounds()
 
-        # Initialize Vosk
-        if not os.path.exists(VOSK_MODEL_PATH):
-            logging.error(f"Vosk Model not found at {VOSK_MODEL_PATH}")
-        else:
-            logging.info(f"Loading Vosk model from {VOSK_MODEL_PATH}...")
-            self.model = Model(VOSK_MODEL_PATH)
-            self.recognizer = KaldiRecognizer(self.model, SAMPLE_RATE)
-            logging.info("Vosk model loaded.")
-        
-        # Audio Queue
-        self.audio_queue = queue.Queue()
+        # Shared Vosk model (loaded once per process); the recognizer is taken from
+        # the pool when dictation starts
+        self.model = vosk_models.get(VOSK_MODEL_PATH)
+        self.recognizer = None
         
         # TTS explicitly disabled as per user request
         self.tts = None 
@@ -71,6 +72,17 @@ class PhoneInputSystem:
         self.clear_all_phrase = "borrar todo"
         self.confirmation_words = ["si", "confirmar", "ok", "listo", "correcto", "ya"]
 
+        # Compiled once: the first recognizer with this grammar is built now and pooled
+        self.grammar = self.build_grammar()
+        if self.mode == "grammar":
+            vosk_models.warm_up(VOSK_MODEL_PATH, SAMPLE_RATE, grammar=self.grammar)
+
+    def build_grammar(self):
+        """Every phrase process_text() acts on, plus the [unk] fallback, as a Vosk grammar."""
+        words = set(self.digit_map) | set(self.correction_words) | set(self.confirmation_words)
+        words |= {ACCENTED_FORMS[w] for w in words if w in ACCENTED_FORMS}
+        return sorted(words) + [self.clear_all_phrase, UNKNOWN_WORD]
+
     def normalize_text(self, text):
         replacements = (
             ("á", "a"), ("é", "e"), ("í", "i"), ("ó", "o"), ("ú", "u"),
@@ -98,53 +110,52 @@ class PhoneInputSystem:
             except:
                 pass
 
-    def audio_callback(self, in_data, frame_count, time_info, status):
-        self.audio_queue.put(in_data)
-        return (None, pyaudio.paContinue)
-
-    def start_processing(self):
+    def start_processing(self, mode=None):
         """
         Main loop for audio processing. blocking until confirmed or stopped.
+        'mode' overrides the decoding mode chosen at construction for this stage.
         """
-        p = pyaudio.PyAudio()
-        stream = p.open(format=pyaudio.paInt16,
-                        channels=1,
-                        rate=SAMPLE_RATE,
-                        input=True,
-                        input_device_index=DEVICE_INDEX,
-                        frames_per_buffer=CHUNK_SIZE,
-                        stream_callback=self.audio_callback)
-        
-        stream.start_stream()
-        
-        logging.info("PhoneInputSystem: Listening...")
-        self.update_ui("Escuchando...")
-        self.play_sound("intro")
-        
-        while self.running:
+        mode = mode or self.mode
+        grammar = self.grammar if mode == "grammar" else None
+        # Shared microphone stream (already open), no device setup per visitor.
+        # Both are given back even if decoding raises.
+        with mic.subscribe("phone-dictation") as subscription, \
+                vosk_models.recognizer(SAMPLE_RATE, grammar=grammar) as recognizer:
+            if recognizer is None:
+                logging.error("Vosk model not available, cannot run phone dictation.")
+                self.running = False
+                return None
+
+            logging.info(f"PhoneInputSystem: Listening ({mode} vocabulary)...")
+            self.update_ui("Escuchando...")
+            self.play_sound("intro")
+
+            self.recognizer = recognizer
             try:
-                # Non-blocking get with timeout to allow checking self.running
-                data = self.audio_queue.get(timeout=0.5)
-                if self.recognizer.AcceptWaveform(data):
-                    result = json.loads(self.recognizer.Result())
-                    text = result.get("text", "")
-                    if text:
-                        self.process_text(text)
-                else:
-                    # Partial result if needed, but usually we wait for full blocks
-                    pass
+                while self.running:
+                    try:
+                        # Read with timeout to allow checking self.running
+                        data = subscription.read(CHUNK_SIZE, timeout=0.5)
+                        if not data:
+                            continue
+                        if self.recognizer.AcceptWaveform(data):
+                            result = json.loads(self.recognizer.Result())
+                            text = result.get("text", "")
+                            if text:
+                                self.process_text(text)
+                        else:
+                            # Partial result if needed, but usually we wait for full blocks
+                            pass
                     
-            except queue.Empty:
-                continue
-            except KeyboardInterrupt:
-                self.running = False
-                break
-            except Exception as e:
-                logging.error(f"Error in audio loop: {e}")
-                
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+                    except KeyboardInterrupt:
+                        self.running = False
+                        break
+                    except Exception as e:
+                        logging.error(f"Error in audio loop: {e}")
+            finally:
+                self.recognizer = None
+        logging.info(f"Vosk registry: {vosk_models.stats()}")
+
         if self.tts:
             self.tts.stop()
         return "".join(self.phone_number) if self.confirmed else None
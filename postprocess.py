@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Background post-processing for visitor recordings.
+
+Every visitor becomes a job that runs through these stages on worker threads:
+
+    merge -> validate -> rendition -> send -> archive
+
+Jobs are journaled as one JSON file per job in JOBS_DIR and rewritten after
+every stage. The visitor's metadata JSON is written next to the recording
+as soon as the job is queued, so a job that fails later still leaves the
+transcript behind. The send stage hands the message to the durable outbox
+(outbox.py), and the job is archived only once the outbox confirms the
+delivery. Archived jobs keep the recording, the merged and delivery copies
+and the metadata JSON together in recordings/archive. A job interrupted by
+a crash or restart resumes from its current stage on the next start. The
+kiosk loop only calls enqueue() and goes straight back to standby.
+
+--retry marks a failed job as queued in the journal. A running kiosk's
+workers check the journal for such jobs every JOURNAL_POLL seconds while
+idle and pick them up.
+
+Usage:
+    python postprocess.py                # List pending and failed jobs
+    python postprocess.py --all          # Include finished jobs
+    python postprocess.py --retry <id>   # Requeue a failed job
+    python postprocess.py --run          # Process pending jobs now (kiosk stopped)
+"""
+
+import os
+import json
+import time
+import queue
+import shutil
+import logging
+import argparse
+import itertools
+import threading
+
+from config import JOBS_DIR, RECORDINGS_DIR, MERGE_VIDEO_PATH, POSTPROCESS_WORKERS
+
+STAGES = ["merge", "validate", "rendition", "send", "archive"]
+ENCODE_STAGES = ("merge", "validate", "rendition")  # Stages that run ffmpeg
+
+# Priority lanes, lowest value first
+LANE_VISITOR = 0    # Visitor who just left the tree
+LANE_RECOVERED = 1  # Unfinished job found in the journal at startup
+LANE_RETRY = 2      # Stage failed, waiting for another attempt
+LANES = {LANE_VISITOR: "visitor", LANE_RECOVERED: "recovered", LANE_RETRY: "retry"}
+
+MAX_ATTEMPTS = 3
+RETRY_DELAYS = [10, 60, 300]  # Seconds before attempt 2, 3...
+
+# The send stage waits this long for the outbox, then frees the worker and checks again later
+SEND_WAIT = 15
+SEND_RECHECK_DELAY = 30
+
+# Idle workers look this often for failed jobs requeued with --retry
+JOURNAL_POLL = 30
+
+ARCHIVE_DIR = os.path.join(RECORDINGS_DIR, "archive")
+
+
+class StageFailed(Exception):
+    """A stage failed in a way retrying cannot fix. The job is marked failed."""
+
+
+class StageDeferred(Exception):
+    """The stage is waiting on something else. Checked again later, no attempt counted."""
+
+
+class PostProcessQueue:
+    def __init__(self, outbox=None, assets=None, workers=POSTPROCESS_WORKERS, jobs_dir=JOBS_DIR):
+        self.outbox = outbox
+        self.assets = assets
+        self.jobs_dir = jobs_dir
+        self.worker_count = max(1, workers)
+        self.queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.workers = []
+        self.running = False
+        self.draining = False  # drain() runs the stages without workers
+        self.encoding_callback = None
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    # ---- Journal ----
+
+    def _job_path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        job["updated_at"] = time.time()
+        tmp_path = self._job_path(job["id"]) + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f, indent=4)
+        os.replace(tmp_path, self._job_path(job["id"]))
+
+    def load(self):
+        """Reads every job from the journal."""
+        jobs = {}
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name)) as f:
+                    job = json.load(f)
+                jobs[job["id"]] = job
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Skipping unreadable job file {name}: {e}")
+        with self.lock:
+            self.jobs = jobs
+        return jobs
+
+    # ---- Queue ----
+
+    def recover(self):
+        """Queues every unfinished job of the journal, from the stage it was in."""
+        recovered = 0
+        for job in self.load().values():
+            if job["state"] in ("queued", "running", "retry_wait"):
+                with self.lock:
+                    job["state"] = "queued"
+                    self._save(job)
+                self._put(job, LANE_RECOVERED)
+                recovered += 1
+        if recovered:
+            logging.info(f"Post-processing: resuming {recovered} unfinished job(s)")
+        return recovered
+
+    def start(self):
+        """Resumes unfinished jobs from the journal and starts the workers."""
+        self.recover()
+        self.running = True
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self._worker, name=f"postprocess-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logging.info(f"Post-processing started with {self.worker_count} worker(s)")
+
+    def stop(self, timeout=None):
+        """Stops the workers after their current stage. Pending jobs stay in the journal."""
+        self.running = False
+        for _ in self.workers:
+            self.queue.put((-1, next(self.counter), None))
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def enqueue(self, phone_number, recording_path, metadata=None, merge=True,
+                send_video=True, lane=LANE_VISITOR):
+        """Journals a new job and returns its id immediately."""
+        job_id = f"{int(time.time() * 1000)}-{next(self.counter)}"
+        job = {
+            "id": job_id,
+            "state": "queued",
+            "stage": STAGES[0],
+            "lane": LANES[lane],
+            "phone_number": phone_number,
+            "recording_path": recording_path,
+            "merged_path": None,
+            "delivery_path": None,
+            "video_path": None,
+            "metadata_path": None,
+            "merge": merge,
+            "send_video": send_video,
+            "metadata": metadata or {},
+            "attempts": {},
+            "history": [],
+            "error": None,
+            "created_at": time.time(),
+        }
+        job["metadata_path"] = self._write_metadata(job)
+        with self.lock:
+            self.jobs[job_id] = job
+            self._save(job)
+        self._put(job, lane)
+        self._notify_encoding(True)
+        logging.info(f"Post-processing job {job_id} queued ({self.pending()} pending)")
+        return job_id
+
+    def _write_metadata(self, job):
+        """Writes the visitor's metadata JSON next to the recording. Returns its path, None on error."""
+        metadata = dict(job["metadata"])
+        metadata.update({
+            "video_path": job["recording_path"],
+            "phone_number": job["phone_number"],
+            "job_id": job["id"],
+        })
+        name = os.path.splitext(os.path.basename(job["recording_path"]))[0]
+        json_path = os.path.join(os.path.dirname(job["recording_path"]) or RECORDINGS_DIR, f"{name}.json")
+        try:
+            tmp_path = json_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(metadata, f, indent=4)
+            os.replace(tmp_path, json_path)
+        except OSError as e:
+            logging.error(f"Could not save metadata for job {job['id']}: {e}")
+            return None
+        logging.info(f"Metadata saved to {json_path}")
+        return json_path
+
+    def retry(self, job_id):
+        """
+        Puts a failed job back in the queue, starting again at the stage that
+        failed. Returns False if there is no such job or it has not failed.
+        """
+        if job_id not in self.jobs:
+            self.load()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["state"] != "failed":
+                return False
+            job["state"] = "queued"
+            job["attempts"] = {}
+            job["error"] = None
+            self._save(job)
+        if job.get("delivery_id"):
+            from outbox import Outbox
+            (self.outbox or Outbox()).revive(job["delivery_id"])
+        if self.running:
+            self._put(job, LANE_RETRY)
+            self._notify_encoding(True)
+        return True
+
+    def _put(self, job, lane):
+        job["lane"] = LANES[lane]
+        self.queue.put((lane, next(self.counter), job["id"]))
+
+    def pending(self):
+        with self.lock:
+            return sum(1 for j in self.jobs.values() if j["state"] in ("queued", "running", "retry_wait"))
+
+    def encoding(self):
+        """Number of unfinished jobs that still have an ffmpeg stage ahead of them."""
+        with self.lock:
+            return sum(1 for j in self.jobs.values()
+                       if j["state"] in ("queued", "running", "retry_wait") and j["stage"] in ENCODE_STAGES)
+
+    def on_encoding(self, callback):
+        """
+        Registers 'callback(busy)', called with True when a job is queued and
+        with False from a worker thread once no job has an ffmpeg stage left.
+        Replaces any previously registered callback.
+        """
+        self.encoding_callback = callback
+
+    def _notify_encoding(self, busy):
+        if self.encoding_callback:
+            try:
+                self.encoding_callback(busy)
+            except Exception as e:
+                logging.error(f"Post-processing encoding callback error: {e}")
+
+    def summary(self):
+        """Job count per state."""
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["state"]] = counts.get(job["state"], 0) + 1
+            return counts
+
+    def drain(self):
+        """Processes queued jobs on the calling thread until the queue is empty (CLI mode)."""
+        self.draining = True
+        try:
+            while True:
+                try:
+                    _, _, job_id = self.queue.get_nowait()
+                except queue.Empty:
+                    return
+                self._process(job_id)
+        finally:
+            self.draining = False
+
+    # ---- Workers ----
+
+    def _pick_up_retries(self):
+        """Queues the failed jobs that 'postprocess.py --retry' marked as queued in the journal."""
+        with self.lock:
+            failed = [job_id for job_id, job in self.jobs.items() if job["state"] == "failed"]
+        for job_id in failed:
+            try:
+                with open(self._job_path(job_id)) as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if job.get("state") != "queued":
+                continue
+            with self.lock:
+                if self.jobs.get(job_id, {}).get("state") != "failed":
+                    continue  # Another worker got it first
+                self.jobs[job_id] = job
+            logging.info(f"Post-processing: job {job_id} requeued from the journal")
+            self._put(job, LANE_RETRY)
+            self._notify_encoding(True)
+
+    def _worker(self):
+        while True:
+            try:
+                _, _, job_id = self.queue.get(timeout=JOURNAL_POLL)
+            except queue.Empty:
+                self._pick_up_retries()
+                continue
+            if job_id is None:
+                return
+            try:
+                self._process(job_id)
+            except Exception as e:
+                logging.error(f"Post-processing worker error on job {job_id}: {e}")
+            if not self.encoding():
+                self._notify_encoding(False)
+
+    def _process(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job["state"] in ("done", "failed", "running"):
+                return
+            job["state"] = "running"
+            self._save(job)
+
+        while job["stage"] in STAGES:
+            stage = job["stage"]
+            start = time.time()
+            try:
+                getattr(self, f"_stage_{stage}")(job)
+            except StageDeferred as e:
+                with self.lock:
+                    job["state"] = "retry_wait"
+                    self._save(job)
+                logging.info(f"Job {job_id}: {stage} waiting ({e}), checking again in {SEND_RECHECK_DELAY}s")
+                self._requeue_later(job, SEND_RECHECK_DELAY)
+                return
+            except Exception as e:
+                self._stage_failed(job, stage, e)
+                return
+            elapsed_ms = int((time.time() - start) * 1000)
+            with self.lock:
+                job["history"].append({"stage": stage, "ms": elapsed_ms, "at": time.time()})
+                next_index = STAGES.index(stage) + 1
+                job["stage"] = STAGES[next_index] if next_index < len(STAGES) else "done"
+                self._save(job)
+            logging.info(f"Job {job_id}: {stage} done in {elapsed_ms} ms")
+            if not self.running and not self.draining:
+                # Shutting down: leave the remaining stages for the next start
+                with self.lock:
+                    job["state"] = "queued"
+                    self._save(job)
+                return
+
+        with self.lock:
+            job["state"] = "done"
+            self._save(job)
+        total = sum(h["ms"] for h in job["history"])
+        logging.info(f"Job {job_id} finished ({total} ms of processing)")
+
+    def _stage_failed(self, job, stage, error):
+        with self.lock:
+            attempts = job["attempts"].get(stage, 0) + 1
+            job["attempts"][stage] = attempts
+            job["error"] = f"{stage}: {error}"
+            if attempts >= MAX_ATTEMPTS or isinstance(error, StageFailed):
+                job["state"] = "failed"
+                self._save(job)
+                logging.error(f"Job {job['id']} failed at {stage} after {attempts} attempts: {error}")
+                return
+            job["state"] = "retry_wait"
+            self._save(job)
+        delay = RETRY_DELAYS[min(attempts - 1, len(RETRY_DELAYS) - 1)]
+        logging.warning(f"Job {job['id']}: {stage} failed ({error}), retrying in {delay}s")
+        self._requeue_later(job, delay)
+
+    def _requeue_later(self, job, delay):
+        def requeue():
+            with self.lock:
+                job["state"] = "queued"
+                self._save(job)
+            self._put(job, LANE_RETRY)
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        timer.start()
+
+    # ---- Stages ----
+
+    def _stage_merge(self, job):
+        """Prepends the branded intro. A failed merge is not fatal: the recording is sent as is."""
+        recording = job["recording_path"]
+        if not job["merge"] or not os.path.exists(MERGE_VIDEO_PATH) or not os.path.exists(recording):
+            return
+        merged_path = os.path.splitext(recording)[0] + "_merged.mp4"
+        if self.assets is None:
+            from asset_pipeline import AssetPipeline
+            self.assets = AssetPipeline()
+        if self.assets.merge_branded(recording, merged_path):
+            job["merged_path"] = merged_path
+        else:
+            logging.warning(f"Job {job['id']}: merge failed, using the original recording")
+
+    def _stage_validate(self, job):
+        """Picks the first playable video (merged, then original). None sends text only."""
+        from asset_pipeline import probe_streams
+        job["video_path"] = None
+        if not job["send_video"]:
+            return
+        for path in (job["merged_path"], job["recording_path"]):
+            if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            streams = probe_streams(path)
+            if streams is None or any(s.get("codec_type") == "video" for s in streams):
+                job["video_path"] = path
+                return
+            logging.warning(f"Job {job['id']}: {os.path.basename(path)} has no video stream")
+        logging.warning(f"Job {job['id']}: no valid video, sending the message without it")
+
+    def _stage_rendition(self, job):
+        """Swaps the video for a copy sized for the measured upload speed (delivery.py)."""
+        if not job["video_path"]:
+            return
+        from delivery import render
+        rendition = render(job["video_path"])
+        if rendition != job["video_path"]:
+            job["delivery_path"] = rendition
+            job["video_path"] = rendition
+
+    def _stage_send(self, job):
+        """Hands the message to the outbox (once per job) and waits for its delivery."""
+        if self.outbox is None:
+            from outbox import Outbox
+            self.outbox = Outbox()
+            self.outbox.start()
+        delivery_id = self.outbox.add(job["phone_number"], job["video_path"], key=job["id"])
+        if job.get("delivery_id") != delivery_id:
+            with self.lock:
+                job["delivery_id"] = delivery_id
+                self._save(job)
+        status = self.outbox.wait(delivery_id, SEND_WAIT)
+        if status == "dead":
+            raise StageFailed(f"outbox gave up on delivery {delivery_id}: {self.outbox.get(delivery_id)['last_error']}")
+        if status != "delivered":
+            raise StageDeferred(f"delivery {delivery_id} {status}")
+
+    def _stage_archive(self, job):
+        """Moves the videos and the metadata JSON written at enqueue time to ARCHIVE_DIR."""
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        moved = {}
+        for key in ("recording_path", "merged_path", "delivery_path", "metadata_path"):
+            path = job.get(key)
+            if path and os.path.exists(path):
+                target = os.path.join(ARCHIVE_DIR, os.path.basename(path))
+                shutil.move(path, target)
+                moved[path] = target
+        for key in ("recording_path", "merged_path", "delivery_path", "video_path", "metadata_path"):
+            if job.get(key) in moved:
+                job[key] = moved[job[key]]
+
+
+def _format_job(job):
+    phone = job["phone_number"] or ""
+    masked = "*" * max(0, len(phone) - 4) + phone[-4:]
+    age = time.time() - job["created_at"]
+    error = f"  {job['error']}" if job.get("error") and job["state"] != "done" else ""
+    return (f"{job['id']:<16} {job['state']:<10} {job['stage']:<9} {job['lane']:<9} "
+            f"{masked:<14} {age / 60:7.1f} min{error}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Magic Tree post-processing jobs")
+    parser.add_argument("--all", action="store_true", help="Also list finished jobs")
+    parser.add_argument("--retry", metavar="JOB_ID", help="Requeue a failed job (a running kiosk picks it up when a worker is idle)")
+    parser.add_argument("--run", action="store_true", help="Process pending jobs now (only while the kiosk is stopped)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    jobs = PostProcessQueue()
+    jobs.load()
+
+    if args.retry:
+        print("Requeued" if jobs.retry(args.retry) else f"No failed job {args.retry}")
+    if args.run:
+        jobs.recover()
+        jobs.drain()
+
+    print(f"{'ID':<16} {'STATE':<10} {'STAGE':<9} {'LANE':<9} {'PHONE':<14} {'AGE':>11}")
+    for job in sorted(jobs.jobs.values(), key=lambda j: j["created_at"]):
+        if args.all or job["state"] != "done":
+            print(_format_job(job))
+    print(f"Summary: {jobs.summary()}")
@@ -24,11 +24,6 @@ if [ -d "venv" ]; then
     source venv/bin/activate
 fi
 
-# Setup v4l2loopback for live preview during recording
-echo "Setting up live preview..."
-./setup_preview.sh
-echo ""
-
 # Load .env variables if file exists
 if [ -f ".env" ]; then
     echo "Loading environment variables from .env..."
@@ -37,6 +32,20 @@ if [ -f ".env" ]; then
     set +o allexport
 fi
 
+# Transcode assets to the display's native format in the background (only changed
+# assets are rebuilt). The kiosk plays the original assets until their copies are ready.
+mkdir -p logs
+echo "Building display-native assets in the background (logs/asset_pipeline.log)..."
+nice -n 10 python asset_pipeline.py > logs/asset_pipeline.log 2>&1 &
+echo ""
+
+# Setup v4l2loopback for live preview during recording (only needed for PREVIEW_MODE=loopback)
+if [ "${PREVIEW_MODE:-pipe}" = "loopback" ]; then
+    echo "Setting up live preview..."
+    ./setup_preview.sh
+    echo ""
+fi
+
 # Run the WhatsApp Bot in background
 echo "Starting WhatsApp Bot..."
 # Ensure OPENAI_API_KEY is exported if set in config.py (or we hope it's global)
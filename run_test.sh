@@ -53,10 +53,19 @@ if [ -f ".env" ]; then
     set +o allexport
 fi
 
-# Setup v4l2loopback for live preview during recording
+# Transcode assets to the display's native format in the background (only changed
+# assets are rebuilt). The kiosk plays the original assets until their copies are ready.
+mkdir -p logs
 echo ""
-echo "--- Setting up Live Preview ---"
-./setup_preview.sh
+echo "--- Building display-native assets in the background (logs/asset_pipeline.log) ---"
+nice -n 10 python asset_pipeline.py > logs/asset_pipeline.log 2>&1 &
+
+# Setup v4l2loopback for live preview during recording (only needed for PREVIEW_MODE=loopback)
+if [ "${PREVIEW_MODE:-pipe}" = "loopback" ]; then
+    echo ""
+    echo "--- Setting up Live Preview ---"
+    ./setup_preview.sh
+fi
 
 # --- START MESSAGING SERVER ---
 echo "--- Initializing Messaging Server ---"
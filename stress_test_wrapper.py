@@ -6,6 +6,7 @@ import threading
 import sys
 import os
 from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging to stdout
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - [WRAPPER] - %(message)s')
@@ -91,11 +92,26 @@ class MockPhoneInputSystem:
         pass
 
 class MockMessagingService:
-    def send_welcome_message(self, phone_number):
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def is_ready(self, refresh=False):
+        return True
+
+    def send_welcome_message(self, phone_number, video_path=None):
+        return self.deliver(phone_number, video_path).ok
+
+    def submit(self, phone_number, video_path=None, key=None):
+        return self.executor.submit(self.deliver, phone_number, video_path, key)
+
+    def deliver(self, phone_number, video_path=None, key=None):
         logging.info(f"MOCK: Sending WhatsApp message to {phone_number}...")
         time.sleep(0.5)
         logging.info("MOCK: Message sent! (Simulated)")
-        return True
+        return SendResult(True, 200, None, False, 500)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
 
 # --- PATCHING ---
 # We must patch before test_mode is fully executed/imported if it had side effects, 
@@ -105,6 +121,7 @@ class MockMessagingService:
 import test_mode
 import phone_manager
 import messaging
+from messaging import SendResult
 
 # Patch Audio
 test_mode.AudioManager = MockAudioManager
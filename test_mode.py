@@ -33,9 +33,13 @@ if VISUAL_LOG_ENABLED:
 
 from config import *
 from hardware import HardwareManager
-from media import MediaManager
+from media import MediaManager, InterruptEvent
 from audio import AudioManager
+from mic_capture import mic
 from messaging import MessagingService
+from outbox import Outbox
+from postprocess import PostProcessQueue
+from encoder_tuner import BackgroundCalibration
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -57,6 +61,15 @@ def main():
     media = MediaManager()  # Real camera
     audio = AudioManager()  # Real audio
     messaging = MessagingService()
+    outbox = Outbox(messaging)
+    outbox.start()
+    postprocess = PostProcessQueue(outbox=outbox, assets=media.assets)
+    postprocess.start()
+    # The x264 profile is calibrated in standby once a visitor has been recorded
+    # and their post-processing encodes are done, never at boot: the first
+    # recordings use the default profile
+    calibration = BackgroundCalibration(postprocess)
+    recorded = 0
 
     logging.info("Sistema listo.")
     logging.info("\nEn este modo:")
@@ -70,7 +83,9 @@ def main():
         try:
             # 1. Wait for Start (Door, Enter, or Voice)
             logging.info("Waiting for activation (Enter on Keypad/Window, 'Feliz Navidad', or Door Sensor)...")
-            activation_event = threading.Event()
+            activation_event = InterruptEvent()
+            # Door sensor pushes the trigger directly so playback wakes up immediately
+            hardware.on_door_open(lambda: activation_event.set("door"))
             
             # Helper to check all triggers
             def check_active():
@@ -79,7 +94,7 @@ def main():
                 try:
                     if hardware.is_door_open():
                          logging.info("Door Open Detected!")
-                         activation_event.set()
+                         activation_event.set("door")
                          return True
                 except:
                     pass
@@ -87,13 +102,15 @@ def main():
                 # Check CV2 Enter
                 if media.check_for_enter():
                     logging.info("Enter key detected on Window!")
-                    activation_event.set()
+                    activation_event.set("enter")
                     return True
                 return False
 
             # Standby Loop
             logging.info("Entering Standby Mode (Video/Image Loop)...")
             audio.stop_background_music() # Ensure no music during standby
+            if recorded:
+                calibration.start()
             
             # Start Voice Listener
             def voice_listener():
@@ -106,7 +123,7 @@ def main():
             while not activation_event.is_set():
                 # 1. Play Standby Video
                 if os.path.exists(STANDBY_VIDEO_PATH):
-                     media.play_video(STANDBY_VIDEO_PATH, check_interrupt=check_active)
+                     media.play_video(STANDBY_VIDEO_PATH, check_interrupt=check_active, interrupt_event=activation_event)
                 
                 if check_active(): break
 
@@ -134,6 +151,7 @@ def main():
                 # If result == 'TIMEOUT', loop restarts -> Plays Video
             
             activation_event.set() # Ensure set in case loop exited otherwise
+            calibration.stop()  # Give the CPU back to the recording
             logging.info("Iniciando experiencia...")
 
             # --- PRE-INITIALIZATION START ---
@@ -165,15 +183,8 @@ def main():
             logging.info("STEP 2: Playing intro video...")
             logging.info("=" * 50)
             if os.path.exists(INTRO_VIDEO_PATH):
-                media.play_video(INTRO_VIDEO_PATH)
-                
-                # 2.1 Play Second Intro Video
-                logging.info("Playing second intro video...")
-                # Optimized: silently skip if missing, no delay
-                if os.path.exists(INTRO_VIDEO_2_PATH):
-                    media.play_video(INTRO_VIDEO_2_PATH)
-                else:
-                    logging.info(f"Video no encontrado (skipping): {INTRO_VIDEO_2_PATH}")
+                # 2.1 Second intro video is chained gaplessly (skipped if missing)
+                media.play_sequence([INTRO_VIDEO_PATH, INTRO_VIDEO_2_PATH])
             else:
                 logging.warning(f"Video no encontrado: {INTRO_VIDEO_PATH}")
                 logging.info("Simulando reproducción (3 segundos)...")
@@ -190,6 +201,7 @@ def main():
             
             # Start recording (blocks for 20 seconds)
             media.record_user(user_video_path)
+            recorded += 1
 
             # 4. Ask for Phone Number
             logging.info("=" * 50)
@@ -250,101 +262,13 @@ def main():
                 logging.info(f"Number captured and confirmed: {final_phone_number}")
                 audio.stop_background_music()
                 
-                # 7. Send Message & Save Metadata (in background to not block UI)
-                final_video_path = user_video_path
-                
-                if not os.path.exists(final_video_path):
-                     logging.warning(f"Expected video path {final_video_path} not found.")
-                
-                # Merge with intro video if exists
-                from config import MERGE_VIDEO_PATH, ASSETS_DIR
-                LOGO_PATH = os.path.join(ASSETS_DIR, "logo.png")
-                if os.path.exists(MERGE_VIDEO_PATH) and os.path.exists(final_video_path):
-                    logging.info(f"Merging intro video with user recording...")
-                    merged_path = user_video_path.replace(".mp4", "_merged.mp4")
-                    try:
-                        import subprocess
-                        # FFmpeg concat: scale intro to 1:1 (720x720) centered in 720x1280 frame with WHITE bars
-                        # Logo is placed centered in the bottom bar (280px tall)
-                        # [0:v] = merge video: scale to 720x720 max, pad to 720x1280 with white bars
-                        # [2:v] = logo: scale to fit in bottom bar (max 280px height, 720px width), overlay centered
-                        # [1:v] = user video: already 720x1280, pass through
-                        
-                        # Build filter based on whether logo exists
-                        if os.path.exists(LOGO_PATH):
-                            # Logo exists: add it to bottom bar
-                            # Video is padded: video at center (y=280), bottom bar starts at y=1000 (280+720=1000)
-                            # Bottom bar is 280px tall. Center logo in it.
-                            filter_complex = (
-                                '[0:v]scale=720:720:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2:white,setsar=1[v0];'
-                                '[2:v]scale=280:-1:force_original_aspect_ratio=decrease[logo];'
-                                '[v0][logo]overlay=(W-w)/2:1000+(280-h)/2[v0_logo];'
-                                '[v0_logo][0:a][1:v][1:a]concat=n=2:v=1:a=1[outv][outa]'
-                            )
-                            merge_cmd = [
-                                'ffmpeg', '-y',
-                                '-i', MERGE_VIDEO_PATH,
-                                '-i', final_video_path,
-                                '-i', LOGO_PATH,
-                                '-filter_complex', filter_complex,
-                                '-map', '[outv]', '-map', '[outa]',
-                                '-c:v', 'libx264', '-preset', 'fast', '-crf', '23',
-                                '-c:a', 'aac', '-b:a', '128k',
-                                '-movflags', '+faststart',
-                                merged_path
-                            ]
-                        else:
-                            # No logo: just white bars
-                            merge_cmd = [
-                                'ffmpeg', '-y',
-                                '-i', MERGE_VIDEO_PATH,
-                                '-i', final_video_path,
-                                '-filter_complex',
-                                '[0:v]scale=720:720:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2:white,setsar=1[v0];'
-                                '[v0][0:a][1:v][1:a]concat=n=2:v=1:a=1[outv][outa]',
-                                '-map', '[outv]', '-map', '[outa]',
-                                '-c:v', 'libx264', '-preset', 'fast', '-crf', '23',
-                                '-c:a', 'aac', '-b:a', '128k',
-                                '-movflags', '+faststart',
-                                merged_path
-                            ]
-                        result = subprocess.run(merge_cmd, capture_output=True, timeout=120)
-                        if result.returncode == 0 and os.path.exists(merged_path):
-                            logging.info(f"Video merge successful: {merged_path}")
-                            final_video_path = merged_path
-                        else:
-                            logging.warning(f"Video merge failed, using original. Error: {result.stderr.decode()[:200]}")
-                    except Exception as e:
-                        logging.warning(f"Video merge error: {e}, using original video")
-                else:
-                    if not os.path.exists(MERGE_VIDEO_PATH):
-                        logging.info(f"No merge video found at {MERGE_VIDEO_PATH}, sending original")
-                
-                logging.info(f"Using video for sending: {final_video_path}")
-                
-                # Send message in background thread to avoid blocking
-                def send_in_background():
-                    try:
-                        messaging.send_welcome_message(final_phone_number, final_video_path)
-                    except Exception as e:
-                        logging.error(f"Background send failed: {e}")
-                
-                send_thread = threading.Thread(target=send_in_background, daemon=True)
-                send_thread.start()
-                logging.info("Message sending started in background...")
-                
-                # Save Metadata JSON (fast, won't block)
-                metadata = {
-                    "video_path": final_video_path,
-                    "phone_number": final_phone_number,
+                # 7. Merge, send and archive run on the post-processing workers
+                if not os.path.exists(user_video_path):
+                     logging.warning(f"Expected video path {user_video_path} not found.")
+                postprocess.enqueue(final_phone_number, user_video_path, metadata={
                     "timestamp": timestamp,
-                    "full_transcript": "Vosk Dictation" 
-                }
-                json_path = os.path.join(RECORDINGS_DIR, f"user_video_{timestamp}.json")
-                import json
-                with open(json_path, 'w') as f:
-                    json.dump(metadata, f, indent=4)
-                logging.info(f"Metadata saved to {json_path}") 
+                    "full_transcript": "Vosk Dictation"
+                })
 
                 # 8. Goodbye Video - IMMEDIATE, don't wait for message
                 logging.info("STEP 8: Playing goodbye video...")
@@ -387,8 +311,16 @@ def main():
             logging.info("Esperando 5 segundos antes de reintentar...")
             time.sleep(5)
 
+    if 'calibration' in locals():
+        calibration.stop()
+    if 'postprocess' in locals():
+        # Unfinished jobs stay in the journal and resume on the next start
+        postprocess.stop(timeout=2)
+    if 'outbox' in locals():
+        outbox.stop(timeout=2)
     if 'media' in locals():
         media.cleanup()
+    mic.stop()
 
 if __name__ == "__main__":
     main()
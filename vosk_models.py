@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Process-wide Vosk model registry.
+
+Each model directory is loaded once per process (at warm-up or on first use)
+and shared by every listener. Recognizers are pooled per (model, sample rate,
+grammar): recognizer() hands out an idle one, or builds it if none is idle,
+and calls Reset() when it is given back, so the next stage starts from a clean
+decoder without rebuilding it.
+
+Usage:
+    python vosk_models.py              # Load the default model and print load time, memory and pool stats
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from config import VOSK_MODEL_PATH, SAMPLE_RATE
+
+try:
+    from vosk import Model, KaldiRecognizer, SetLogLevel
+    VOSK_AVAILABLE = True
+except ImportError:
+    VOSK_AVAILABLE = False
+
+POOL_MAX_IDLE = 2   # Idle recognizers kept per (model, rate, grammar)
+
+
+def _rss_mb():
+    """Resident memory of this process in MB, None where /proc is not available."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class VoskModelRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.models = {}       # path -> Model
+        self.model_stats = {}  # path -> {"load_ms", "rss_mb"}
+        self.idle = {}         # (path, rate, grammar) -> [KaldiRecognizer]
+        self.created = 0
+        self.reused = 0
+        self.in_use = 0
+
+    def get(self, path=VOSK_MODEL_PATH):
+        """The shared Model for 'path', loaded on first call. None if Vosk or the model is missing."""
+        with self.lock:
+            if path in self.models:
+                return self.models[path]
+            if not VOSK_AVAILABLE:
+                logging.warning("Vosk not installed, voice recognition disabled.")
+                self.models[path] = None
+                return None
+            if not os.path.exists(path):
+                logging.error(f"Vosk model not found at {path}")
+                return None
+            # Loading under the lock: concurrent first users wait instead of loading twice
+            logging.info(f"Loading Vosk model from {path}...")
+            rss_before = _rss_mb()
+            start = time.time()
+            try:
+                model = Model(path)
+            except Exception as e:
+                logging.error(f"Failed to load Vosk model: {e}")
+                return None
+            load_ms = int((time.time() - start) * 1000)
+            rss_after = _rss_mb()
+            rss_mb = round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None
+            self.models[path] = model
+            self.model_stats[path] = {"load_ms": load_ms, "rss_mb": rss_mb}
+            logging.info(f"Vosk model {os.path.basename(path)} loaded in {load_ms} ms (+{rss_mb} MB resident)")
+            return model
+
+    def warm_up(self, path=VOSK_MODEL_PATH, rate=SAMPLE_RATE, grammar=None):
+        """Loads the model and pre-builds one recognizer so the first listener starts at once."""
+        model = self.get(path)
+        if model is not None:
+            with self.recognizer(rate, path=path, grammar=grammar):
+                pass
+        return model
+
+    @contextmanager
+    def recognizer(self, rate=SAMPLE_RATE, path=VOSK_MODEL_PATH, grammar=None):
+        """
+        Pooled KaldiRecognizer for the model at 'path'. 'grammar' is an optional
+        list of phrases (see KaldiRecognizer's grammar argument). Yields None if
+        the model is not available.
+        """
+        model = self.get(path)
+        if model is None:
+            yield None
+            return
+        grammar_json = json.dumps(grammar, ensure_ascii=False) if grammar else None
+        key = (path, rate, grammar_json)
+        with self.lock:
+            pool = self.idle.setdefault(key, [])
+            rec = pool.pop() if pool else None
+            if rec is not None:
+                self.reused += 1
+            self.in_use += 1
+        try:
+            if rec is None:
+                rec = KaldiRecognizer(model, rate, grammar_json) if grammar_json else KaldiRecognizer(model, rate)
+                with self.lock:
+                    self.created += 1
+            yield rec
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self._release(key, rec)
+
+    def _release(self, key, rec):
+        if rec is None:
+            return
+        try:
+            rec.Reset()
+        except Exception as e:
+            # Older Vosk versions have no Reset(): drop it, the next user builds a fresh one
+            logging.debug(f"Recognizer not reusable: {e}")
+            return
+        with self.lock:
+            pool = self.idle.setdefault(key, [])
+            if len(pool) < POOL_MAX_IDLE:
+                pool.append(rec)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "models": {os.path.basename(path): dict(stats) for path, stats in self.model_stats.items()},
+                "rss_mb": _rss_mb(),
+                "recognizers_created": self.created,
+                "recognizers_reused": self.reused,
+                "in_use": self.in_use,
+                "idle": sum(len(pool) for pool in self.idle.values()),
+            }
+
+
+vosk_models = VoskModelRegistry()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if VOSK_AVAILABLE:
+        SetLogLevel(-1)
+    vosk_models.warm_up()
+    for _ in range(3):
+        with vosk_models.recognizer() as rec:
+            pass
+    print(json.dumps(vosk_models.stats(), indent=4))